@@ -0,0 +1,405 @@
+"""
+離線批次匯入：不經 HTTP API / gateway，直接用 run_job 的同一套邏輯處理大量歷史檔案
+
+    python -m app.bulk_ingest --dir /archive/contracts --workers 8
+    python -m app.bulk_ingest --manifest files.txt --embed-batch 512
+    python -m app.bulk_ingest --dir /archive --retry-failed      # 中斷後重跑：已完成的跳過
+
+每份文件分三段：
+1. process pool：run_job(stop_after="dedup") → 路由 / 抽取（OCR / VLM）/ chunk / 去重，結果落地成 checkpoint
+2. 主 process：把多份文件的 chunk 湊成一批 embed（BULK_EMBED_BATCH），一次 upsert 多份文件的 point
+3. process pool：run_job 接著跑 → Neo4j / lineage（從 checkpoint 接續，不會重做前面的階段）
+
+進度記在 SQLite ledger（BULK_LEDGER_PATH）：done 的文件下次跳過；中斷時做到一半的文件靠 checkpoint 接著跑。
+manifest：每行一個路徑，或 JSON {"path": ..., "route_hint": "ocr"}；相對路徑以 manifest 所在目錄為準。
+
+注意：同一批同時處理的文件之間，跨文件去重要等前一份寫入後才看得到（每份文件內的去重不受影響）。
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.services.config import (
+    BULK_WORKERS,
+    BULK_EMBED_BATCH,
+    BULK_UPSERT_BATCH,
+    BULK_LEDGER_PATH,
+    CHECKPOINT_ENABLED,
+)
+
+EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    path TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    size INTEGER,
+    status TEXT NOT NULL,          -- pending / extracted / done / failed
+    pages INTEGER,
+    chunks INTEGER,
+    points INTEGER,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_docs_status ON docs(status);
+"""
+
+
+# =========================
+# ledger
+# =========================
+class Ledger:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def get(self, path: str) -> Optional[sqlite3.Row]:
+        return self.conn.execute("SELECT * FROM docs WHERE path = ?", (path,)).fetchone()
+
+    def start(self, path: str, size: int) -> str:
+        """回傳這份文件的 job_id（重跑時沿用，checkpoint 才接得上）"""
+        row = self.get(path)
+        job_id = row["job_id"] if row is not None else uuid.uuid4().hex
+        with self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO docs (path, job_id, size, status, updated_at) VALUES (?, ?, ?, 'pending', ?)
+                ON CONFLICT(path) DO UPDATE SET size = excluded.size, status = 'pending', error = NULL,
+                    updated_at = excluded.updated_at
+                """,
+                (path, job_id, size, time.time()),
+            )
+        return job_id
+
+    def should_skip(self, path: str, retry_failed: bool = False, force: bool = False) -> bool:
+        """done 的跳過；failed 的要 retry_failed 才重跑；force 全部重跑；pending / extracted（中斷）一律接著跑"""
+        row = self.get(path)
+        if row is None or force:
+            return False
+        return row["status"] == "done" or (row["status"] == "failed" and not retry_failed)
+
+    def update(self, path: str, status: str, **fields: Any) -> None:
+        cols = ["status = ?", "updated_at = ?"] + [f"{k} = ?" for k in fields]
+        with self.conn:
+            self.conn.execute(
+                f"UPDATE docs SET {', '.join(cols)} WHERE path = ?",
+                (status, time.time(), *fields.values(), path),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        return {r["status"]: r["n"] for r in self.conn.execute("SELECT status, COUNT(*) AS n FROM docs GROUP BY status")}
+
+
+# =========================
+# inputs
+# =========================
+def iter_inputs(directory: Optional[str], manifest: Optional[str]) -> Iterator[Tuple[str, Optional[str]]]:
+    """(絕對路徑, route_hint)"""
+    if directory:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(EXTENSIONS):
+                    yield os.path.abspath(os.path.join(root, name)), None
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("{"):
+                    item = json.loads(line)
+                    path, hint = item["path"], item.get("route_hint")
+                else:
+                    path, hint = line, None
+                yield os.path.abspath(os.path.join(base, path)), hint
+
+
+# =========================
+# process pool 端（每個 process 各自 import / 建 client）
+# =========================
+def _extract_one(job_id: str, path: str, route_hint: Optional[str]) -> Dict[str, Any]:
+    from app.services import checkpoints
+    from app.services.jobs import create_local_job, run_job
+
+    job = create_local_job(path, job_id, route_hint=route_hint)
+    run_job(job_id, stop_after="dedup")
+    extract = checkpoints.load(job_id, "extract") or {}
+    return {
+        "job_id": job_id,
+        "status": job.get("status"),
+        "error": job.get("error"),
+        "pages": len(extract.get("pages_meta") or []) or 1,
+        "chunks": job.get("chunks") or 0,
+        "points": job.get("qdrant_points"),
+    }
+
+
+def _finish_one(job_id: str, path: str, route_hint: Optional[str]) -> Dict[str, Any]:
+    from app.services.jobs import create_local_job, run_job
+
+    job = create_local_job(path, job_id, route_hint=route_hint)
+    run_job(job_id)
+    return {"job_id": job_id, "status": job.get("status"), "error": job.get("error"),
+            "chunks": job.get("chunks"), "points": job.get("qdrant_points")}
+
+
+# =========================
+# 主 process：跨文件 embedding + upsert
+# =========================
+class EmbedBuffer:
+    """
+    收集多份文件的待 embed chunk，湊滿 batch 才送；一份文件的 chunk 全部寫完才算 ready
+    """
+
+    def __init__(self, embed_batch: int, upsert_batch: int):
+        self.embed_batch = embed_batch
+        self.upsert_batch = upsert_batch
+        self.items: List[Dict[str, Any]] = []
+        self.docs: Dict[str, Dict[str, Any]] = {}  # job_id → {path, remaining, written}
+        self.stats = {"embed_calls": 0, "embed_sec": 0.0, "upsert_sec": 0.0, "embedded_chunks": 0}
+
+    def add(self, job_id: str, path: str) -> List[str]:
+        """載入 checkpoint 把文件的非重複 chunk 排進 buffer；回傳已經可以收尾的 job（沒東西要 embed 的）"""
+        from app.services import checkpoints
+
+        if checkpoints.load(job_id, "qdrant_upsert") is not None:
+            return [job_id]
+        chunking = checkpoints.load(job_id, "chunking") or {}
+        dedup = checkpoints.load(job_id, "dedup") or {}
+        route = (checkpoints.load(job_id, "extract") or {}).get("route")
+        chunks = chunking.get("chunks") or []
+        per_chunk_meta = chunking.get("per_chunk_meta") or []
+        dups = {int(k) for k in (dedup.get("dups") or {})}
+        unique_idx = [i for i in range(len(chunks)) if i not in dups]
+
+        doc_meta = {"job_id": job_id, "filename": os.path.basename(path), "route": route}
+        self.docs[job_id] = {
+            "path": path,
+            "remaining": len(unique_idx),
+            "written": {},
+        }
+        for i in unique_idx:
+            self.items.append({"job_id": job_id, "idx": i, "text": chunks[i], "meta": {**doc_meta, **per_chunk_meta[i]}})
+        if not unique_idx:
+            self._complete(job_id)
+            return [job_id]
+        return []
+
+    def drop(self, job_id: str) -> None:
+        self.items = [it for it in self.items if it["job_id"] != job_id]
+        self.docs.pop(job_id, None)
+
+    def flush(self, force: bool = False) -> Tuple[List[str], Dict[str, str]]:
+        """
+        送出滿的 batch（force=True 連不滿的也送）
+        回傳 (寫完的 job_id, {失敗的 job_id: 錯誤})
+        """
+        ready: List[str] = []
+        failed: Dict[str, str] = {}
+        while self.items and (force or len(self.items) >= self.embed_batch):
+            batch, self.items = self.items[:self.embed_batch], self.items[self.embed_batch:]
+            try:
+                self._write(batch)
+            except Exception as e:
+                # 這批牽涉到的文件整份標失敗（其他批次已寫入的 point 下次重跑會以相同 id 覆寫）
+                for jid in {it["job_id"] for it in batch}:
+                    failed[jid] = f"{type(e).__name__}: {e}"
+                    self.drop(jid)
+                continue
+            for it in batch:
+                doc = self.docs.get(it["job_id"])
+                if doc is None:
+                    continue
+                doc["remaining"] -= 1
+                if doc["remaining"] == 0:
+                    self._complete(it["job_id"])
+                    ready.append(it["job_id"])
+        return ready, failed
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        from app.services.embeddings import embed_texts
+        from app.services.vstore_qdrant import upsert_chunks
+
+        t0 = time.perf_counter()
+        vectors = embed_texts([it["text"] for it in batch])
+        self.stats["embed_sec"] += time.perf_counter() - t0
+        self.stats["embed_calls"] += 1
+        self.stats["embedded_chunks"] += len(batch)
+
+        t0 = time.perf_counter()
+        pids = upsert_chunks(
+            chunks=[it["text"] for it in batch],
+            vectors=vectors,
+            meta={},
+            per_chunk_meta=[it["meta"] for it in batch],
+            indices=[it["idx"] for it in batch],
+            job_ids=[it["job_id"] for it in batch],
+            batch_size=self.upsert_batch,
+        )
+        self.stats["upsert_sec"] += time.perf_counter() - t0
+        for it, pid in zip(batch, pids):
+            doc = self.docs.get(it["job_id"])
+            if doc is not None:
+                doc["written"][it["idx"]] = pid
+
+    def _complete(self, job_id: str) -> None:
+        """跟 run_job 的 upsert 階段收尾一樣：寫 qdrant_upsert checkpoint（指紋由 _finish_one 的 run_job 完成時登記）"""
+        from app.services import checkpoints
+
+        doc = self.docs.pop(job_id)
+        written = doc["written"]
+        checkpoints.save(job_id, "qdrant_upsert", {"point_ids": [written[i] for i in sorted(written)]})
+
+
+# =========================
+# main
+# =========================
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dir", default=None, help="遞迴掃描的資料夾")
+    ap.add_argument("--manifest", default=None, help="檔案清單（每行一個路徑或 JSON）")
+    ap.add_argument("--workers", type=int, default=BULK_WORKERS, help="抽取用的 process 數")
+    ap.add_argument("--embed-batch", type=int, default=BULK_EMBED_BATCH, help="跨文件 embedding 批次大小")
+    ap.add_argument("--upsert-batch", type=int, default=BULK_UPSERT_BATCH, help="Qdrant upsert 批次大小")
+    ap.add_argument("--ledger", default=BULK_LEDGER_PATH, help="進度 ledger（SQLite）")
+    ap.add_argument("--retry-failed", action="store_true", help="ledger 裡 failed 的文件也重跑")
+    ap.add_argument("--force", action="store_true", help="done 的文件也重跑")
+    ap.add_argument("--limit", type=int, default=0, help="最多處理幾份（0 = 全部）")
+    args = ap.parse_args()
+
+    if not (args.dir or args.manifest):
+        ap.error("--dir 或 --manifest 至少要給一個")
+    if not CHECKPOINT_ENABLED:
+        raise SystemExit("[bulk] 需要 CHECKPOINT_ENABLED=true（抽取結果靠 checkpoint 交給主 process）")
+
+    from app.services.vstore_qdrant import ensure_collection
+
+    ensure_collection()
+    ledger = Ledger(args.ledger)
+    buffer = EmbedBuffer(args.embed_batch, args.upsert_batch)
+
+    todo: List[Tuple[str, Optional[str]]] = []
+    skipped = 0
+    for path, hint in iter_inputs(args.dir, args.manifest):
+        if ledger.should_skip(path, retry_failed=args.retry_failed, force=args.force):
+            skipped += 1
+            continue
+        todo.append((path, hint))
+        if args.limit and len(todo) >= args.limit:
+            break
+    print(f"[bulk] {len(todo)} to process, {skipped} skipped (ledger {args.ledger}), workers={args.workers}")
+
+    t0 = time.time()
+    totals = {"done": 0, "failed": 0, "pages": 0, "chunks": 0, "points": 0}
+    hints: Dict[str, Optional[str]] = {}
+    paths: Dict[str, str] = {}
+    pending = iter(todo)
+    futures: Dict[Future, Tuple[str, str]] = {}  # future → (phase, job_id)
+    max_inflight = max(1, args.workers) * 2
+    last_report = 0
+
+    def _fail(job_id: str, error: str) -> None:
+        ledger.update(paths[job_id], "failed", error=error)
+        totals["failed"] += 1
+        print(f"[bulk] failed {paths[job_id]}: {error}")
+
+    def _submit_finish(pool: ProcessPoolExecutor, job_id: str) -> None:
+        futures[pool.submit(_finish_one, job_id, paths[job_id], hints[job_id])] = ("finish", job_id)
+
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), mp_context=ctx) as pool:
+        exhausted = False
+        while True:
+            # 抽取階段維持固定數量在跑，收尾階段不限
+            while not exhausted and sum(1 for p, _ in futures.values() if p == "extract") < max_inflight:
+                item = next(pending, None)
+                if item is None:
+                    exhausted = True
+                    break
+                path, hint = item
+                size = os.path.getsize(path) if os.path.exists(path) else None
+                job_id = ledger.start(path, size)
+                hints[job_id], paths[job_id] = hint, path
+                futures[pool.submit(_extract_one, job_id, path, hint)] = ("extract", job_id)
+
+            if not futures:
+                ready, failed = buffer.flush(force=True)
+                for jid, err in failed.items():
+                    _fail(jid, err)
+                for jid in ready:
+                    _submit_finish(pool, jid)
+                if not futures:
+                    break
+                continue
+
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for fut in done:
+                phase, job_id = futures.pop(fut)
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    _fail(job_id, f"{type(e).__name__}: {e}")
+                    continue
+
+                if phase == "extract":
+                    if res["status"] == "finished":
+                        # 沒有 chunk 的文件 run_job 直接結束了
+                        ledger.update(paths[job_id], "done", pages=res["pages"], chunks=0, points=0)
+                        totals["done"] += 1
+                        totals["pages"] += res["pages"]
+                    elif res["status"] != "queued":
+                        _fail(job_id, res["error"] or res["status"])
+                    else:
+                        ledger.update(paths[job_id], "extracted", pages=res["pages"], chunks=res["chunks"])
+                        totals["pages"] += res["pages"]
+                        for jid in buffer.add(job_id, paths[job_id]):
+                            _submit_finish(pool, jid)
+                else:
+                    if res["status"] == "finished":
+                        ledger.update(paths[job_id], "done", chunks=res["chunks"], points=res["points"])
+                        totals["done"] += 1
+                        totals["chunks"] += res["chunks"] or 0
+                        totals["points"] += res["points"] or 0
+                    else:
+                        _fail(job_id, res["error"] or res["status"])
+
+            # 抽取都送完了就把不滿一批的也送出，避免最後幾份卡在 buffer
+            no_extract_left = exhausted and not any(p == "extract" for p, _ in futures.values())
+            ready, failed = buffer.flush(force=no_extract_left)
+            for jid, err in failed.items():
+                _fail(jid, err)
+            for jid in ready:
+                _submit_finish(pool, jid)
+
+            n = totals["done"] + totals["failed"]
+            if n // 50 > last_report // 50:
+                last_report = n
+                print(f"[bulk] {n}/{len(todo)} docs, {n / (time.time() - t0) * 60:.1f} docs/min")
+
+    elapsed = time.time() - t0
+    st = buffer.stats
+    print()
+    print(f"[bulk] finished in {elapsed:.1f}s")
+    print(f"  docs     done={totals['done']} failed={totals['failed']} skipped={skipped}")
+    print(f"  pages    {totals['pages']}  ({totals['pages'] / max(elapsed, 1e-9):.2f} pages/s)")
+    print(f"  chunks   {totals['chunks']}  points={totals['points']}")
+    print(f"  rate     {totals['done'] / max(elapsed, 1e-9) * 3600:.0f} docs/hour")
+    print(f"  embed    {st['embed_calls']} calls, {st['embedded_chunks']} chunks, {st['embed_sec']:.1f}s"
+          f"  (avg {st['embedded_chunks'] / max(st['embed_calls'], 1):.0f}/call)")
+    print(f"  upsert   {st['upsert_sec']:.1f}s")
+    print(f"  ledger   {ledger.counts()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,46 @@
+import time
+
+_T0 = time.perf_counter()
+
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from app.routes import router
+from app.services.backends import warmup_in_background, check_ready, shutdown_all
+from app.services.retention import start_sweeper, stop_sweeper
+
+# 啟動耗時（import 階段 / 開始服務的時間點），/ready 會一併回報
+STARTUP: dict = {"import_sec": None, "serving_at": None}
 
-app = FastAPI(title="IDP Pipeline API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 後端預熱放背景：/health 立刻可用，後端掛掉也不會讓 process 起不來
+    warmup_in_background()
+    start_sweeper()
+    STARTUP["serving_at"] = time.time()
+    yield
+    stop_sweeper()
+    shutdown_all()
+
+app = FastAPI(title="IDP Pipeline API", version="1.0.0", lifespan=lifespan)
 
 @app.get("/health")
 def health():
+    # liveness：process 活著就好，不碰任何後端
     return {"ok": True}
 
-app.include_router(router, prefix="/v1")
\ No newline at end of file
+@app.get("/ready")
+def ready():
+    # readiness：Qdrant / Neo4j 都就緒才回 200，讓 nginx / orchestrator 決定是否導流量
+    backends = check_ready()
+    ok = all(b["ready"] for b in backends.values())
+    return JSONResponse(
+        status_code=200 if ok else 503,
+        content={"ready": ok, "backends": backends, "startup": STARTUP},
+    )
+
+app.include_router(router, prefix="/v1")
+
+STARTUP["import_sec"] = round(time.perf_counter() - _T0, 3)
+print(f"[startup] app.main imported in {STARTUP['import_sec']}s")
@@ -1,9 +1,21 @@
-from fastapi import APIRouter, UploadFile, File, BackgroundTasks, Query
-from app.schemas import JobCreateResponse, JobStatusResponse, ProcessResult, SearchResponse
-from app.services.jobs import create_job, run_job, get_job
-from app.services.vstore_qdrant import qdrant_search
-from app.services.graph_neo4j import graph_find_chunks_by_keyword, graph_fallback_top_chunks
-from app.services.llm import call_llm  # ← 用你現有的 LLM wrapper
+import base64
+import hashlib
+import json
+import os
+from fastapi import APIRouter, UploadFile, File, BackgroundTasks, Query, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from app.schemas import (
+    JobCreateResponse, JobStatusResponse, ProcessResult, SearchResponse,
+    SearchBatchRequest, SearchBatchResponse, SearchFilter, RouteName,
+)
+from app.services.jobs import create_job, run_job, get_job, cancel_job, submit_job, retry_job
+from app.services.job_queue import list_workers, pending_count
+from app.services.config import WORKER_STALE_SEC
+from app.services.vstore_qdrant import qdrant_search, qdrant_search_batch
+from app.services.context_builder import build_context
+from app.services.config import GRAPHRAG_TOKEN_BUDGET, GRAPHRAG_NEIGHBOR_HOPS, GRAPHRAG_VECTOR_LIMIT
+from app.services.llm import call_llm, call_llm_stream, LLM_MODEL  # ← 用你現有的 LLM wrapper
+from app.services import answer_cache, metrics, lineage_index, page_router, results
 
 router = APIRouter()
 
@@ -12,9 +24,12 @@ async def create_job_api(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     route_hint: str | None = Query(default=None, description="Optional: docling/ocr/vlm"),
+    deadline_sec: float | None = Query(default=None, gt=0, description="Optional: 單一 job 最長執行秒數"),
+    latency_mode: bool | None = Query(default=None, description="Optional: 邊界頁 OCR/VLM 同時跑（較快、較貴）"),
 ):
-    job_id = await create_job(file=file, route_hint=route_hint)
-    background_tasks.add_task(run_job, job_id)
+    job_id = await create_job(file=file, route_hint=route_hint, deadline_sec=deadline_sec, latency_mode=latency_mode)
+    if not submit_job(job_id):
+        background_tasks.add_task(run_job, job_id)
     return JobCreateResponse(job_id=job_id)
 
 @router.get("/jobs/{job_id}", response_model=JobStatusResponse)
@@ -22,6 +37,24 @@ def get_job_api(job_id: str):
     job = get_job(job_id)
     return JobStatusResponse(**job)
 
+@router.delete("/jobs/{job_id}", response_model=JobStatusResponse)
+def cancel_job_api(job_id: str):
+    job = cancel_job(job_id)
+    return JobStatusResponse(**job)
+
+@router.post("/jobs/{job_id}/retry", response_model=JobStatusResponse)
+def retry_job_api(job_id: str, background_tasks: BackgroundTasks):
+    # 失敗的 job 從最後完成的階段（checkpoint）接著跑
+    try:
+        job = retry_job(job_id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="job_id not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not submit_job(job_id):
+        background_tasks.add_task(run_job, job_id)
+    return JobStatusResponse(**job)
+
 @router.get("/jobs/{job_id}/result", response_model=ProcessResult)
 def get_result_api(job_id: str):
     job = get_job(job_id)
@@ -43,10 +76,176 @@ def get_result_api(job_id: str):
         lineage_path=job["lineage_path"],
     )
 
+def _require_result(job_id: str) -> None:
+    """lineage 還在就能查（job 紀錄可能已被 retention 回收）；否則依 job 狀態回 404 / 409"""
+    if results.lineage_file(job_id) is not None:
+        return
+    job = get_job(job_id)
+    if job.get("error") == "job_id not found":
+        raise HTTPException(status_code=404, detail="job_id not found")
+    raise HTTPException(status_code=409, detail=f"result not available (status: {job['status']})")
+
+
+def _conditional_json(request: Request, tag: str | None, build) -> Response:
+    """If-None-Match 命中回 304（不讀 lineage）；否則 JSON 依 Accept-Encoding 壓縮（br / gzip）"""
+    if tag is None:
+        raise HTTPException(status_code=404, detail="result not found")
+    headers = {"ETag": tag, "Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    if results.etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    body = json.dumps(build(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    body, encoding = results.compress(body, results.pick_encoding(request.headers.get("accept-encoding")))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _fields(fields: str | None, allowed) -> list[str] | None:
+    try:
+        return results.parse_fields(fields, allowed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/jobs/{job_id}/result/chunks")
+def result_chunks_api(
+    request: Request,
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: str | None = Query(None, description="逗號分隔，例如 chunk_id,page,text；預設不含 text"),
+):
+    _require_result(job_id)
+    want = _fields(fields, results.CHUNK_FIELDS)
+    tag = results.etag(job_id, "chunks", offset, limit, want)
+    return _conditional_json(request, tag, lambda: results.chunks_page(job_id, offset, limit, want))
+
+@router.get("/jobs/{job_id}/result/pages")
+def result_pages_api(
+    request: Request,
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    fields: str | None = Query(None, description="逗號分隔，例如 page,used_route,text；預設不含 text"),
+):
+    _require_result(job_id)
+    want = _fields(fields, results.PAGE_FIELDS)
+    tag = results.etag(job_id, "pages", offset, limit, want)
+    return _conditional_json(request, tag, lambda: results.pages_page(job_id, offset, limit, want))
+
+@router.get("/jobs/{job_id}/result/markdown")
+def result_markdown_api(request: Request, job_id: str):
+    # 完整抽取結果直接從磁碟串流：支援 Range / If-Range（續傳、只抓一段），ETag 相同回 304
+    path = results.markdown_path(job_id)
+    if not os.path.exists(path):
+        _require_result(job_id)
+        raise HTTPException(status_code=404, detail="markdown not stored for this job")
+    resp = FileResponse(path, media_type="text/markdown; charset=utf-8", stat_result=os.stat(path))
+    if results.etag_matches(request.headers.get("if-none-match"), resp.headers["etag"]):
+        return Response(status_code=304, headers={"ETag": resp.headers["etag"]})
+    return resp
+
+@router.get("/workers")
+def workers_api():
+    return {"pending": pending_count(), "workers": list_workers(WORKER_STALE_SEC)}
+
+@router.get("/metrics")
+def metrics_api():
+    return metrics.snapshot()
+
+@router.get("/lineage/points/{point_id}")
+def lineage_point_api(point_id: str):
+    src = lineage_index.point_source(point_id)
+    if src is None:
+        raise HTTPException(status_code=404, detail="point not found in lineage index")
+    return src
+
+@router.get("/lineage/jobs")
+def lineage_jobs_api(
+    route: RouteName | None = Query(None, description="搭配 min_ratio：此路徑處理的頁數比例 > min_ratio"),
+    min_ratio: float = Query(0.0, ge=0, le=1),
+    filename: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    return {"jobs": lineage_index.find_jobs(route=route, min_ratio=min_ratio, filename=filename, limit=limit, offset=offset)}
+
+@router.get("/lineage/jobs/{job_id}/pages")
+def lineage_job_pages_api(job_id: str):
+    return {"job_id": job_id, "pages": lineage_index.job_pages(job_id)}
+
+@router.get("/lineage/stats")
+def lineage_stats_api():
+    return lineage_index.route_stats()
+
+@router.get("/routing/stats")
+def routing_stats_api():
+    return {"buckets": page_router.stats()}
+
 @router.get("/search", response_model=SearchResponse)
-def search_api(q: str = Query(..., min_length=1), limit: int = Query(5, ge=1, le=20)):
-    hits = qdrant_search(q, limit=limit)
-    return SearchResponse(query=q, hits=hits)
+def search_api(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(5, ge=1, le=20),
+    job_id: str | None = None,
+    filename: str | None = None,
+    page: int | None = Query(None, ge=1),
+    used_route: RouteName | None = None,
+    ocr_score_min: float | None = Query(None, ge=0, le=1),
+    ocr_score_max: float | None = Query(None, ge=0, le=1),
+    score_threshold: float | None = Query(None, description="只回傳分數 >= 此值的結果"),
+    cursor: str | None = Query(None, description="上一頁回傳的 next_cursor"),
+):
+    filters = SearchFilter(
+        job_id=job_id,
+        filename=filename,
+        page=page,
+        used_route=used_route,
+        ocr_score_min=ocr_score_min,
+        ocr_score_max=ocr_score_max,
+    ).model_dump(exclude_none=True)
+
+    # cursor 綁定 query + filter + threshold，避免拿 A 查詢的 cursor 去翻 B 查詢
+    scope = hashlib.sha1(
+        json.dumps([q, filters, score_threshold], sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()[:16]
+    offset = _decode_cursor(cursor, scope) if cursor else 0
+
+    hits = qdrant_search(q, limit=limit, filters=filters, offset=offset, score_threshold=score_threshold)
+    next_cursor = _encode_cursor(offset + len(hits), scope) if len(hits) == limit else None
+    return SearchResponse(query=q, hits=hits, next_cursor=next_cursor)
+
+
+def _encode_cursor(offset: int, scope: str) -> str:
+    raw = json.dumps({"o": offset, "s": scope}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, scope: str) -> int:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        offset = int(data["o"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    if data.get("s") != scope or offset < 0:
+        raise HTTPException(status_code=400, detail="cursor does not match this query")
+    return offset
+
+@router.post("/search/batch", response_model=SearchBatchResponse)
+def search_batch_api(req: SearchBatchRequest):
+    queries = [
+        {
+            "q": item.q,
+            "limit": item.limit,
+            "filter": item.filter.model_dump(exclude_none=True) if item.filter else None,
+            "score_threshold": item.score_threshold,
+        }
+        for item in req.queries
+    ]
+    hits_per_query = qdrant_search_batch(queries)
+    return SearchBatchResponse(
+        results=[SearchResponse(query=item.q, hits=hits) for item, hits in zip(req.queries, hits_per_query)]
+    )
 
 
 @router.get("/graphrag")
@@ -54,17 +253,22 @@ def graphrag(
     keyword: str = Query(...),
     limit: int = 5,
     fallback: int = 5,
+    stream: bool = Query(False, description="true → text/event-stream 逐 token 回傳"),
+    vector_limit: int = Query(GRAPHRAG_VECTOR_LIMIT, ge=0, le=50),
+    hops: int = Query(GRAPHRAG_NEIGHBOR_HOPS, ge=0, le=3, description="沿 NEXT 邊擴展的步數"),
+    budget: int = Query(GRAPHRAG_TOKEN_BUDGET, ge=100, le=32000, description="context token 預算"),
 ):
-    hits = graph_find_chunks_by_keyword(keyword, limit=limit)
-
-    used_fallback = False
-    if not hits:
-        used_fallback = True
-        hits = graph_fallback_top_chunks(limit=fallback)
-
-    context = "\n\n".join(
-        [f"[{h['filename']}#chunk{h['chunk_id']}]\n{h['text']}" for h in hits]
+    ctx = build_context(
+        keyword,
+        graph_limit=limit,
+        vector_limit=vector_limit,
+        fallback_limit=fallback,
+        hops=hops,
+        token_budget=budget,
     )
+    hits = ctx["hits"]
+    used_fallback = ctx["used_fallback"]
+    context = ctx["context"]
 
     prompt = f"""你是一個文件助理。
 根據以下內容回答問題；若內容不足請說明。
@@ -75,11 +279,63 @@ def graphrag(
 {context}
 """
 
-    answer = call_llm(prompt)
+    key = answer_cache.cache_key(keyword, hits, LLM_MODEL)
+    fingerprint = answer_cache.hits_fingerprint(hits)
+    cached_answer = answer_cache.get_answer(key, fingerprint)
+
+    if stream:
+        return StreamingResponse(
+            _graphrag_events(keyword, used_fallback, hits, prompt, key, fingerprint, cached_answer),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    if cached_answer is not None:
+        answer = cached_answer
+    else:
+        answer = call_llm(prompt)
+        answer_cache.put_answer(key, fingerprint, answer)
 
     return {
         "keyword": keyword,
         "used_fallback": used_fallback,
+        "cached": cached_answer is not None,
+        "context_tokens": ctx["context_tokens"],
         "hits": hits,
         "answer": answer,
-    }
\ No newline at end of file
+    }
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _graphrag_events(keyword, used_fallback, hits, prompt, key, fingerprint, cached_answer):
+    """
+    SSE 事件順序：meta（hits）→ token*（LLM delta）→ done
+    完整收到答案才寫入快取；中途出錯送 error 事件
+    """
+    yield _sse("meta", {
+        "keyword": keyword,
+        "used_fallback": used_fallback,
+        "cached": cached_answer is not None,
+        "hits": hits,
+    })
+
+    if cached_answer is not None:
+        yield _sse("token", {"delta": cached_answer})
+        yield _sse("done", {"chars": len(cached_answer)})
+        return
+
+    parts: list[str] = []
+    try:
+        for delta in call_llm_stream(prompt):
+            parts.append(delta)
+            yield _sse("token", {"delta": delta})
+    except Exception as e:
+        yield _sse("error", {"error": f"{type(e).__name__}: {e}"})
+        return
+
+    answer = "".join(parts)
+    answer_cache.put_answer(key, fingerprint, answer)
+    yield _sse("done", {"chars": len(answer)})
\ No newline at end of file
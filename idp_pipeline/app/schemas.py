@@ -8,12 +8,22 @@ class JobCreateResponse(BaseModel):
 
 class JobStatusResponse(BaseModel):
     job_id: str
-    status: Literal["queued", "running", "finished", "failed"]
+    status: Literal["queued", "running", "finished", "failed", "cancelled"]
     route: Optional[RouteName] = None
     filename: Optional[str] = None
     error: Optional[str] = None
     chunks: Optional[int] = None
     qdrant_points: Optional[int] = None
+    stage: Optional[str] = None
+    deadline_sec: Optional[float] = None
+    cancel_requested: Optional[bool] = None
+    memory: Optional[Dict[str, Any]] = None
+    duplicate_chunks: Optional[int] = None
+    latency_mode: Optional[bool] = None
+    speculation: Optional[Dict[str, Any]] = None
+    retries: Optional[int] = None
+    resume_from: Optional[str] = None
+    last_error: Optional[str] = None
 
 class ProcessResult(BaseModel):
     job_id: str
@@ -25,4 +35,25 @@ class ProcessResult(BaseModel):
 
 class SearchResponse(BaseModel):
     query: str
-    hits: List[Dict[str, Any]] = Field(default_factory=list)
\ No newline at end of file
+    hits: List[Dict[str, Any]] = Field(default_factory=list)
+    next_cursor: Optional[str] = None
+
+class SearchFilter(BaseModel):
+    job_id: Optional[str] = None
+    filename: Optional[str] = None
+    page: Optional[int] = None
+    used_route: Optional[RouteName] = None
+    ocr_score_min: Optional[float] = Field(None, ge=0, le=1)
+    ocr_score_max: Optional[float] = Field(None, ge=0, le=1)
+
+class SearchQuery(BaseModel):
+    q: str = Field(..., min_length=1)
+    limit: int = Field(5, ge=1, le=20)
+    filter: Optional[SearchFilter] = None
+    score_threshold: Optional[float] = None
+
+class SearchBatchRequest(BaseModel):
+    queries: List[SearchQuery] = Field(..., min_length=1, max_length=256)
+
+class SearchBatchResponse(BaseModel):
+    results: List[SearchResponse] = Field(default_factory=list)
\ No newline at end of file
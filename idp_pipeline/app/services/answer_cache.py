@@ -0,0 +1,65 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.services.config import ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SEC
+
+# key -> {"answer", "fingerprint", "created_at"}
+_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _chunk_key(h: Dict[str, Any]) -> str:
+    # qdrant_point_id 全域唯一；舊資料沒有時退回 filename#chunk_id
+    pid = h.get("qdrant_point_id")
+    return str(pid) if pid else f"{h.get('filename')}#{h.get('chunk_id')}"
+
+
+def cache_key(keyword: str, hits: List[Dict[str, Any]], model: Optional[str]) -> str:
+    raw = json.dumps(
+        [keyword.strip().lower(), [_chunk_key(h) for h in hits], model or ""],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def hits_fingerprint(hits: List[Dict[str, Any]]) -> str:
+    """chunk 文字內容的 hash：re-ingest 後內容不同，舊答案就不能再用"""
+    h = hashlib.sha256()
+    for hit in hits:
+        h.update((hit.get("text") or "").encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def get_answer(key: str, fingerprint: str) -> Optional[str]:
+    with _LOCK:
+        item = _CACHE.get(key)
+        if item is None:
+            return None
+        expired = ANSWER_CACHE_TTL_SEC > 0 and time.time() - item["created_at"] > ANSWER_CACHE_TTL_SEC
+        if expired or item["fingerprint"] != fingerprint:
+            del _CACHE[key]
+            return None
+        _CACHE.move_to_end(key)
+        return item["answer"]
+
+
+def put_answer(key: str, fingerprint: str, answer: str) -> None:
+    if ANSWER_CACHE_MAX_ENTRIES <= 0:
+        return
+    with _LOCK:
+        _CACHE[key] = {"answer": answer, "fingerprint": fingerprint, "created_at": time.time()}
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > ANSWER_CACHE_MAX_ENTRIES:
+            _CACHE.popitem(last=False)
+
+
+def clear() -> int:
+    with _LOCK:
+        n = len(_CACHE)
+        _CACHE.clear()
+        return n
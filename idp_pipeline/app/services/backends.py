@@ -0,0 +1,68 @@
+"""
+後端（Qdrant / Neo4j）啟動預熱與 readiness 快取的統一入口：
+FastAPI lifespan 與 worker 啟動時呼叫 warmup_all()，關閉時 shutdown_all()。
+"""
+import threading
+import time
+from typing import Any, Dict
+
+from app.services import vstore_qdrant, graph_neo4j
+
+_BACKENDS = {
+    "qdrant": (vstore_qdrant.warmup, vstore_qdrant.readiness),
+    "neo4j": (graph_neo4j.warmup, graph_neo4j.readiness),
+}
+
+
+def warmup_all() -> Dict[str, Any]:
+    """
+    逐一預熱；單一後端失敗只記錄（readiness=False），不讓整個 process 起不來，
+    之後第一次使用時會再確認一次
+    """
+    out: Dict[str, Any] = {}
+    for name, (warm, _) in _BACKENDS.items():
+        t0 = time.perf_counter()
+        try:
+            warm()
+            print(f"[startup] {name} ready in {time.perf_counter() - t0:.2f}s")
+        except Exception as e:
+            print(f"[startup] {name} warmup failed: {type(e).__name__}: {e}")
+        out[name] = status_of(name)
+    return out
+
+
+def warmup_in_background() -> threading.Thread:
+    """不阻塞啟動：API 先開始服務（/health 可用），後端在背景預熱"""
+    t = threading.Thread(target=warmup_all, name="backend-warmup", daemon=True)
+    t.start()
+    return t
+
+
+def check_ready(recheck_sec: float = 5.0) -> Dict[str, Any]:
+    """
+    /ready 用：尚未 ready 的後端，距離上次檢查超過 recheck_sec 才重試一次預熱，
+    避免 readiness probe 把掛掉的後端打得更慘
+    """
+    now = time.time()
+    for name, (warm, get_status) in _BACKENDS.items():
+        st = get_status()
+        if st["ready"] or (st["checked_at"] and now - st["checked_at"] < recheck_sec):
+            continue
+        try:
+            warm()
+        except Exception:
+            pass  # 錯誤已記錄在 readiness()["error"]
+    return status()
+
+
+def status_of(name: str) -> Dict[str, Any]:
+    return _BACKENDS[name][1]()
+
+
+def status() -> Dict[str, Any]:
+    return {name: status_of(name) for name in _BACKENDS}
+
+
+def shutdown_all() -> None:
+    graph_neo4j.close_driver()
+    vstore_qdrant.invalidate_readiness()
@@ -0,0 +1,271 @@
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class JobCancelled(Exception):
+    """job 被使用者取消，或超過 deadline"""
+
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    每個 job 一個 token：
+    - cancel()：DELETE /v1/jobs/{id} 會呼叫
+    - deadline_at：epoch 秒，超過就視為取消（reason=deadline_exceeded）
+    - run()：在背景 thread 執行外部呼叫，取消時立刻放棄等待
+    - on_cancel(fn)：取消時呼叫 fn（cancellable_post 用來關掉進行中的連線）
+    - external：跨 process 的取消來源（worker 模式下檢查 cancel 標記檔），最多每秒查一次
+    - parent：子 token（例如投機執行的單一分支）；parent 取消時跟著取消，自己取消不影響 parent
+    """
+
+    POLL_SEC = 0.2
+    EXTERNAL_POLL_SEC = 1.0
+
+    def __init__(
+        self,
+        job_id: str,
+        deadline_at: Optional[float] = None,
+        external: Optional[Callable[[], bool]] = None,
+        parent: Optional["CancelToken"] = None,
+    ):
+        self.job_id = job_id
+        self.deadline_at = deadline_at
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._external = external
+        self._external_checked_at = 0.0
+        self._parent = parent
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def child(self) -> "CancelToken":
+        return CancelToken(self.job_id, deadline_at=self.deadline_at, parent=self)
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:  # 收尾失敗不影響取消本身
+                print("[cancel] on_cancel callback failed", self.job_id, repr(e))
+
+    def on_cancel(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """登記取消時要跑的 fn，回傳取消登記的函式；已經取消就立刻呼叫"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+
+                def remove() -> None:
+                    with self._lock:
+                        if fn in self._callbacks:
+                            self._callbacks.remove(fn)
+
+                return remove
+        fn()
+        return lambda: None
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self._parent is not None and self._parent.cancelled:
+            self.cancel(self._parent.reason or "cancelled")
+            return True
+        if self.deadline_at is not None and time.time() >= self.deadline_at:
+            self.cancel("deadline_exceeded")
+            return True
+        if self._external is not None:
+            now = time.time()
+            if now - self._external_checked_at >= self.EXTERNAL_POLL_SEC:
+                self._external_checked_at = now
+                if self._external():
+                    self.cancel("cancelled")
+                    return True
+        return False
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise JobCancelled(self.reason or "cancelled")
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline_at is None:
+            return None
+        return max(0.0, self.deadline_at - time.time())
+
+    def clamp_timeout(self, timeout: Any) -> Any:
+        """
+        把 requests 的 timeout（數字或 (connect, read)）壓到不超過剩餘時間
+        """
+        left = self.remaining()
+        if left is None or timeout is None:
+            return timeout
+        left = max(0.1, left)
+        if isinstance(timeout, tuple):
+            return tuple(min(t, left) if t is not None else left for t in timeout)
+        return min(timeout, left)
+
+    def sleep(self, seconds: float) -> None:
+        """可被取消的 sleep（重試 backoff 用）"""
+        end = time.time() + seconds
+        while True:
+            self.check()
+            left = end - time.time()
+            if left <= 0:
+                return
+            self._event.wait(min(left, self.POLL_SEC))
+
+    def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        在 daemon thread 跑 fn，呼叫端每 POLL_SEC 檢查一次取消。
+        取消時直接 raise JobCancelled；背景 thread 的結果會被丟掉。
+        要連背景的工作一起停掉，用 on_cancel 登記中止方式（例如 cancellable_post 關連線）。
+        """
+        self.check()
+        done = threading.Event()
+        box: dict[str, Any] = {}
+
+        def _target() -> None:
+            try:
+                box["result"] = fn(*args, **kwargs)
+            except BaseException as e:  # noqa: BLE001 - 轉交給呼叫端
+                box["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=_target, name=f"job-{self.job_id}-call", daemon=True).start()
+
+        while not done.wait(self.POLL_SEC):
+            self.check()
+
+        # on_cancel 拆掉連線時背景 thread 會先以連線錯誤結束：以取消為準
+        self.check()
+        if "error" in box:
+            raise box["error"]
+        return box.get("result")
+
+
+_current: ContextVar[Optional[CancelToken]] = ContextVar("idp_cancel_token", default=None)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _current.get()
+
+
+@contextmanager
+def bind_token(token: Optional[CancelToken]):
+    """在 run_job 內綁定 token，讓 ocr/vlm/embedding 呼叫不用層層傳參數"""
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+def check_cancelled() -> None:
+    tok = current_token()
+    if tok is not None:
+        tok.check()
+
+
+def cancellable_sleep(seconds: float) -> None:
+    tok = current_token()
+    if tok is None:
+        time.sleep(seconds)
+    else:
+        tok.sleep(seconds)
+
+
+class _AbortableAdapter(HTTPAdapter):
+    """記下這個 adapter 開過的連線，abort() 時直接 shutdown socket（卡在 recv 的請求會立刻失敗）"""
+
+    def __init__(self) -> None:
+        self._conns: List[Any] = []
+        self._conns_lock = threading.Lock()
+        super().__init__()
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        def tracked(cls):
+            def _new_conn(pool):
+                conn = cls._new_conn(pool)
+                with adapter._conns_lock:
+                    adapter._conns.append(conn)
+                return conn
+
+            return type(cls.__name__, (cls,), {"_new_conn": _new_conn})
+
+        # 換掉的是這個 poolmanager 自己的對照表，不影響全域的 urllib3
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: tracked(cls) for scheme, cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def abort(self) -> None:
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            sock = getattr(conn, "sock", None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            conn.close()
+
+
+class _AbortableSession(requests.Session):
+    """每個 cancellable_post 一個 session：job 取消時 abort() 把進行中的連線拆掉，後端不用等 timeout 才釋放"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._adapter = _AbortableAdapter()
+        self.mount("http://", self._adapter)
+        self.mount("https://", self._adapter)
+
+    def abort(self) -> None:
+        self._adapter.abort()
+        self.close()
+
+
+def _session_post(session: _AbortableSession, url: str, **kwargs: Any) -> requests.Response:
+    try:
+        return session.post(url, **kwargs)
+    finally:
+        # stream=True 的 response 還要用連線，交給呼叫端 close
+        if not kwargs.get("stream"):
+            session.close()
+
+
+def cancellable_post(url: str, **kwargs: Any) -> requests.Response:
+    """
+    requests.post 的替代品：
+    - 沒有綁定 token（例如 /v1/search）→ 行為跟 requests.post 一樣
+    - 有 token → timeout 壓到 deadline 內；取消時立刻中止等待，並關掉這個請求的連線
+      （不然背景 thread 會把 VLM / OLM 的請求一路掛到自己的 timeout）
+    """
+    tok = current_token()
+    if tok is None:
+        return requests.post(url, **kwargs)
+    kwargs["timeout"] = tok.clamp_timeout(kwargs.get("timeout"))
+    session = _AbortableSession()
+    remove = tok.on_cancel(session.abort)
+    try:
+        return tok.run(_session_post, session, url, **kwargs)
+    finally:
+        remove()
@@ -0,0 +1,109 @@
+"""
+job 階段 checkpoint：每個階段完成就把輸出落地，失敗後 POST /v1/jobs/{id}/retry 從最後完成的階段接著跑
+
+    {CHECKPOINT_DIR}/{job_id}/
+        extract.json     每頁抽取結果（route / raw_text / pages_meta / page_info / 頁內容 offset）
+        chunking.json    chunk 文字與 span（page / start / end）
+        dedup.json       指紋與重複對照
+        embedding.npy    非重複 chunk 的向量（低記憶體模式邊 embed 邊寫，不存）
+        qdrant_upsert.json  已寫入的 point id
+        neo4j.json       圖譜已寫入（只是標記）
+
+- 寫檔一律先寫 .tmp 再 rename，程序中途被殺也不會留下半個 checkpoint
+- job 成功、取消、被記憶體預算拒絕時整個目錄刪掉；只有失敗的 job 會留著等重試
+- Qdrant / Neo4j 的寫入本身可重複（point id 固定、MERGE），重試時重寫同一批資料不會產生重複
+"""
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional
+
+from app.services.config import CHECKPOINT_ENABLED, CHECKPOINT_DIR
+
+# 依執行順序；resume 從第一個沒有 checkpoint 的階段開始
+STAGES = ("extract", "chunking", "dedup", "embedding", "qdrant_upsert", "neo4j")
+
+
+def job_dir(job_id: str) -> str:
+    return os.path.join(CHECKPOINT_DIR, job_id)
+
+
+def _path(job_id: str, stage: str, ext: str = "json") -> str:
+    return os.path.join(job_dir(job_id), f"{stage}.{ext}")
+
+
+def save(job_id: str, stage: str, data: Dict[str, Any]) -> None:
+    if not CHECKPOINT_ENABLED:
+        return
+    os.makedirs(job_dir(job_id), exist_ok=True)
+    path = _path(job_id, stage)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"stage": stage, "saved_at": time.time(), "data": data}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def load(job_id: str, stage: str) -> Optional[Dict[str, Any]]:
+    if not CHECKPOINT_ENABLED:
+        return None
+    try:
+        with open(_path(job_id, stage), "r", encoding="utf-8") as f:
+            return json.load(f)["data"]
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError) as e:
+        # 壞掉的 checkpoint 當作沒有，重跑該階段
+        print("[checkpoints] unreadable", job_id, stage, repr(e))
+        return None
+
+
+def save_vectors(job_id: str, vectors: List[List[float]]) -> None:
+    if not CHECKPOINT_ENABLED:
+        return
+    import numpy as np
+
+    os.makedirs(job_dir(job_id), exist_ok=True)
+    path = _path(job_id, "embedding", "npy")
+    tmp = path + ".tmp.npy"
+    np.save(tmp, np.asarray(vectors, dtype=np.float32))
+    os.replace(tmp, path)
+
+
+def load_vectors(job_id: str) -> Optional[List[List[float]]]:
+    if not CHECKPOINT_ENABLED:
+        return None
+    import numpy as np
+
+    try:
+        return np.load(_path(job_id, "embedding", "npy")).tolist()
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        print("[checkpoints] unreadable", job_id, "embedding", repr(e))
+        return None
+
+
+def completed(job_id: str) -> List[str]:
+    """
+    已完成的階段：到最後一個有 checkpoint 的階段為止
+    （embedding 在低記憶體模式 / 全部重複時不會落地，後面的階段有 checkpoint 就算完成）
+    """
+    last = -1
+    for i, stage in enumerate(STAGES):
+        ext = "npy" if stage == "embedding" else "json"
+        if os.path.exists(_path(job_id, stage, ext)):
+            last = i
+    return list(STAGES[:last + 1])
+
+
+def resume_stage(job_id: str) -> Optional[str]:
+    """下次執行要從哪個階段開始；沒有任何 checkpoint 回 None（從頭）"""
+    done = completed(job_id)
+    if not done:
+        return None
+    return STAGES[len(done)] if len(done) < len(STAGES) else "lineage"
+
+
+def clear(job_id: str) -> None:
+    shutil.rmtree(job_dir(job_id), ignore_errors=True)
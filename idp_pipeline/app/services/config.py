@@ -29,3 +29,159 @@ EMBED_NORMALIZE = env("EMBED_NORMALIZE", "true").lower() == "true"
 QDRANT_URL = env("QDRANT_URL", "http://localhost:6333")
 QDRANT_COLLECTION = env("QDRANT_COLLECTION", "idp_docs")
 QDRANT_VECTOR_SIZE = int(env("QDRANT_VECTOR_SIZE", "1024"))
+
+# Collection 記憶體 / 召回率取捨（只在建立 collection 時生效；搜尋參數每次查詢生效）
+# 量化：none / scalar（int8，約 1/4 RAM）/ binary（1 bit，約 1/32 RAM，建議搭配 rescore）
+QDRANT_QUANTIZATION = env("QDRANT_QUANTIZATION", "none").lower()
+QDRANT_QUANTIZATION_ALWAYS_RAM = env("QDRANT_QUANTIZATION_ALWAYS_RAM", "true").lower() == "true"
+QDRANT_QUANTIZATION_RESCORE = env("QDRANT_QUANTIZATION_RESCORE", "true").lower() == "true"
+QDRANT_QUANTIZATION_OVERSAMPLING = float(env("QDRANT_QUANTIZATION_OVERSAMPLING", "2.0"))
+# 原始 float 向量 / payload 放磁碟（mmap），RAM 只留量化向量與 HNSW 圖
+QDRANT_ON_DISK_VECTORS = env("QDRANT_ON_DISK_VECTORS", "false").lower() == "true"
+QDRANT_ON_DISK_PAYLOAD = env("QDRANT_ON_DISK_PAYLOAD", "false").lower() == "true"
+QDRANT_HNSW_M = int(env("QDRANT_HNSW_M", "16"))
+QDRANT_HNSW_EF_CONSTRUCT = int(env("QDRANT_HNSW_EF_CONSTRUCT", "100"))
+# 搜尋時的 ef；0 = 用 Qdrant 預設
+QDRANT_HNSW_EF = int(env("QDRANT_HNSW_EF", "0"))
+
+# 單一 job 最長執行時間（秒），0 = 不限制（預設，需要時再開）；POST /v1/jobs?deadline_sec= 可覆蓋
+JOB_DEADLINE_SEC = float(env("JOB_DEADLINE_SEC", "0"))
+
+# job 執行方式：inline = API process 內 BackgroundTasks；queue = 丟進共享佇列給 `python -m app.worker`
+JOB_EXECUTOR = env("JOB_EXECUTOR", "inline").lower()
+
+WORKER_PROCESSES = int(env("WORKER_PROCESSES", "1"))
+WORKER_THREADS = int(env("WORKER_THREADS", "2"))
+WORKER_POLL_SEC = float(env("WORKER_POLL_SEC", "1.0"))
+WORKER_HEARTBEAT_SEC = float(env("WORKER_HEARTBEAT_SEC", "5"))
+# heartbeat 超過這個秒數沒更新 → 視為 worker 已死，它領走的 job 會被放回佇列
+WORKER_STALE_SEC = float(env("WORKER_STALE_SEC", "30"))
+# 收到 SIGTERM 後等待進行中 job 的秒數，超過就取消它們
+WORKER_SHUTDOWN_GRACE_SEC = float(env("WORKER_SHUTDOWN_GRACE_SEC", "60"))
+
+# /v1/graphrag 答案快取（key = keyword + 檢索到的 chunk ids + model；chunk 內容變了就失效）
+ANSWER_CACHE_MAX_ENTRIES = int(env("ANSWER_CACHE_MAX_ENTRIES", "512"))
+ANSWER_CACHE_TTL_SEC = float(env("ANSWER_CACHE_TTL_SEC", "3600"))
+
+# GraphRAG 檢索：向量 + 圖鄰居擴展，依 token 預算打包 context
+GRAPHRAG_TOKEN_BUDGET = int(env("GRAPHRAG_TOKEN_BUDGET", "3000"))
+GRAPHRAG_VECTOR_LIMIT = int(env("GRAPHRAG_VECTOR_LIMIT", "5"))
+GRAPHRAG_NEIGHBOR_HOPS = int(env("GRAPHRAG_NEIGHBOR_HOPS", "1"))
+GRAPHRAG_NEIGHBOR_SAME_PAGE = env("GRAPHRAG_NEIGHBOR_SAME_PAGE", "false").lower() == "true"
+
+# 外部模型後端（olm / vlm / llm / embed）共用的韌性設定
+# circuit breaker：連續失敗 N 次 → open（直接 fail fast）COOLDOWN 秒，之後放一個請求試探
+BREAKER_FAILURE_THRESHOLD = int(env("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_COOLDOWN_SEC = float(env("BREAKER_COOLDOWN_SEC", "30"))
+# 502/503/504 與連線錯誤的重試（breaker open 時不重試）
+BACKEND_RETRY_TRIES = int(env("BACKEND_RETRY_TRIES", "3"))
+BACKEND_RETRY_BASE_SLEEP = float(env("BACKEND_RETRY_BASE_SLEEP", "1.0"))
+# 自適應 timeout：樣本夠多時用 p99 × MULTIPLIER，夾在 [MIN_SEC, 原本寫死的 timeout] 之間
+ADAPTIVE_TIMEOUT_ENABLED = env("ADAPTIVE_TIMEOUT_ENABLED", "true").lower() == "true"
+ADAPTIVE_TIMEOUT_MULTIPLIER = float(env("ADAPTIVE_TIMEOUT_MULTIPLIER", "3.0"))
+ADAPTIVE_TIMEOUT_MIN_SEC = float(env("ADAPTIVE_TIMEOUT_MIN_SEC", "5"))
+LATENCY_WINDOW = int(env("LATENCY_WINDOW", "200"))
+LATENCY_MIN_SAMPLES = int(env("LATENCY_MIN_SAMPLES", "20"))
+# hedged request：超過觀察到的 p95 還沒回來就再送一份，取先成功的（逗號分隔，例如 "embed,olm"）
+HEDGE_BACKENDS = {b.strip() for b in env("HEDGE_BACKENDS", "").split(",") if b.strip()}
+
+# 資料保留 / 回收（背景 sweeper，0 = 該項不限制）
+RETENTION_SWEEP_INTERVAL_SEC = float(env("RETENTION_SWEEP_INTERVAL_SEC", "600"))  # 0 = 不啟動 sweeper
+# 已結束（finished / failed / cancelled）的 job 紀錄：記憶體 _JOBS 與 queue/jobs/*.json
+JOB_RECORD_TTL_SEC = float(env("JOB_RECORD_TTL_SEC", "86400"))
+JOB_RECORD_MAX_COUNT = int(env("JOB_RECORD_MAX_COUNT", "1000"))
+# 上傳原檔（只刪已結束 job 的）；MAX_BYTES 超過時從最舊的開始刪
+UPLOAD_TTL_SEC = float(env("UPLOAD_TTL_SEC", "604800"))
+UPLOAD_MAX_BYTES = int(env("UPLOAD_MAX_BYTES", "0"))
+# 渲染出的頁面圖片：job 結束後保留秒數（0 = job 結束就刪）
+PAGE_IMAGES_RETAIN_SEC = float(env("PAGE_IMAGES_RETAIN_SEC", "86400"))
+# 渲染的頁面圖片以 bytes 直接送 OCR / VLM；true = 另外寫一份 page_{n}.png 給 lineage 追溯，false = 完全不落地
+PAGE_IMAGES_PERSIST = env("PAGE_IMAGES_PERSIST", "true").lower() == "true"
+# lineage：超過 COMPACT_AFTER 就去掉 chunk 全文、gzip 壓縮；超過 TTL 刪除
+LINEAGE_COMPACT_AFTER_SEC = float(env("LINEAGE_COMPACT_AFTER_SEC", "604800"))
+LINEAGE_TTL_SEC = float(env("LINEAGE_TTL_SEC", "0"))
+
+# lineage 查詢索引（SQLite）：point → 來源頁 / 圖片、各 job 的抽取路徑統計
+LINEAGE_DB_PATH = env("LINEAGE_DB_PATH", os.path.join(DATA_DIR, "lineage", "index.sqlite"))
+
+# job 記憶體量測（每個 stage 的 RSS 增量 / 峰值，寫進 job 狀態、lineage 與 /v1/metrics）
+MEMPROF_ENABLED = env("MEMPROF_ENABLED", "false").lower() == "true"
+# 另外用 tracemalloc 量 Python 物件配置（會拖慢 pipeline，排查時才開）
+MEMPROF_TRACEMALLOC = env("MEMPROF_TRACEMALLOC", "false").lower() == "true"
+# 單一 job 的 RSS 增量上限（MB），0 = 不限制；超過時 low_memory = 改走低記憶體模式，reject = 直接 failed
+JOB_MEMORY_BUDGET_MB = float(env("JOB_MEMORY_BUDGET_MB", "0"))
+JOB_MEMORY_BUDGET_ACTION = env("JOB_MEMORY_BUDGET_ACTION", "low_memory").lower()
+# 低記憶體模式：embedding + Qdrant upsert 每批的 chunk 數
+LOW_MEMORY_EMBED_BATCH = int(env("LOW_MEMORY_EMBED_BATCH", "32"))
+
+# chunk 去重（embedding 前）：exact hash + SimHash 近似重複，文件內（+ 可選的跨文件）
+DEDUP_ENABLED = env("DEDUP_ENABLED", "true").lower() == "true"
+# 跨文件去重（預設關閉）：重複 chunk 指向別的 job 的 Qdrant point，以 job_id / filename 過濾的 /v1/search 找不到它們
+DEDUP_CROSS_CORPUS = env("DEDUP_CROSS_CORPUS", "false").lower() == "true"
+# SimHash 漢明距離門檻（<= 3 才保證 4-band 候選查得到）
+DEDUP_SIMHASH_MAX_DISTANCE = int(env("DEDUP_SIMHASH_MAX_DISTANCE", "3"))
+# 太短的 chunk SimHash 不穩，只做 exact
+DEDUP_NEAR_MIN_CHARS = int(env("DEDUP_NEAR_MIN_CHARS", "64"))
+
+# VLM 多頁批次：一個請求最多帶幾張頁面圖片（預設 1 = 每頁一個請求，關閉）；輸出用 <<<PAGE n>>> 分隔，解析失敗退回逐頁
+VLM_BATCH_SIZE = int(env("VLM_BATCH_SIZE", "1"))
+
+# 低文字頁的自適應路由：依歷史結果（同 producer / 文字密度 / 圖片覆蓋率）決定先 OCR 或直接 VLM
+ROUTING_ADAPTIVE = env("ROUTING_ADAPTIVE", "true").lower() == "true"
+ROUTING_DB_PATH = env("ROUTING_DB_PATH", os.path.join(DATA_DIR, "routing_stats.sqlite"))
+# 樣本數夠、且 OCR 被退回改叫 VLM 的比例 >= RATIO → 直接 VLM
+ROUTING_MIN_SAMPLES = int(env("ROUTING_MIN_SAMPLES", "20"))
+ROUTING_VLM_DIRECT_RATIO = float(env("ROUTING_VLM_DIRECT_RATIO", "0.8"))
+# 偶爾照舊先 OCR，讓統計能跟上模型 / 文件的變化
+ROUTING_EXPLORE_RATE = float(env("ROUTING_EXPLORE_RATE", "0.05"))
+
+# latency mode：邊界頁 OCR 與 VLM 同時跑，取先可用的（多花模型成本換延遲），預設只對指定 job 開
+LATENCY_MODE_DEFAULT = env("LATENCY_MODE_DEFAULT", "false").lower() == "true"
+# 路由統計裡 OCR 被退回比例 >= 這個值（或還沒有統計）的低文字頁才算邊界頁
+LATENCY_BORDERLINE_MIN_RATIO = float(env("LATENCY_BORDERLINE_MIN_RATIO", "0.2"))
+SPECULATIVE_MAX_WORKERS = int(env("SPECULATIVE_MAX_WORKERS", "8"))
+
+# 階段 checkpoint：失敗的 job 可用 POST /v1/jobs/{id}/retry 從最後完成的階段接著跑
+CHECKPOINT_ENABLED = env("CHECKPOINT_ENABLED", "true").lower() == "true"
+CHECKPOINT_DIR = env("CHECKPOINT_DIR", os.path.join(DATA_DIR, "checkpoints"))
+# 失敗 job 的 checkpoint 保留多久（retention sweeper 清；0 = 不清）
+CHECKPOINT_TTL_SEC = float(env("CHECKPOINT_TTL_SEC", str(3 * 24 * 3600)))
+JOB_MAX_RETRIES = int(env("JOB_MAX_RETRIES", "3"))
+
+# 離線批次匯入（python -m app.bulk_ingest）
+BULK_WORKERS = int(env("BULK_WORKERS", str(os.cpu_count() or 4)))
+BULK_EMBED_BATCH = int(env("BULK_EMBED_BATCH", "256"))
+BULK_UPSERT_BATCH = int(env("BULK_UPSERT_BATCH", "256"))
+BULK_LEDGER_PATH = env("BULK_LEDGER_PATH", os.path.join(DATA_DIR, "bulk_ingest", "ledger.sqlite"))
+
+# 語料匯出（python -m scripts.export_corpus）：Qdrant chunk → 分區 Parquet / Arrow，需要 pyarrow
+EXPORT_DIR = env("EXPORT_DIR", os.path.join(DATA_DIR, "export"))
+EXPORT_ROWS_PER_FILE = int(env("EXPORT_ROWS_PER_FILE", "200000"))
+EXPORT_SCROLL_BATCH = int(env("EXPORT_SCROLL_BATCH", "1000"))
+# 增量匯出的上限 = 現在 - LAG（還在寫入中的 job 留到下次）
+EXPORT_WATERMARK_LAG_SEC = float(env("EXPORT_WATERMARK_LAG_SEC", "300"))
+
+# 換 embedding 模型 / 維度：python -m scripts.reembed_collection 重新 embedding 到新 collection 後切 alias
+REEMBED_DIR = env("REEMBED_DIR", os.path.join(DATA_DIR, "reembed"))
+REEMBED_BATCH = int(env("REEMBED_BATCH", "128"))
+# 每秒最多送幾個 chunk 去 embed（0 = 不限），避免跟線上 job / 搜尋搶 embedding 後端
+REEMBED_MAX_CHUNKS_PER_SEC = float(env("REEMBED_MAX_CHUNKS_PER_SEC", "0"))
+# 追補階段往回多看的秒數（API 與遷移程序的時鐘差、寫入中的批次）
+REEMBED_CATCHUP_MARGIN_SEC = float(env("REEMBED_CATCHUP_MARGIN_SEC", "60"))
+# 目前 alias 指向的 collection 用哪個 embedding 後端（遷移切換時寫入；沒有這個檔就用 EMBED_API_URL）
+EMBED_PROFILE_PATH = env("EMBED_PROFILE_PATH", os.path.join(REEMBED_DIR, "active.json"))
+
+# job 結果查詢（/v1/jobs/{id}/result/*）：完整 markdown 存放處、解析過的 lineage 快取份數、小於這個大小的回應不壓縮
+RESULTS_DIR = env("RESULTS_DIR", os.path.join(DATA_DIR, "results"))
+RESULT_CACHE_JOBS = int(env("RESULT_CACHE_JOBS", "8"))
+RESULT_COMPRESS_MIN_BYTES = int(env("RESULT_COMPRESS_MIN_BYTES", "1024"))
+
+# 頁面分類門檻（page_classify）：文字太少 → OCR / VLM；像表格 → VLM；OCR 品質分數低於門檻 → VLM
+PAGE_MIN_TEXT_CHARS = int(env("PAGE_MIN_TEXT_CHARS", "20"))
+OCR_MIN_SCORE = float(env("OCR_MIN_SCORE", "0.55"))
+# 短於這個字數的 OCR 輸出品質分數固定 0.1
+OCR_SHORT_TEXT_CHARS = int(env("OCR_SHORT_TEXT_CHARS", "50"))
+# 像表格：非空行 >= MIN_LINES、有 2 段以上連續空白的行 >= MIN_COLUMN_LINES、數字比例 > MIN_DIGIT_RATIO
+TABLE_MIN_LINES = int(env("TABLE_MIN_LINES", "4"))
+TABLE_MIN_COLUMN_LINES = int(env("TABLE_MIN_COLUMN_LINES", "2"))
+TABLE_MIN_DIGIT_RATIO = float(env("TABLE_MIN_DIGIT_RATIO", "0.15"))
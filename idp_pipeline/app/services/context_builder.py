@@ -0,0 +1,226 @@
+"""
+GraphRAG 檢索階段：
+
+1) Qdrant 向量檢索 + Neo4j keyword 檢索當 seed（都查不到才用 fallback）
+2) 沿 NEXT 邊擴展相鄰 chunk
+3) 去重：同一個 chunk 只留一次；同文件內 span 重疊（chunker overlap）的 chunk 合併成一段
+4) 依 token 預算打包 context（seed 優先，鄰居其次）
+"""
+import hashlib
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.config import (
+    GRAPHRAG_TOKEN_BUDGET,
+    GRAPHRAG_VECTOR_LIMIT,
+    GRAPHRAG_NEIGHBOR_HOPS,
+    GRAPHRAG_NEIGHBOR_SAME_PAGE,
+)
+from app.services.vstore_qdrant import qdrant_search
+from app.services.graph_neo4j import (
+    graph_find_chunks_by_keyword,
+    graph_fallback_top_chunks,
+    graph_expand_neighbors,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    不依賴 tokenizer 的估算：CJK 約 1 字 1 token，其餘約 4 字元 1 token
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    other = len(text) - cjk
+    return cjk + math.ceil(other / 4)
+
+
+def _truncate_to_tokens(text: str, budget: int) -> str:
+    if budget <= 0:
+        return ""
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def _key(h: Dict[str, Any]) -> Tuple[Any, Any]:
+    return (h.get("job_id"), h.get("chunk_id"))
+
+
+def _from_vector_hit(r: Dict[str, Any]) -> Dict[str, Any]:
+    p = r.get("payload") or {}
+    cid = p.get("chunk_id", p.get("chunk_index"))
+    return {
+        "job_id": p.get("job_id"),
+        "filename": p.get("filename"),
+        "chunk_id": cid,
+        "text": p.get("text") or "",
+        "qdrant_point_id": str(r.get("id")) if r.get("id") is not None else None,
+        "page": p.get("page"),
+        "start": p.get("start"),
+        "end": p.get("end"),
+        "score": r.get("score"),
+        "source": "vector",
+    }
+
+
+def _interleave(a: List[Dict[str, Any]], b: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for i in range(max(len(a), len(b))):
+        if i < len(a):
+            out.append(a[i])
+        if i < len(b):
+            out.append(b[i])
+    return out
+
+
+def _merge_passages(selected: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    同一個 job 內依 start 排序，把 span 重疊 / 相接的 chunk 接成一段，重疊部分只保留一次。
+    沒有 offset 的 chunk 各自成段。輸出依「段內最佳 rank」排序。
+    """
+    by_job: Dict[Any, List[Dict[str, Any]]] = {}
+    loose: List[Dict[str, Any]] = []
+    for h in selected:
+        if h.get("start") is None or h.get("end") is None:
+            loose.append({**h, "chunk_ids": [h.get("chunk_id")]})
+        else:
+            by_job.setdefault(h.get("job_id"), []).append(h)
+
+    passages: List[Dict[str, Any]] = list(loose)
+    for items in by_job.values():
+        items.sort(key=lambda x: (x["start"], x["end"]))
+        cur: Optional[Dict[str, Any]] = None
+        for h in items:
+            if cur is not None and h["start"] <= cur["end"]:
+                if h["end"] > cur["end"]:
+                    cut = cur["end"] - h["start"]
+                    cur["text"] += (h.get("text") or "")[cut:]
+                    cur["end"] = h["end"]
+                cur["chunk_ids"].append(h.get("chunk_id"))
+                cur["rank"] = min(cur["rank"], h["rank"])
+                continue
+            cur = {**h, "chunk_ids": [h.get("chunk_id")]}
+            passages.append(cur)
+
+    passages.sort(key=lambda p: p["rank"])
+    return passages
+
+
+def build_context(
+    keyword: str,
+    *,
+    graph_limit: int = 5,
+    vector_limit: int = GRAPHRAG_VECTOR_LIMIT,
+    fallback_limit: int = 5,
+    hops: int = GRAPHRAG_NEIGHBOR_HOPS,
+    token_budget: int = GRAPHRAG_TOKEN_BUDGET,
+) -> Dict[str, Any]:
+    """
+    回傳：
+      hits: 實際放進 context 的 chunk（含 source=vector/graph/neighbor/fallback）
+      context: 打包好的 prompt 內容
+      used_fallback / context_tokens / dropped（超出預算被丟掉的 chunk 數）
+    """
+    vector_hits: List[Dict[str, Any]] = []
+    if vector_limit > 0:
+        try:
+            vector_hits = [_from_vector_hit(r) for r in qdrant_search(keyword, limit=vector_limit)]
+        except Exception as e:  # 向量庫/embedding 掛了仍可只靠圖檢索
+            print("[graphrag] vector search failed", repr(e))
+
+    graph_hits = [{**h, "source": "graph"} for h in graph_find_chunks_by_keyword(keyword, limit=graph_limit)]
+
+    used_fallback = False
+    seeds = _interleave(vector_hits, graph_hits)
+    if not seeds:
+        used_fallback = True
+        seeds = [{**h, "source": "fallback"} for h in graph_fallback_top_chunks(limit=fallback_limit)]
+
+    # ---- 去重（同 chunk / 同文字）+ rank ----
+    ranked: List[Dict[str, Any]] = []
+    seen_keys: set = set()
+    seen_text: set = set()
+
+    def _add(h: Dict[str, Any]) -> None:
+        k = _key(h)
+        th = hashlib.sha1((h.get("text") or "").strip().encode("utf-8")).hexdigest()
+        if (k[0] is not None and k in seen_keys) or th in seen_text:
+            return
+        seen_keys.add(k)
+        seen_text.add(th)
+        ranked.append({**h, "rank": len(ranked)})
+
+    for h in seeds:
+        _add(h)
+
+    # ---- 鄰居擴展：排在所有 seed 之後，依 seed 順序 + 距離 ----
+    if hops > 0 and ranked:
+        try:
+            neighbors = graph_expand_neighbors(
+                [h for h in ranked if h.get("job_id") is not None],
+                hops=hops,
+                same_page_only=GRAPHRAG_NEIGHBOR_SAME_PAGE,
+            )
+        except Exception as e:
+            print("[graphrag] neighbor expansion failed", repr(e))
+            neighbors = []
+        seed_rank = {_key(h): h["rank"] for h in ranked}
+        neighbors.sort(key=lambda n: (seed_rank.get((n["seed_job_id"], n["seed_chunk_id"]), 1 << 30), n["distance"]))
+        for n in neighbors:
+            _add({
+                "job_id": n["job_id"],
+                "filename": n["filename"],
+                "chunk_id": n["chunk_id"],
+                "text": n["text"],
+                "qdrant_point_id": n["qdrant_point_id"],
+                "page": n["page"],
+                "start": n["start"],
+                "end": n["end"],
+                "source": "neighbor",
+            })
+
+    # ---- 依預算挑 chunk（以合併後的段落計算，重疊部分不重複計費）----
+    selected: List[Dict[str, Any]] = []
+    dropped = 0
+    for h in ranked:
+        trial = _merge_passages(selected + [h])
+        if sum(estimate_tokens(p["text"]) for p in trial) <= token_budget:
+            selected.append(h)
+        elif not selected:
+            # 第一個 seed 就超過預算：截斷它，至少給 LLM 一段內容
+            cut = dict(h)
+            cut["text"] = _truncate_to_tokens(h.get("text") or "", token_budget)
+            cut["end"] = (cut["start"] + len(cut["text"])) if cut.get("start") is not None else None
+            cut["truncated"] = True
+            selected.append(cut)
+        else:
+            dropped += 1
+
+    passages = _merge_passages(selected)
+    blocks = []
+    for p in passages:
+        ids = [c for c in p["chunk_ids"] if c is not None]
+        if len(ids) > 1:
+            label = f"chunk{min(ids)}-{max(ids)}"
+        else:
+            label = f"chunk{ids[0]}" if ids else "chunk"
+        page = f" p.{p['page']}" if p.get("page") is not None else ""
+        blocks.append(f"[{p.get('filename')}#{label}{page}]\n{p['text']}")
+    context = "\n\n".join(blocks)
+
+    hits = [{k: v for k, v in h.items() if k != "rank"} for h in sorted(selected, key=lambda x: x["rank"])]
+    return {
+        "hits": hits,
+        "context": context,
+        "used_fallback": used_fallback,
+        "context_tokens": estimate_tokens(context),
+        "dropped": dropped,
+    }
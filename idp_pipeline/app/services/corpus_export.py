@@ -0,0 +1,226 @@
+"""
+語料匯出：把 Qdrant 裡的 chunk（文字 + 中繼資料，可選向量）串流寫成分區的 Parquet / Arrow 檔，
+給離線評估 / 分析 / 重新 embedding 用（不用走 API 分頁或逐個讀 lineage JSON）
+
+    {EXPORT_DIR}/
+        ingest_date=2026-10-19/part-<run_id>-00000.parquet   依 ingested_at（UTC 日期）分區
+        _watermark.json                                      上次匯出到的 ingested_at
+        _runs/<run_id>.json                                  每次匯出的範圍、筆數、檔案
+
+- 增量：只取 watermark < ingested_at <= 本次上限（現在 - EXPORT_WATERMARK_LAG_SEC）；成功寫完才推進 watermark
+- 邊 scroll 邊寫，每個分區累積 rows_per_file 筆寫一個檔，記憶體只留一個檔的量
+- 重試 / 重寫的 point 會以新的 ingested_at 再匯出一次：下游依 point_id 取 ingested_at 最新的一筆；刪除不會反映
+- 沒有 ingested_at 的舊 point 只在全量匯出（full=True）時出現，分區為 ingest_date=unknown
+- pyarrow 是選用相依，只有匯出用到
+"""
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app.services.config import (
+    EXPORT_DIR, EXPORT_ROWS_PER_FILE, EXPORT_SCROLL_BATCH, EXPORT_WATERMARK_LAG_SEC, QDRANT_VECTOR_SIZE,
+)
+from app.services.vstore_qdrant import scroll_points
+
+# (欄位, arrow 型別名)；payload 以外的欄位：point_id / ingested_at（timestamp）/ vector
+COLUMNS = (
+    ("point_id", "string"),
+    ("job_id", "string"),
+    ("filename", "string"),
+    ("route", "string"),
+    ("chunk_index", "int64"),
+    ("page", "int64"),
+    ("used_route", "string"),
+    ("ocr_score", "float64"),
+    ("start", "int64"),
+    ("end", "int64"),
+    ("text", "string"),
+    ("ingested_at", "timestamp"),
+)
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def _pa():
+    try:
+        import pyarrow
+    except Exception as e:
+        raise RuntimeError("Missing dependency: pyarrow. Install: pip install pyarrow") from e
+    return pyarrow
+
+
+def schema(with_vectors: bool = False, dim: int = QDRANT_VECTOR_SIZE):
+    pa = _pa()
+    types = {
+        "string": pa.string(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "timestamp": pa.timestamp("ms", tz="UTC"),
+    }
+    fields = [pa.field(name, types[t]) for name, t in COLUMNS]
+    if with_vectors:
+        fields.append(pa.field("vector", pa.list_(pa.float32(), dim)))
+    return pa.schema(fields)
+
+
+def _watermark_path(out_dir: str) -> str:
+    return os.path.join(out_dir, "_watermark.json")
+
+
+def read_watermark(out_dir: str = EXPORT_DIR) -> Optional[float]:
+    try:
+        with open(_watermark_path(out_dir), "r", encoding="utf-8") as f:
+            return float(json.load(f)["watermark"])
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _partition(ingested_at: Optional[float]) -> str:
+    if ingested_at is None:
+        return "unknown"
+    return datetime.fromtimestamp(ingested_at, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+class _PartitionWriter:
+    """每個分區一組欄位 buffer，滿 rows_per_file 就寫成一個檔"""
+
+    def __init__(self, out_dir: str, run_id: str, fmt: str, rows_per_file: int, with_vectors: bool):
+        self.out_dir = out_dir
+        self.run_id = run_id
+        self.fmt = fmt
+        self.rows_per_file = max(1, rows_per_file)
+        self.with_vectors = with_vectors
+        self.names = [name for name, _ in COLUMNS] + (["vector"] if with_vectors else [])
+        self.buffers: Dict[str, Dict[str, List[Any]]] = {}
+        self.files: List[Dict[str, Any]] = []
+        self.dim: Optional[int] = None
+
+    def add(self, row: Dict[str, Any]) -> None:
+        part = _partition(row["ingested_at"])
+        buf = self.buffers.get(part)
+        if buf is None:
+            buf = self.buffers[part] = {name: [] for name in self.names}
+        for name in self.names:
+            buf[name].append(row.get(name))
+        if len(buf["point_id"]) >= self.rows_per_file:
+            self._write(part)
+
+    def _write(self, part: str) -> None:
+        buf = self.buffers.pop(part, None)
+        if not buf or not buf["point_id"]:
+            return
+        pa = _pa()
+        if self.with_vectors and self.dim is None:
+            self.dim = next((len(v) for v in buf["vector"] if v is not None), QDRANT_VECTOR_SIZE)
+        sch = schema(self.with_vectors, self.dim or QDRANT_VECTOR_SIZE)
+        # ingested_at 存 epoch 秒 → timestamp[ms]
+        buf["ingested_at"] = [int(t * 1000) if t is not None else None for t in buf["ingested_at"]]
+        table = pa.Table.from_pydict(buf, schema=sch)
+
+        part_dir = os.path.join(self.out_dir, f"ingest_date={part}")
+        os.makedirs(part_dir, exist_ok=True)
+        name = f"part-{self.run_id}-{len(self.files):05d}{FORMATS[self.fmt]}"
+        path = os.path.join(part_dir, name)
+        tmp = path + ".tmp"
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            pq.write_table(table, tmp, compression="zstd")
+        else:
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+        self.files.append({"path": os.path.relpath(path, self.out_dir), "rows": table.num_rows, "bytes": os.path.getsize(path)})
+
+    def close(self) -> None:
+        for part in list(self.buffers):
+            self._write(part)
+
+
+def _row(rec: Any, with_vectors: bool) -> Dict[str, Any]:
+    p = rec.payload or {}
+    row = {name: p.get(name) for name, _ in COLUMNS}
+    row["point_id"] = str(rec.id)
+    for name in ("chunk_index", "page", "start", "end"):
+        if row[name] is not None:
+            row[name] = int(row[name])
+    if row["ocr_score"] is not None:
+        row["ocr_score"] = float(row["ocr_score"])
+    if row["ingested_at"] is not None:
+        row["ingested_at"] = float(row["ingested_at"])
+    if with_vectors:
+        vec = rec.vector
+        if isinstance(vec, dict):  # named vectors：取第一個
+            vec = next(iter(vec.values()), None)
+        row["vector"] = vec
+    return row
+
+
+def export_corpus(
+    out_dir: str = EXPORT_DIR,
+    *,
+    full: bool = False,
+    since: Optional[float] = None,
+    with_vectors: bool = False,
+    fmt: str = "parquet",
+    rows_per_file: int = EXPORT_ROWS_PER_FILE,
+    batch_size: int = EXPORT_SCROLL_BATCH,
+) -> Dict[str, Any]:
+    """
+    - full=True：忽略 watermark，匯出到本次上限為止的全部 point（含沒有 ingested_at 的舊資料）
+    - since：指定起點（epoch 秒），不讀 watermark
+    回傳本次匯出的摘要（也會寫到 _runs/<run_id>.json）
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt} (expected one of {sorted(FORMATS)})")
+    _pa()  # 先確認有 pyarrow，不要 scroll 完才失敗
+
+    t0 = time.time()
+    until = t0 - max(0.0, EXPORT_WATERMARK_LAG_SEC)
+    start = None if full else (since if since is not None else read_watermark(out_dir))
+    run_id = time.strftime("%Y%m%dT%H%M%S", time.gmtime(t0)) + "-" + uuid.uuid4().hex[:6]
+
+    filters: Dict[str, Any] = {}
+    if start is not None:
+        filters["ingested_after"] = start
+    if not full:
+        filters["ingested_until"] = until
+
+    writer = _PartitionWriter(out_dir, run_id, fmt, rows_per_file, with_vectors)
+    rows = skipped = 0
+    for records in scroll_points(filters or None, with_vectors=with_vectors, batch_size=batch_size):
+        for rec in records:
+            row = _row(rec, with_vectors)
+            # 全量匯出不帶範圍條件（才拿得到舊資料），上限之後寫入的留給下次增量
+            if row["ingested_at"] is not None and row["ingested_at"] > until:
+                skipped += 1
+                continue
+            writer.add(row)
+            rows += 1
+    writer.close()
+
+    summary = {
+        "run_id": run_id,
+        "format": fmt,
+        "full": full,
+        "from": start,
+        "until": until,
+        "rows": rows,
+        "skipped_after_until": skipped,
+        "with_vectors": with_vectors,
+        "files": writer.files,
+        "sec": round(time.time() - t0, 3),
+    }
+    _write_json(os.path.join(out_dir, "_runs", f"{run_id}.json"), summary)
+    _write_json(_watermark_path(out_dir), {"watermark": until, "run_id": run_id, "updated_at": time.time()})
+    return summary
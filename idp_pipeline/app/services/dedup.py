@@ -0,0 +1,160 @@
+"""
+chunk 去重（chunking 之後、embedding 之前）
+
+頁首 / 頁尾 / 法律聲明 / 每頁重複的表頭會變成大量一模一樣（或只差頁碼）的 chunk：
+- 正規化：小寫、空白合併、去掉頁碼行（Page N / 第 N 頁 / 頭尾的單獨數字行）；其他數字保留
+  （只差數字的表格 / 發票 / 報表是不同內容，不能當重複丟掉）
+- exact：正規化後 sha1 相同
+- near：64-bit SimHash（字元 3-gram，含數字），漢明距離 <= DEDUP_SIMHASH_MAX_DISTANCE，且數字序列完全相同（digits_hash）；
+  切成 4 個 16-bit band，距離 <= 3 的兩個指紋必有一個 band 完全相同 → 用 band 找候選
+- 範圍：文件內（先出現的為 canonical）+ 跨文件（lineage 索引裡的 chunk_fingerprints 表）
+
+重複的 chunk 不 embed、不寫 Qdrant，改指向 canonical 的 qdrant point；lineage / Neo4j 仍保留每個 chunk 的原文與頁碼。
+"""
+import hashlib
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services import lineage_index
+from app.services.config import (
+    DEDUP_CROSS_CORPUS,
+    DEDUP_SIMHASH_MAX_DISTANCE,
+    DEDUP_NEAR_MIN_CHARS,
+)
+
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+_WS = re.compile(r"\s+")
+_DIGITS = re.compile(r"\d")
+_EDGE = r"[\s\-–—·•|()\[\]]*"
+# 整行只有頁碼標記：page 3 / p. 3 / page 3 of 10 / 第 3 頁 / 第 3 頁，共 10 頁
+_PAGE_LABEL_LINE = re.compile(
+    rf"^{_EDGE}(?:(?:page|p\.)\s*\d+(?:\s*(?:of|/)\s*\d+)?|第\s*\d+\s*頁(?:\s*[,，/]?\s*共\s*\d+\s*頁)?){_EDGE}$"
+)
+# 單獨的數字行（- 3 - / 3 / 10）：只在 chunk 頭尾、且旁邊那行沒有數字時當頁碼（避免吃掉一格一行的表格）
+_BARE_NUMBER_LINE = re.compile(rf"^{_EDGE}\d{{1,4}}(?:\s*/\s*\d{{1,4}})?{_EDGE}$")
+# 最後一行結尾的頁碼：「... confidential page 3」
+_TRAILING_PAGE = re.compile(r"\s+(?:page\s*\d+(?:\s*(?:of|/)\s*\d+)?|第\s*\d+\s*頁)\s*$")
+# 沒有數字的 chunk 的 digits_hash（舊版指紋沒有 digits_hash，只跟這種 chunk 比，見 lineage_index）
+NO_DIGITS_HASH = hashlib.sha1(b"").hexdigest()[:16]
+
+
+def normalize(text: str) -> str:
+    """頁碼不算差異；其他數字照原樣保留"""
+    lines = [ln.strip() for ln in (text or "").lower().splitlines()]
+    lines = [ln for ln in lines if ln and not _PAGE_LABEL_LINE.match(ln)]
+    if len(lines) > 1 and _BARE_NUMBER_LINE.match(lines[0]) and not _DIGITS.search(lines[1]):
+        lines = lines[1:]
+    if len(lines) > 1 and _BARE_NUMBER_LINE.match(lines[-1]) and not _DIGITS.search(lines[-2]):
+        lines = lines[:-1]
+    return _TRAILING_PAGE.sub("", _WS.sub(" ", " ".join(lines)).strip()).strip()
+
+
+def digits_hash(norm: str) -> str:
+    return hashlib.sha1("".join(_DIGITS.findall(norm)).encode("utf-8")).hexdigest()[:16]
+
+
+def exact_hash(norm: str) -> str:
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()
+
+
+def simhash(norm: str, n: int = 3) -> int:
+    import numpy as np
+
+    shingles = {norm[i:i + n] for i in range(max(1, len(norm) - n + 1))}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    bits = np.unpackbits(hashes.view(np.uint8), bitorder="little").reshape(-1, 64)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+    return int(np.packbits(votes, bitorder="little").view(np.uint64)[0])
+
+
+def bands(h: int) -> List[int]:
+    mask = (1 << _BAND_BITS) - 1
+    return [(h >> (b * _BAND_BITS)) & mask for b in range(_BANDS)]
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def fingerprint(text: str) -> Dict[str, Any]:
+    norm = normalize(text)
+    fp: Dict[str, Any] = {"exact_hash": exact_hash(norm), "digits_hash": digits_hash(norm), "simhash": None}
+    if len(norm) >= DEDUP_NEAR_MIN_CHARS:
+        fp["simhash"] = simhash(norm)
+    return fp
+
+
+def find_duplicates(chunks: List[str], job_id: str) -> Tuple[List[Dict[str, Any]], Dict[int, Dict[str, Any]]]:
+    """
+    回傳 (fingerprints, dups)：
+    - fingerprints[i]：每個 chunk 的指紋（之後 register_fingerprints 用）
+    - dups[i]：重複 chunk i 的 canonical，
+        文件內：{"scope": "document", "kind", "chunk_id"}（chunk_id 一定是非重複的 chunk）
+        跨文件：{"scope": "corpus", "kind", "job_id", "chunk_id", "qdrant_point_id"}
+    """
+    fps = [fingerprint(t) for t in chunks]
+    dups: Dict[int, Dict[str, Any]] = {}
+    seen_exact: Dict[str, int] = {}
+    seen_bands: Dict[Tuple[int, int], List[int]] = {}
+
+    for i, fp in enumerate(fps):
+        canon: Optional[Dict[str, Any]] = None
+
+        j = seen_exact.get(fp["exact_hash"])
+        if j is not None:
+            canon = {"scope": "document", "kind": "exact", "chunk_id": j}
+        elif fp["simhash"] is not None:
+            best: Optional[Tuple[int, int]] = None
+            for b, v in enumerate(bands(fp["simhash"])):
+                for j in seen_bands.get((b, v), []):
+                    if fps[j]["digits_hash"] != fp["digits_hash"]:
+                        continue
+                    d = hamming(fp["simhash"], fps[j]["simhash"])
+                    if d <= DEDUP_SIMHASH_MAX_DISTANCE and (best is None or d < best[1]):
+                        best = (j, d)
+            if best is not None:
+                canon = {"scope": "document", "kind": "near", "chunk_id": best[0], "distance": best[1]}
+
+        if canon is None and DEDUP_CROSS_CORPUS:
+            canon = _find_in_corpus(fp, job_id)
+
+        if canon is not None:
+            dups[i] = canon
+            continue
+
+        # 只有非重複的 chunk 會被當成之後的 canonical
+        seen_exact[fp["exact_hash"]] = i
+        if fp["simhash"] is not None:
+            for b, v in enumerate(bands(fp["simhash"])):
+                seen_bands.setdefault((b, v), []).append(i)
+
+    return fps, dups
+
+
+def _find_in_corpus(fp: Dict[str, Any], job_id: str) -> Optional[Dict[str, Any]]:
+    legacy_ok = fp["digits_hash"] == NO_DIGITS_HASH
+    row = lineage_index.find_fingerprint_exact(fp["exact_hash"], fp["digits_hash"], legacy_ok, exclude_job_id=job_id)
+    if row is not None:
+        return {"scope": "corpus", "kind": "exact", **row}
+    if fp["simhash"] is None:
+        return None
+    best = None
+    for row in lineage_index.find_fingerprint_candidates(bands(fp["simhash"]), fp["digits_hash"], legacy_ok, exclude_job_id=job_id):
+        d = hamming(fp["simhash"], row.pop("simhash"))
+        if d <= DEDUP_SIMHASH_MAX_DISTANCE and (best is None or d < best["distance"]):
+            best = {"scope": "corpus", "kind": "near", "distance": d, **row}
+    return best
+
+
+def register_fingerprints(job_id: str, fps: List[Dict[str, Any]], point_ids: Dict[int, str]) -> None:
+    """把這份文件實際寫進 Qdrant 的 chunk 指紋登記到跨文件索引"""
+    lineage_index.add_fingerprints([
+        (fps[i]["exact_hash"], fps[i]["simhash"], bands(fps[i]["simhash"]) if fps[i]["simhash"] is not None else None,
+         job_id, i, pid, fps[i].get("digits_hash"))
+        for i, pid in point_ids.items()
+    ])
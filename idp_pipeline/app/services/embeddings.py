@@ -1,13 +1,46 @@
-import requests
-from app.services.config import EMBED_API_URL, EMBED_TASK_DESCRIPTION, EMBED_NORMALIZE
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
+from app.services.config import EMBED_API_URL, EMBED_TASK_DESCRIPTION, EMBED_NORMALIZE, EMBED_PROFILE_PATH
+from app.services.resilience import resilient_post
+
+# EMBED_PROFILE_PATH 的快取：(mtime, 內容)；檔案改了（遷移切換 alias）下一次呼叫就換後端，不用重啟
+_PROFILE: Dict[str, Any] = {"mtime": None, "data": {}}
+_PROFILE_LOCK = threading.Lock()
+
+def _read_profiles() -> Dict[str, Any]:
+    try:
+        mtime = os.stat(EMBED_PROFILE_PATH).st_mtime
+    except FileNotFoundError:
+        return {}
+    with _PROFILE_LOCK:
+        if _PROFILE["mtime"] != mtime:
+            try:
+                with open(EMBED_PROFILE_PATH, "r", encoding="utf-8") as f:
+                    _PROFILE["data"] = json.load(f)
+            except (OSError, ValueError) as e:
+                print("[embeddings] unreadable profile", EMBED_PROFILE_PATH, repr(e))
+                _PROFILE["data"] = {}
+            _PROFILE["mtime"] = mtime
+        return _PROFILE["data"]
+
+def active_profile() -> Dict[str, Any]:
+    """
+    目前線上 collection 的 embedding 設定 {"embed_url", "task_description", "dim"}；沒有設定檔回 {}（用 env 的 EMBED_*）
+    """
+    data = _read_profiles()
+    return (data.get("collections") or {}).get(data.get("active") or "", {})
+
+def embed_texts(texts: list[str], url: Optional[str] = None, task_description: Optional[str] = None) -> list[list[float]]:
+    """url / task_description 不給就用目前線上 collection 的設定（重新 embedding 遷移會指定新的後端）"""
+    profile = active_profile() if url is None else {}
     payload = {
         "texts": texts,
-        "task_description": EMBED_TASK_DESCRIPTION,
+        "task_description": task_description or profile.get("task_description") or EMBED_TASK_DESCRIPTION,
         "normalize": EMBED_NORMALIZE,
     }
-    r = requests.post(EMBED_API_URL, json=payload, timeout=120)
-    r.raise_for_status()
+    r = resilient_post("embed", url or profile.get("embed_url") or EMBED_API_URL, json=payload, timeout=120)
     j = r.json()
     return j["embeddings"]
@@ -1,16 +1,121 @@
 import os
+import threading
+import time
 from typing import List, Dict, Any, Optional
-from neo4j import GraphDatabase
 
 NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password")
 NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+# 啟動時預先建立的連線數
+NEO4J_POOL_WARM = int(os.getenv("NEO4J_POOL_WARM", "4"))
+# 建立連線的 timeout（秒）；後端掛掉時 readiness 檢查不要卡太久
+NEO4J_CONNECT_TIMEOUT = float(os.getenv("NEO4J_CONNECT_TIMEOUT", "5"))
 
-_driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+_driver = None
+_driver_lock = threading.Lock()
+
+# constraints / indexes 是否已確認（process 內快取；連線類錯誤就失效）
+_READY: Dict[str, Any] = {"ready": False, "error": None, "checked_at": None}
+
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT document_job_id IF NOT EXISTS FOR (d:Document) REQUIRE d.job_id IS UNIQUE",
+    "CREATE CONSTRAINT chunk_job_chunk IF NOT EXISTS FOR (c:Chunk) REQUIRE (c.job_id, c.chunk_id) IS UNIQUE",
+    "CREATE INDEX document_created_at IF NOT EXISTS FOR (d:Document) ON (d.created_at)",
+    "CREATE INDEX document_filename IF NOT EXISTS FOR (d:Document) ON (d.filename)",
+    "CREATE INDEX chunk_point_id IF NOT EXISTS FOR (c:Chunk) ON (c.qdrant_point_id)",
+]
+
+def _conn_errors() -> tuple:
+    """連線類錯誤（neo4j 延後 import）"""
+    from neo4j.exceptions import DriverError, ServiceUnavailable, SessionExpired
+    return (ServiceUnavailable, SessionExpired, DriverError, OSError)
+
+def get_driver():
+    """第一次使用才建立 driver（不在 import 時建立，也不在 import 時載入 neo4j 套件）"""
+    global _driver
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                from neo4j import GraphDatabase
+                _driver = GraphDatabase.driver(
+                    NEO4J_URI,
+                    auth=(NEO4J_USER, NEO4J_PASSWORD),
+                    max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                    connection_timeout=NEO4J_CONNECT_TIMEOUT,
+                )
+    return _driver
+
+def _session():
+    return get_driver().session(database=NEO4J_DATABASE)
 
 def close_driver():
-    _driver.close()
+    global _driver
+    if _driver is not None:
+        _driver.close()
+        _driver = None
+    invalidate_readiness()
+
+def invalidate_readiness(err: Optional[BaseException] = None) -> None:
+    _READY["ready"] = False
+    _READY["error"] = f"{type(err).__name__}: {err}" if err is not None else None
+    _READY["checked_at"] = time.time()
+
+def readiness() -> Dict[str, Any]:
+    return dict(_READY)
+
+def ensure_schema() -> None:
+    """constraints / indexes（IF NOT EXISTS，可重複執行）；成功後快取"""
+    if _READY["ready"]:
+        return
+    try:
+        with _session() as session:
+            for stmt in SCHEMA_STATEMENTS:
+                session.run(stmt).consume()
+    except _conn_errors() as e:
+        invalidate_readiness(e)
+        raise
+    _READY.update({"ready": True, "error": None, "checked_at": time.time()})
+
+def warmup() -> Dict[str, Any]:
+    """
+    啟動時呼叫：確認連線、建立 schema，並預先開 NEO4J_POOL_WARM 條連線
+    （同時開多個 transaction 才會各自佔用一條連線）
+    """
+    invalidate_readiness()
+    driver = get_driver()
+    try:
+        driver.verify_connectivity()
+    except _conn_errors() as e:
+        invalidate_readiness(e)
+        raise
+    ensure_schema()
+
+    sessions, txs = [], []
+    try:
+        for _ in range(max(0, NEO4J_POOL_WARM)):
+            s = _session()
+            sessions.append(s)
+            tx = s.begin_transaction()
+            txs.append(tx)
+            tx.run("RETURN 1").consume()
+    finally:
+        for tx in txs:
+            tx.close()
+        for s in sessions:
+            s.close()
+    return readiness()
+
+def _run(q: str, **params) -> List[Dict[str, Any]]:
+    """共用執行：連線類錯誤讓 readiness 失效"""
+    ensure_schema()
+    try:
+        with _session() as session:
+            return [dict(r) for r in session.run(q, **params)]
+    except _conn_errors() as e:
+        invalidate_readiness(e)
+        raise
 
 def upsert_doc_and_chunks(
     job_id: str,
@@ -21,48 +126,48 @@ def upsert_doc_and_chunks(
 ) -> None:
     """
     Create:
-      (:Document {job_id, filename, input_path, route})
-      (:Chunk {job_id, chunk_id, text, qdrant_point_id?})
+      (:Document {job_id, filename, input_path, route, created_at})
+      (:Chunk {job_id, chunk_id, text, qdrant_point_id?, page, start, end})
       (Document)-[:HAS_CHUNK]->(Chunk)
+      (Chunk)-[:NEXT {same_page}]->(Chunk)   依 chunk_id 串起相鄰 chunk（GraphRAG 鄰居擴展用）
     """
     cypher = """
     MERGE (d:Document {job_id: $job_id})
     SET d.filename = $filename,
         d.input_path = $input_path,
-        d.route = $route
+        d.route = $route,
+        d.created_at = coalesce(d.created_at, timestamp())
 
     WITH d
     UNWIND $chunks AS c
       MERGE (ch:Chunk {job_id: $job_id, chunk_id: c.chunk_id})
       SET ch.text = c.text,
-          ch.qdrant_point_id = c.qdrant_point_id
+          ch.qdrant_point_id = c.qdrant_point_id,
+          ch.page = c.page,
+          ch.start = c.start,
+          ch.end = c.end
       MERGE (d)-[:HAS_CHUNK]->(ch)
     """
 
-    with _driver.session(database=NEO4J_DATABASE) as session:
-        session.run(
-            cypher,
-            job_id=job_id,
-            filename=filename,
-            input_path=input_path,
-            route=route,
-            chunks=chunks,
-        )
-
-def graph_find_chunks_by_keyword(keyword: str, limit: int = 5) -> List[Dict[str, Any]]:
-    """
-    Simple GraphRAG step 1: use graph to fetch related chunks by keyword.
+    next_cypher = """
+    MATCH (:Document {job_id: $job_id})-[:HAS_CHUNK]->(ch:Chunk)
+    WITH ch ORDER BY ch.chunk_id ASC
+    WITH collect(ch) AS cs
+    UNWIND range(0, size(cs) - 2) AS i
+    WITH cs[i] AS a, cs[i + 1] AS b
+    MERGE (a)-[r:NEXT]->(b)
+    SET r.same_page = (a.page IS NOT NULL AND a.page = b.page)
     """
-    cypher = """
-    MATCH (d:Document)-[:HAS_CHUNK]->(ch:Chunk)
-    WHERE toLower(ch.text) CONTAINS toLower($kw)
-    RETURN d.job_id AS job_id, d.filename AS filename,
-           ch.chunk_id AS chunk_id, ch.text AS text, ch.qdrant_point_id AS qdrant_point_id
-    LIMIT $limit
-    """
-    with _driver.session(database=NEO4J_DATABASE) as session:
-        res = session.run(cypher, kw=keyword, limit=limit)
-        return [r.data() for r in res]
+
+    _run(
+        cypher,
+        job_id=job_id,
+        filename=filename,
+        input_path=input_path,
+        route=route,
+        chunks=chunks,
+    )
+    _run(next_cypher, job_id=job_id)
 
 def graph_find_chunks_by_keyword(keyword: str, limit: int = 5) -> List[Dict[str, Any]]:
     """
@@ -71,13 +176,12 @@ def graph_find_chunks_by_keyword(keyword: str, limit: int = 5) -> List[Dict[str,
     q = """
     MATCH (d:Document)-[:HAS_CHUNK]->(c:Chunk)
     WHERE toLower(c.text) CONTAINS toLower($keyword)
-    RETURN d.filename AS filename, c.chunk_id AS chunk_id, c.text AS text, c.qdrant_point_id AS qdrant_point_id
-    ORDER BY d.created_at DESC, c.chunk_id ASC
+    RETURN d.job_id AS job_id, d.filename AS filename, c.chunk_id AS chunk_id, c.text AS text,
+           c.qdrant_point_id AS qdrant_point_id, c.page AS page, c.start AS start, c.end AS end
+    ORDER BY coalesce(d.created_at, 0) DESC, c.chunk_id ASC
     LIMIT $limit
     """
-    with _driver.session() as session:
-        rows = session.run(q, keyword=keyword, limit=limit)
-        return [dict(r) for r in rows]
+    return _run(q, keyword=keyword, limit=limit)
 
 def graph_fallback_top_chunks(limit: int = 5, filename: Optional[str] = None) -> List[Dict[str, Any]]:
     """
@@ -86,23 +190,71 @@ def graph_fallback_top_chunks(limit: int = 5, filename: Optional[str] = None) ->
     if filename:
         q = """
         MATCH (d:Document {filename: $filename})-[:HAS_CHUNK]->(c:Chunk)
-        RETURN d.filename AS filename, c.chunk_id AS chunk_id, c.text AS text, c.qdrant_point_id AS qdrant_point_id
-        ORDER BY c.chunk_id ASC
+        RETURN d.job_id AS job_id, d.filename AS filename, c.chunk_id AS chunk_id, c.text AS text,
+               c.qdrant_point_id AS qdrant_point_id, c.page AS page, c.start AS start, c.end AS end
+        ORDER BY coalesce(d.created_at, 0) DESC, c.chunk_id ASC
         LIMIT $limit
         """
         params = {"filename": filename, "limit": limit}
     else:
         q = """
-        MATCH (d:Document)-[:HAS_CHUNK]->(c:Chunk)
-        WITH d ORDER BY d.created_at DESC
+        MATCH (d:Document)
+        WHERE (d)-[:HAS_CHUNK]->(:Chunk)
+        WITH d ORDER BY coalesce(d.created_at, 0) DESC
         LIMIT 1
         MATCH (d)-[:HAS_CHUNK]->(c:Chunk)
-        RETURN d.filename AS filename, c.chunk_id AS chunk_id, c.text AS text, c.qdrant_point_id AS qdrant_point_id
+        RETURN d.job_id AS job_id, d.filename AS filename, c.chunk_id AS chunk_id, c.text AS text,
+               c.qdrant_point_id AS qdrant_point_id, c.page AS page, c.start AS start, c.end AS end
         ORDER BY c.chunk_id ASC
         LIMIT $limit
         """
         params = {"limit": limit}
 
-    with _driver.session() as session:
-        rows = session.run(q, **params)
-        return [dict(r) for r in rows]
\ No newline at end of file
+    return _run(q, **params)
+
+def graph_expand_neighbors(
+    seeds: List[Dict[str, Any]],
+    hops: int = 1,
+    same_page_only: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    沿 NEXT 邊往前後擴展 hops 步，回傳鄰居 chunk（含 seed_job_id / seed_chunk_id / distance）
+    seeds: [{"job_id":..., "chunk_id":...}, ...]
+    """
+    hops = max(1, int(hops))
+    keys = [
+        {"job_id": s["job_id"], "chunk_id": s["chunk_id"]}
+        for s in seeds
+        if s.get("job_id") is not None and s.get("chunk_id") is not None
+    ]
+    if not keys:
+        return []
+
+    # 變長路徑的上限不能用參數，hops 已轉成 int
+    q = f"""
+    UNWIND $keys AS k
+    MATCH (s:Chunk {{job_id: k.job_id, chunk_id: k.chunk_id}})
+    MATCH p = (s)-[:NEXT*1..{hops}]-(n:Chunk)
+    WHERE n <> s AND (NOT $same_page_only OR all(r IN relationships(p) WHERE r.same_page))
+    MATCH (d:Document)-[:HAS_CHUNK]->(n)
+    WITH k, d, n, min(length(p)) AS distance
+    RETURN k.job_id AS seed_job_id, k.chunk_id AS seed_chunk_id, distance,
+           d.job_id AS job_id, d.filename AS filename, n.chunk_id AS chunk_id, n.text AS text,
+           n.qdrant_point_id AS qdrant_point_id, n.page AS page, n.start AS start, n.end AS end
+    ORDER BY seed_job_id, seed_chunk_id, distance, chunk_id
+    """
+    return _run(q, keys=keys, same_page_only=same_page_only)
+
+
+def delete_doc(job_id: str) -> None:
+    """
+    刪除某個 job 的 Document 與其 Chunk（取消 / 清理用）
+    """
+    q = """
+    MATCH (c:Chunk {job_id: $job_id})
+    DETACH DELETE c
+    WITH count(*) AS _
+    MATCH (d:Document {job_id: $job_id})
+    DETACH DELETE d
+    """
+    _run(q, job_id=job_id)
@@ -0,0 +1,68 @@
+"""
+OCR / VLM 請求裡的圖片：直接吃記憶體裡的 PNG bytes（也相容檔案路徑），組 request body 時少做幾份大拷貝
+
+原本：讀檔 bytes → b64 bytes → str → data URL 字串 → json.dumps 大字串 → encode 成 body，一張圖複製 5~6 次
+這裡：b64 bytes 只做一次，JSON 其餘部分照常 dumps，最後把 b64 直接接進 body bytes（兩次拷貝）
+"""
+import base64
+import json
+import uuid
+from typing import Any, Dict, List, Union
+
+# 檔案路徑或 PNG bytes
+ImageInput = Union[str, bytes]
+
+
+class _Png:
+    __slots__ = ("data", "mime")
+
+    def __init__(self, data: bytes, mime: str):
+        self.data = data
+        self.mime = mime
+
+
+def read_image(image: ImageInput) -> bytes:
+    if isinstance(image, bytes):
+        return image
+    with open(image, "rb") as f:
+        return f.read()
+
+
+def image_label(image: ImageInput) -> str:
+    """log 用：路徑原樣印，bytes 只印大小"""
+    return image if isinstance(image, str) else f"<png {len(image)} bytes>"
+
+
+def image_part(image: ImageInput, mime: str = "image/png") -> Dict[str, Any]:
+    """OpenAI 風格 image_url content part；url 要用 chat_body() 序列化才會變成 data URL"""
+    return {"type": "image_url", "image_url": {"url": _Png(read_image(image), mime)}}
+
+
+def chat_body(payload: Dict[str, Any]) -> bytes:
+    """
+    payload → JSON body bytes（給 requests 的 data=，header 要自己帶 Content-Type）
+    圖片先用佔位字串 dumps，再把 data URL 以 bytes 接回去
+    """
+    marker = uuid.uuid4().hex
+    images: List[_Png] = []
+
+    def _default(o: Any) -> str:
+        if isinstance(o, _Png):
+            images.append(o)
+            return f"{marker}:{len(images) - 1}"
+        raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+    text = json.dumps(payload, ensure_ascii=False, default=_default).encode("utf-8")
+    if not images:
+        return text
+
+    parts: List[bytes] = []
+    rest = text
+    for k, img in enumerate(images):
+        head, rest = rest.split(f'"{marker}:{k}"'.encode("ascii"), 1)
+        parts += [head, f'"data:{img.mime};base64,'.encode("ascii"), base64.b64encode(img.data), b'"']
+    parts.append(rest)
+    return b"".join(parts)
+
+
+JSON_HEADERS = {"Content-Type": "application/json"}
@@ -0,0 +1,192 @@
+"""
+共享 job 佇列（檔案系統版）
+
+API 與 worker 透過同一個 DATA_DIR（docker volume / bind mount）溝通，不需要額外的 broker：
+
+    {DATA_DIR}/queue/pending/{ts_ns}__{job_id}     等待中的 job（檔名排序 = FIFO）
+    {DATA_DIR}/queue/claimed/{job_id}__{worker}    已被某個 worker 領走
+    {DATA_DIR}/queue/jobs/{job_id}.json            job 狀態（跨 process 共享）
+    {DATA_DIR}/queue/cancel/{job_id}               取消請求標記
+    {DATA_DIR}/queue/workers/{worker}.json         worker heartbeat
+
+claim 用 os.rename（同一個 filesystem 上是 atomic），多個 worker 搶同一筆只有一個會成功。
+"""
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from app.services.config import DATA_DIR
+
+QUEUE_DIR = os.path.join(DATA_DIR, "queue")
+PENDING_DIR = os.path.join(QUEUE_DIR, "pending")
+CLAIMED_DIR = os.path.join(QUEUE_DIR, "claimed")
+RECORDS_DIR = os.path.join(QUEUE_DIR, "jobs")
+CANCEL_DIR = os.path.join(QUEUE_DIR, "cancel")
+WORKERS_DIR = os.path.join(QUEUE_DIR, "workers")
+
+for _d in (PENDING_DIR, CLAIMED_DIR, RECORDS_DIR, CANCEL_DIR, WORKERS_DIR):
+    os.makedirs(_d, exist_ok=True)
+
+
+def _write_json_atomic(path: str, data: Dict[str, Any]) -> None:
+    # 同一個 process 裡也會有多個 thread 寫同一筆（API request / BackgroundTasks、heartbeat / job loop）
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+# =========================
+# job records
+# =========================
+def save_job_record(job: Dict[str, Any]) -> None:
+    _write_json_atomic(os.path.join(RECORDS_DIR, f"{job['job_id']}.json"), job)
+
+
+def load_job_record(job_id: str) -> Optional[Dict[str, Any]]:
+    return _read_json(os.path.join(RECORDS_DIR, f"{job_id}.json"))
+
+
+def list_job_records() -> List[Dict[str, Any]]:
+    out = []
+    for name in os.listdir(RECORDS_DIR):
+        if name.endswith(".json"):
+            rec = _read_json(os.path.join(RECORDS_DIR, name))
+            if rec is not None:
+                out.append(rec)
+    return out
+
+
+def delete_job_record(job_id: str) -> None:
+    try:
+        os.remove(os.path.join(RECORDS_DIR, f"{job_id}.json"))
+    except FileNotFoundError:
+        pass
+
+
+# =========================
+# queue
+# =========================
+def enqueue(job_id: str) -> None:
+    open(os.path.join(PENDING_DIR, f"{time.time_ns()}__{job_id}"), "w").close()
+
+
+def claim(worker_id: str) -> Optional[str]:
+    """
+    領走最舊的一筆 pending job；沒有就回傳 None
+    """
+    for name in sorted(os.listdir(PENDING_DIR)):
+        job_id = name.split("__", 1)[-1]
+        try:
+            os.rename(
+                os.path.join(PENDING_DIR, name),
+                os.path.join(CLAIMED_DIR, f"{job_id}__{worker_id}"),
+            )
+        except FileNotFoundError:
+            continue  # 被別的 worker 搶走
+        return job_id
+    return None
+
+
+def ack(job_id: str, worker_id: str) -> None:
+    try:
+        os.remove(os.path.join(CLAIMED_DIR, f"{job_id}__{worker_id}"))
+    except FileNotFoundError:
+        pass
+
+
+def pending_count() -> int:
+    return len(os.listdir(PENDING_DIR))
+
+
+def requeue_stale(stale_sec: float) -> List[str]:
+    """
+    worker 掛掉（heartbeat 超過 stale_sec 沒更新）時，把它領走的 job 放回 pending，
+    並把 job 狀態改回 queued，讓下一個 worker 重新跑
+    """
+    now = time.time()
+    requeued: List[str] = []
+    for name in os.listdir(CLAIMED_DIR):
+        job_id, _, worker_id = name.partition("__")
+        hb = os.path.join(WORKERS_DIR, f"{worker_id}.json")
+        try:
+            alive = (now - os.path.getmtime(hb)) < stale_sec
+        except FileNotFoundError:
+            alive = False
+        if alive:
+            continue
+        try:
+            os.rename(
+                os.path.join(CLAIMED_DIR, name),
+                os.path.join(PENDING_DIR, f"{time.time_ns()}__{job_id}"),
+            )
+        except FileNotFoundError:
+            continue
+        rec = load_job_record(job_id)
+        if rec and rec.get("status") == "running":
+            rec["status"] = "queued"
+            rec["stage"] = None
+            rec["error"] = f"requeued: worker {worker_id} lost"
+            rec["updated_at"] = now
+            save_job_record(rec)
+        requeued.append(job_id)
+    return requeued
+
+
+# =========================
+# cancel markers
+# =========================
+def request_cancel(job_id: str) -> None:
+    open(os.path.join(CANCEL_DIR, job_id), "w").close()
+
+
+def cancel_requested(job_id: str) -> bool:
+    return os.path.exists(os.path.join(CANCEL_DIR, job_id))
+
+
+def clear_cancel(job_id: str) -> None:
+    try:
+        os.remove(os.path.join(CANCEL_DIR, job_id))
+    except FileNotFoundError:
+        pass
+
+
+# =========================
+# heartbeat
+# =========================
+def write_heartbeat(worker_id: str, info: Dict[str, Any]) -> None:
+    _write_json_atomic(
+        os.path.join(WORKERS_DIR, f"{worker_id}.json"),
+        {**info, "worker_id": worker_id, "heartbeat_at": time.time()},
+    )
+
+
+def remove_heartbeat(worker_id: str) -> None:
+    try:
+        os.remove(os.path.join(WORKERS_DIR, f"{worker_id}.json"))
+    except FileNotFoundError:
+        pass
+
+
+def list_workers(stale_sec: float) -> List[Dict[str, Any]]:
+    now = time.time()
+    out: List[Dict[str, Any]] = []
+    for name in sorted(os.listdir(WORKERS_DIR)):
+        if not name.endswith(".json"):
+            continue
+        info = _read_json(os.path.join(WORKERS_DIR, name))
+        if not info:
+            continue
+        info["alive"] = (now - float(info.get("heartbeat_at") or 0)) < stale_sec
+        out.append(info)
+    return out
@@ -1,18 +1,27 @@
-import os, uuid, time, re
+import os, uuid, time, shutil
 from typing import Optional
 from fastapi import UploadFile
 
-from app.services.config import DATA_DIR
+from app.services.config import (
+    DATA_DIR, JOB_DEADLINE_SEC, JOB_EXECUTOR, PAGE_IMAGES_RETAIN_SEC, LOW_MEMORY_EMBED_BATCH, DEDUP_ENABLED,
+    ROUTING_ADAPTIVE, LATENCY_MODE_DEFAULT, LATENCY_BORDERLINE_MIN_RATIO, JOB_MAX_RETRIES,
+    PAGE_IMAGES_PERSIST, VLM_BATCH_SIZE, PAGE_MIN_TEXT_CHARS,
+)
 from app.services.router import choose_route
 from app.services.pdf_extract import extract_pdf_pages
 from app.services.ocr_olm import ocr_image_via_olm
-from app.services.vlm import vlm_extract_markdown
+from app.services.vlm import vlm_extract_markdown, vlm_extract_markdown_batch
 from app.services.chunker import chunk_text
 from app.services.embeddings import embed_texts
-from app.services.vstore_qdrant import ensure_collection, upsert_chunks
+from app.services.vstore_qdrant import ensure_collection, upsert_chunks, delete_job_points
 from app.services.lineage import write_lineage, build_page_info_for_pdf
-from app.services.pdf_to_images import pdf_to_pngs
-from app.services.graph_neo4j import upsert_doc_and_chunks
+from app.services.pdf_to_images import PageImages
+from app.services.graph_neo4j import upsert_doc_and_chunks, delete_doc
+from app.services.cancel import CancelToken, JobCancelled, bind_token
+from app.services.memprof import JobMemory, MemoryBudgetExceeded, job_memory
+from app.services.dedup import find_duplicates, register_fingerprints
+from app.services.speculative import race_ocr_vlm
+from app.services import checkpoints, job_queue, lineage_index, page_classify, page_router, results
 
 UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
 LINEAGE_DIR = os.path.join(DATA_DIR, "lineage")
@@ -20,8 +29,20 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(LINEAGE_DIR, exist_ok=True)
 
 _JOBS: dict[str, dict] = {}
+_TOKENS: dict[str, CancelToken] = {}
+_MEMORY: dict[str, JobMemory] = {}
+
+def _save_job(job: dict) -> None:
+    """queue 模式下 job 狀態要落地，API 與 worker 才看得到同一份"""
+    if JOB_EXECUTOR == "queue":
+        job_queue.save_job_record(job)
 
 def get_job(job_id: str) -> dict:
+    # queue 模式：不是本 process 正在跑的 job，一律以磁碟上的最新狀態為準
+    if JOB_EXECUTOR == "queue" and job_id not in _TOKENS:
+        rec = job_queue.load_job_record(job_id)
+        if rec is not None:
+            _JOBS[job_id] = rec
     if job_id not in _JOBS:
         return {
             "job_id": job_id,
@@ -30,7 +51,12 @@ def get_job(job_id: str) -> dict:
         }
     return _JOBS[job_id]
 
-async def create_job(file: UploadFile, route_hint: Optional[str] = None) -> str:
+async def create_job(
+    file: UploadFile,
+    route_hint: Optional[str] = None,
+    deadline_sec: Optional[float] = None,
+    latency_mode: Optional[bool] = None,
+) -> str:
     job_id = uuid.uuid4().hex
     filename = file.filename or f"upload_{job_id}"
     save_path = os.path.join(UPLOAD_DIR, f"{job_id}__{filename}")
@@ -45,16 +71,216 @@ async def create_job(file: UploadFile, route_hint: Optional[str] = None) -> str:
         "filename": filename,
         "path": save_path,
         "route_hint": route_hint,
+        "deadline_sec": deadline_sec if deadline_sec is not None else (JOB_DEADLINE_SEC or None),
+        "latency_mode": latency_mode if latency_mode is not None else LATENCY_MODE_DEFAULT,
         "created_at": time.time(),
     }
+    _save_job(_JOBS[job_id])
     return job_id
 
-def run_job(job_id: str) -> None:
+def create_local_job(path: str, job_id: str, filename: Optional[str] = None, route_hint: Optional[str] = None) -> dict:
+    """
+    不經上傳、直接處理本機檔案的 job（bulk ingest 用）：檔案留在原處，不複製到 UPLOAD_DIR
+    同一個 job_id 重複呼叫會重建紀錄（checkpoint 仍在，run_job 會接著跑）
+    """
+    _JOBS[job_id] = {
+        "job_id": job_id,
+        "status": "queued",
+        "filename": filename or os.path.basename(path),
+        "path": path,
+        "route_hint": route_hint,
+        "deadline_sec": JOB_DEADLINE_SEC or None,
+        "latency_mode": False,
+        "created_at": time.time(),
+    }
+    return _JOBS[job_id]
+
+def submit_job(job_id: str) -> bool:
+    """
+    queue 模式把 job 丟進共享佇列並回傳 True；
+    inline 模式回傳 False，由呼叫端自己排進 BackgroundTasks
+    """
+    if JOB_EXECUTOR != "queue":
+        return False
+    job_queue.enqueue(job_id)
+    return True
+
+def cancel_job(job_id: str) -> dict:
+    """
+    取消 job：
+    - queued：直接標記 cancelled（run_job 開始時會跳過）
+    - running：通知 token，run_job 在下一個頁/階段檢查點或外部呼叫中止後自行清理
+    - finished / failed / cancelled：不動
+    """
     job = get_job(job_id)
-    if job.get("status") in ("running", "finished"):
+    if job_id not in _JOBS:
+        return job
+
+    status = job.get("status")
+    if status == "queued":
+        if JOB_EXECUTOR == "queue":
+            # worker 可能剛好同時領走這筆並寫成 running，下面的 cancelled 會被它之後的存檔蓋回去；
+            # 標記檔讓 run_job 開跑前 / token 輪詢時一定看得到取消
+            job_queue.request_cancel(job_id)
+        job["status"] = "cancelled"
+        job["error"] = "cancelled"
+        job["stage"] = "cancelled"
+        job["updated_at"] = time.time()
+        _save_job(job)
+    elif status == "running":
+        tok = _TOKENS.get(job_id)
+        if tok is not None:
+            tok.cancel("cancelled")
+            job["cancel_requested"] = True
+            job["updated_at"] = time.time()
+            _save_job(job)
+        elif JOB_EXECUTOR == "queue":
+            # 在別的 worker process 上跑：只留標記，由那邊的 token 輪詢；
+            # job 紀錄由 worker 更新，這裡手上的是舊的副本，寫回去會蓋掉 worker 的 stage / 狀態
+            job_queue.request_cancel(job_id)
+            job = dict(job, cancel_requested=True)
+    return job
+
+def retry_job(job_id: str) -> dict:
+    """
+    失敗的 job 重新排隊；run_job 會從 checkpoint 接著跑（沒有 checkpoint 就從頭）
+    - 找不到 job → LookupError
+    - 不是 failed / 超過 JOB_MAX_RETRIES / 原始檔已被回收 → ValueError
+    呼叫端負責 submit_job 或排進 BackgroundTasks（跟建立 job 一樣）
+    """
+    job = get_job(job_id)
+    if job_id not in _JOBS:
+        raise LookupError(job_id)
+    if job.get("status") != "failed":
+        raise ValueError(f"only failed jobs can be retried (status={job.get('status')})")
+    retries = int(job.get("retries") or 0)
+    if JOB_MAX_RETRIES > 0 and retries >= JOB_MAX_RETRIES:
+        raise ValueError(f"retry limit reached ({retries}/{JOB_MAX_RETRIES})")
+    if not job.get("path") or not os.path.exists(job["path"]):
+        raise ValueError("input file no longer available")
+
+    job["status"] = "queued"
+    job["stage"] = "queued"
+    job["retries"] = retries + 1
+    job["resume_from"] = checkpoints.resume_stage(job_id)
+    job["last_error"] = job.get("error")
+    job["error"] = None
+    job["updated_at"] = time.time()
+    _save_job(job)
+    return job
+
+def _set_stage(job: dict, token: CancelToken, stage: str) -> None:
+    """進入下一個階段：更新狀態（queue 模式會落地），並檢查是否已取消"""
+    job["stage"] = stage
+    job["updated_at"] = time.time()
+    _save_job(job)
+    token.check()
+    mem = _MEMORY.get(job["job_id"])
+    if mem is not None:
+        mem.enter(stage)
+
+def _low_memory(job_id: str) -> bool:
+    mem = _MEMORY.get(job_id)
+    return mem is not None and mem.low_memory
+
+def _embed_and_upsert_batched(
+    job_id: str, token: CancelToken, chunks: list[str], per_chunk_meta: list[dict], meta: dict, indices: list[int],
+) -> list[str]:
+    """低記憶體模式：每批 embed 完立刻 upsert，不同時持有整份文件的向量"""
+    point_ids: list[str] = []
+    for b in range(0, len(chunks), LOW_MEMORY_EMBED_BATCH):
+        token.check()
+        batch = chunks[b:b + LOW_MEMORY_EMBED_BATCH]
+        vectors = embed_texts(batch)
+        point_ids += upsert_chunks(
+            chunks=batch,
+            vectors=vectors,
+            meta=meta,
+            per_chunk_meta=per_chunk_meta[b:b + LOW_MEMORY_EMBED_BATCH],
+            indices=indices[b:b + LOW_MEMORY_EMBED_BATCH],
+        )
+        del vectors
+        mem = _MEMORY.get(job_id)
+        if mem is not None:
+            mem.check()
+    return point_ids
+
+def _cleanup_partial(job_id: str, images_dir: Optional[str], wrote_points: bool, wrote_graph: bool) -> None:
+    """
+    取消 / 超時後清掉已寫出的部分結果；每一步獨立 try，清理失敗不影響狀態回報
+    """
+    if images_dir and os.path.isdir(images_dir):
+        shutil.rmtree(images_dir, ignore_errors=True)
+
+    if wrote_points:
+        try:
+            delete_job_points(job_id)
+        except Exception as e:
+            print("[run_job] cleanup qdrant failed", job_id, repr(e))
+
+    if wrote_graph:
+        try:
+            delete_doc(job_id)
+        except Exception as e:
+            print("[run_job] cleanup neo4j failed", job_id, repr(e))
+
+    checkpoints.clear(job_id)
+
+    lineage_file = os.path.join(LINEAGE_DIR, f"{job_id}.json")
+    if os.path.exists(lineage_file):
+        os.remove(lineage_file)
+    results.delete_markdown(job_id)
+    try:
+        lineage_index.delete_job(job_id)
+    except Exception as e:
+        print("[run_job] cleanup lineage index failed", job_id, repr(e))
+
+def run_job(job_id: str, stop_after: Optional[str] = None) -> None:
+    """
+    stop_after="dedup"：做完去重、存好 checkpoint 就停（status 回到 queued），
+    embedding / upsert 由呼叫端跨文件批次處理後再呼叫一次 run_job 接著跑（bulk ingest）
+    """
+    job = get_job(job_id)
+    if JOB_EXECUTOR == "queue" and job.get("status") in ("queued", "cancelled") and job_queue.cancel_requested(job_id):
+        # 排隊中就被取消（API 可能還沒把 cancelled 寫進紀錄）：不要再標成 running
+        if job.get("status") == "queued":
+            job.update(status="cancelled", error="cancelled", stage="cancelled", updated_at=time.time())
+            _save_job(job)
+        job_queue.clear_cancel(job_id)
+        return
+    if job.get("status") in ("running", "finished", "cancelled"):
         return
 
     t0 = time.time()
+    deadline_sec = job.get("deadline_sec")
+    external = (lambda: job_queue.cancel_requested(job_id)) if JOB_EXECUTOR == "queue" else None
+    token = CancelToken(job_id, deadline_at=(t0 + deadline_sec) if deadline_sec else None, external=external)
+    _TOKENS[job_id] = token
+    mem = job_memory(job_id)
+    if mem is not None:
+        _MEMORY[job_id] = mem
+    try:
+        with bind_token(token):
+            _run_job(job_id, job, token, t0, stop_after)
+    finally:
+        _TOKENS.pop(job_id, None)
+        if mem is not None:
+            job["memory"] = mem.finish()
+            _MEMORY.pop(job_id, None)
+        _save_job(job)
+        if JOB_EXECUTOR == "queue":
+            job_queue.clear_cancel(job_id)
+
+def cancel_running_jobs(reason: str) -> list[str]:
+    """取消本 process 所有進行中的 job（worker 關機逾時用）"""
+    ids = list(_TOKENS)
+    for jid in ids:
+        tok = _TOKENS.get(jid)
+        if tok is not None:
+            tok.cancel(reason)
+    return ids
+
+def _run_job(job_id: str, job: dict, token: CancelToken, t0: float, stop_after: Optional[str] = None) -> None:
 
     # ---- 基本欄位（一定存在）----
     path = job.get("path")
@@ -72,50 +298,17 @@ def run_job(job_id: str) -> None:
 
     # PDF page-level meta（用於 lineage + per-chunk meta）
     pages_meta: list[dict] = []
+    page_text_start: dict[int, int] = {}  # 每頁「內容」在 raw_text 的起訖（不含 marker）
+    page_text_end: dict[int, int] = {}
     scanned_pdf_detected: bool = False
     images_dir: Optional[str] = None
 
-    # ---- helpers（放 try 前面，避免 UnboundLocalError）----
-    MIN_TEXT_CHARS = 20
-    OCR_MIN_SCORE = 0.55
-
-    def looks_like_table(t: str) -> bool:
-        """
-        粗略判斷文字像「表格/欄位對齊」：用來決定是否強制走 VLM。
-        """
-        t = (t or "").strip()
-        if not t:
-            return False
-        lines = [ln for ln in t.splitlines() if ln.strip()]
-        if len(lines) < 4:
-            return False
-
-        # 空白對齊 / 多欄位
-        col_like = sum(1 for ln in lines if len(re.findall(r"\s{2,}", ln)) >= 2) >= 2
-        # 數字比例偏高（常見於表格）
-        digit_ratio = sum(ch.isdigit() for ch in t) / max(1, len(t))
-        return col_like and digit_ratio > 0.15
-
-    def assess_ocr_quality(text: str) -> float:
-        """
-        0~1: 越高越像正常可讀文字
-        """
-        if not text:
-            return 0.0
-        t = text.strip()
-        if not t:
-            return 0.0
-        if len(t) < 50:
-            return 0.1
-
-        bad_chars = sum(1 for ch in t if ch in {"�"} or ord(ch) < 9)
-        bad_ratio = bad_chars / max(1, len(t))
-
-        cjk = sum(1 for ch in t if "\u4e00" <= ch <= "\u9fff")
-        cjk_ratio = cjk / max(1, len(t))
-
-        score = 0.7 * (1 - bad_ratio) + 0.3 * min(1.0, cjk_ratio * 3)
-        return max(0.0, min(1.0, score))
+    # 取消時要清理哪些外部寫入
+    wrote_points = False
+    wrote_graph = False
+
+    # 記憶體量測 / 預算（沒開就是 None）
+    mem = _MEMORY.get(job_id)
 
     try:
         # ---- 讓狀態更新一定被 except 捕捉 ----
@@ -127,54 +320,96 @@ def run_job(job_id: str) -> None:
         job["lineage_path"] = None
         job["text_preview"] = None
         job["updated_at"] = time.time()
-        job["stage"] = "route"
+        _set_stage(job, token, "route")
 
         if not path or not os.path.exists(path):
             raise FileNotFoundError(f"input file not found: {path}")
 
         route = choose_route(path, filename, route_hint=route_hint)
         job["route"] = route
-        print("[run_job] start", job_id, route)
+        # 重試：有 checkpoint 的階段直接載入輸出，從第一個沒完成的階段接著跑
+        resume_from = checkpoints.resume_stage(job_id)
+        job["resume_from"] = resume_from
+        print("[run_job] start", job_id, route, f"(resume from {resume_from})" if resume_from else "")
 
         # =========================
         # 1) Extract (PDF/docling + per-page fallback)
         # =========================
-        job["stage"] = "extract"
-
-        if route == "docling":
+        _set_stage(job, token, "extract")
+
+        saved = checkpoints.load(job_id, "extract")
+        if saved is not None:
+            route = saved["route"]
+            job["route"] = route
+            raw_text = saved["raw_text"]
+            pages_meta = saved["pages_meta"]
+            page_info = saved["page_info"]
+            images_dir = saved["images_dir"]
+            page_text_start = {int(k): v for k, v in saved["page_text_start"].items()}
+            page_text_end = {int(k): v for k, v in saved["page_text_end"].items()}
+            if mem is not None and pages_meta:
+                mem.pages = len(pages_meta)
+
+        elif route == "docling":
             pages = extract_pdf_pages(path)  # [{'page':1,'text':...}, ...]
             if not pages:
                 pages = [{"page": 1, "text": ""}]
+            if mem is not None:
+                mem.pages = len(pages)
 
             # 決定是否需要把 PDF 轉圖（逐頁 OCR/VLM 需要）
-            # 規則：該頁文字太少 or 像表格 → 需要圖片做 VLM 強化
-            per_page_need_image = []
-            for p in pages:
-                base_text = (p.get("text") or "").strip()
-                need_img = (len(base_text) < MIN_TEXT_CHARS) or looks_like_table(base_text)
-                per_page_need_image.append(need_img)
+            # 規則：該頁文字太少 or 像表格 → 需要圖片做 VLM 強化（整份文件的頁面一次算完特徵）
+            page_class = page_classify.features_batch([p.get("text") or "" for p in pages])
+            per_page_need_image = [c["low_text"] or c["table"] for c in page_class]
 
-            page_imgs: list[str] = []
+            # 頁面圖片只在要送 OCR / VLM 時才渲染，bytes 直接進請求；落地只為了 lineage（PAGE_IMAGES_PERSIST）
+            page_images: Optional[PageImages] = None
             if any(per_page_need_image):
-                stem = os.path.splitext(filename)[0]
-                images_dir = os.path.join(UPLOAD_DIR, f"{job_id}__{stem}_images")
-                # pdf_to_pngs 會負責建立資料夾（你原本也這樣用）
-                page_imgs = pdf_to_pngs(path, out_dir=images_dir, dpi=200)
+                if PAGE_IMAGES_PERSIST:
+                    stem = os.path.splitext(filename)[0]
+                    images_dir = os.path.join(UPLOAD_DIR, f"{job_id}__{stem}_images")
+                page_images = PageImages(path, dpi=200, persist_dir=images_dir)
 
             # 組 raw_text（用 # Page N marker，方便 trace）
             parts: list[str] = []
             offset = 0
-            page_text_start: dict[int, int] = {}  # 每頁「內容」起始位置（不含 marker）
-            page_text_end: dict[int, int] = {}
 
             scanned_pdf_detected = False
             pages_meta = []
 
+            # 第一輪：逐頁決定路徑（docling / OCR），需要 VLM 的頁先記下來，之後批次送
+            page_results = []
+            vlm_pending: list[int] = []  # page_results 的 index
+            # 自適應路由用的頁面特徵（只有可能走 OCR 的文件才算）
+            page_feats = page_router.page_features(path) if (ROUTING_ADAPTIVE and page_images is not None) else []
+
+            def _ocr_page(img: bytes) -> tuple[str, bool, float]:
+                """(OCR 文字, 可以直接用, 品質分數)"""
+                try:
+                    text = (ocr_image_via_olm(img) or "").strip()
+                except JobCancelled:
+                    raise
+                except Exception:
+                    text = ""
+                return (text, *page_classify.ocr_verdict(text))
+
+            def _borderline(key: Optional[str]) -> bool:
+                # 沒有統計 → 無法預測，當邊界頁
+                ratio = page_router.ocr_reject_ratio(key) if key else None
+                return ratio is None or ratio >= LATENCY_BORDERLINE_MIN_RATIO
+
+            latency_mode = bool(job.get("latency_mode"))
+            speculation = {"pages": 0, "ocr_wins": 0, "vlm_wins": 0, "both_failed": 0, "discarded_calls": 0,
+                           "extra_vlm_calls": 0, "discarded_model_sec": 0.0}
+
             for idx, p in enumerate(pages):
+                token.check()
+                if mem is not None:
+                    mem.check()
                 page_no = int(p.get("page") or (idx + 1))
                 base_text = (p.get("text") or "").strip()
 
-                img_path = page_imgs[page_no - 1] if (page_imgs and page_no - 1 < len(page_imgs)) else None
+                has_img = page_images is not None and page_images.has(page_no)
                 used = "docling"
                 ocr_score = None
                 final_text = base_text
@@ -182,35 +417,134 @@ def run_job(job_id: str) -> None:
                 # 逐頁 fallback：
                 # A) base_text 太少：OCR → 品質差則 VLM
                 # B) base_text 像表格：有圖片就直接 VLM（強化表格 markdown）
-                if img_path and looks_like_table(base_text):
-                    try:
-                        final_text = (vlm_extract_markdown(img_path) or "").strip()
-                        used = "vlm"
-                    except Exception:
-                        final_text = base_text
-                        used = "docling"
-
-                elif img_path and len(base_text) < MIN_TEXT_CHARS:
+                # VLM 失敗時維持 final_text / used（docling 或 OCR 的結果）
+                need_vlm = False
+                route_key = None
+                direct_vlm = False
+                ocr_sec = 0.0
+                ocr_ok = False
+                vlm_called: Optional[bool] = None  # None = 看是否排進第二輪
+                vlm_sec = 0.0
+                if has_img and page_class[idx]["table"]:
+                    need_vlm = True
+
+                elif has_img and page_class[idx]["low_text"]:
                     scanned_pdf_detected = True
-                    ocr_text = ""
-                    try:
-                        ocr_text = (ocr_image_via_olm(img_path) or "").strip()
-                    except Exception:
-                        ocr_text = ""
-
-                    score = assess_ocr_quality(ocr_text)
-                    ocr_score = round(score, 3)
-
-                    if score < OCR_MIN_SCORE or looks_like_table(ocr_text):
-                        try:
-                            final_text = (vlm_extract_markdown(img_path) or "").strip()
-                            used = "vlm"
-                        except Exception:
-                            final_text = ocr_text
-                            used = "ocr"
-                    else:
+                    if ROUTING_ADAPTIVE:
+                        route_key = page_router.feature_key(page_feats[page_no - 1] if page_no - 1 < len(page_feats) else None, len(base_text))
+                        # 歷史上這類頁面 OCR 幾乎都被退回 → 直接 VLM（失敗時第二輪再補 OCR）
+                        direct_vlm = page_router.predict(route_key) == "vlm"
+
+                    spec = None
+                    if direct_vlm:
+                        need_vlm = True
+                    elif latency_mode and _borderline(route_key):
+                        # OCR / VLM 同時跑，取先可用的；不進第二輪批次
+                        spec = race_ocr_vlm(page_images.get(page_no), ocr_fn=ocr_image_via_olm, vlm_fn=vlm_extract_markdown, accept=page_classify.ocr_verdict)
+                        speculation["pages"] += 1
+                        speculation["discarded_calls"] += spec["discarded_calls"]
+                        speculation["extra_vlm_calls"] += int(spec["extra_vlm_call"])
+                        speculation["discarded_model_sec"] = round(speculation["discarded_model_sec"] + spec["discarded_sec"], 3)
+                        if spec["used"] is None:
+                            # 兩邊都失敗：退回序列路徑（OCR → 第二輪 VLM），跟沒開 latency mode 一樣
+                            speculation["both_failed"] += 1
+                        else:
+                            speculation[f"{spec['used']}_wins"] += 1
+                            final_text, used, ocr_score = spec["text"], spec["used"], spec["ocr_score"]
+                            ocr_sec, ocr_ok, vlm_sec = spec["ocr_sec"], spec["ocr_ok"], spec["vlm_sec"]
+                            vlm_called = not ocr_ok  # 序列路徑下會不會叫 VLM
+                            if not spec["ocr_done"]:
+                                route_key = None  # OCR 被取消，不知道結果 → 不進路由統計
+
+                    if not direct_vlm and (spec is None or spec["used"] is None):
+                        t_ocr = time.perf_counter()
+                        ocr_text, ocr_ok, score = _ocr_page(page_images.get(page_no))
+                        ocr_sec = time.perf_counter() - t_ocr
+                        ocr_score = round(score, 3)
+
                         final_text = ocr_text
                         used = "ocr"
+                        need_vlm = not ocr_ok
+
+                if need_vlm:
+                    vlm_pending.append(len(page_results))
+                elif has_img:
+                    page_images.drop(page_no)
+                page_results.append({
+                    "page": page_no,
+                    "base_text": base_text,
+                    "final_text": final_text,
+                    "used": used,
+                    "ocr_score": ocr_score,
+                    "route_key": route_key,
+                    "direct_vlm": direct_vlm,
+                    "ocr_sec": ocr_sec,
+                    "ocr_ok": ocr_ok,
+                    "vlm_called": vlm_called,
+                    "vlm_sec": vlm_sec,
+                })
+
+            # 第二輪：VLM 多頁批次（VLM_BATCH_SIZE 頁一個請求，解析失敗自動退回逐頁）
+            # 一次只渲染 / 保留一個批次的圖片，送完就釋放
+            vlm_sec_per_page = 0.0
+            vlm_sec_total = 0.0
+            for b in range(0, len(vlm_pending), max(1, VLM_BATCH_SIZE)):
+                token.check()
+                if mem is not None:
+                    mem.check()
+                group = vlm_pending[b:b + max(1, VLM_BATCH_SIZE)]
+                imgs = [page_images.get(page_results[i]["page"]) for i in group]
+                t_vlm = time.perf_counter()
+                vlm_texts = vlm_extract_markdown_batch(imgs)
+                vlm_sec_total += time.perf_counter() - t_vlm
+                for i, img, text in zip(group, imgs, vlm_texts):
+                    r = page_results[i]
+                    if text is not None:
+                        r["final_text"] = text.strip()
+                        r["used"] = "vlm"
+                    elif r["direct_vlm"]:
+                        # 直接 VLM 失敗：補跑原本的 OCR
+                        ocr_text, _, score = _ocr_page(img)
+                        r["final_text"], r["used"], r["ocr_score"] = ocr_text, "ocr", round(score, 3)
+                    page_images.drop(r["page"])
+                del imgs
+            if vlm_pending:
+                vlm_sec_per_page = vlm_sec_total / len(vlm_pending)
+            if page_images is not None:
+                page_images.close()
+
+            # 路由統計（寫不進去不影響 job）
+            if ROUTING_ADAPTIVE:
+                pending_set = set(vlm_pending)
+                for i, r in enumerate(page_results):
+                    if r["route_key"] is None:
+                        continue
+                    batched = i in pending_set
+                    try:
+                        page_router.record(
+                            r["route_key"],
+                            ocr_tried=not r["direct_vlm"],
+                            ocr_ok=r["ocr_ok"],
+                            vlm_called=r["vlm_called"] if r["vlm_called"] is not None else batched,
+                            direct_vlm=r["direct_vlm"],
+                            ocr_sec=r["ocr_sec"],
+                            vlm_sec=vlm_sec_per_page if batched else r["vlm_sec"],
+                        )
+                    except Exception as e:
+                        print("[run_job] routing stats failed", repr(e))
+                        break
+
+            if latency_mode:
+                job["speculation"] = speculation
+
+            # 第三輪：依頁序組 raw_text
+            for r in page_results:
+                page_no = r["page"]
+                base_text = r["base_text"]
+                img_path = page_images.path(page_no) if page_images is not None else None
+                final_text = r["final_text"]
+                used = r["used"]
+                ocr_score = r["ocr_score"]
 
                 # marker + content
                 marker = f"# Page {page_no}\n"
@@ -227,7 +561,7 @@ def run_job(job_id: str) -> None:
                 pages_meta.append({
                     "page": page_no,
                     "text_chars": len(content),
-                    "is_scanned": (len(base_text) < MIN_TEXT_CHARS),
+                    "is_scanned": (len(base_text) < PAGE_MIN_TEXT_CHARS),
                     "image": img_path,
                     "used_route": used,      # docling / ocr / vlm
                     "ocr_score": ocr_score,  # None or float
@@ -250,6 +584,9 @@ def run_job(job_id: str) -> None:
                         "used_route": m["used_route"],
                         "ocr_score": m["ocr_score"],
                         "chunk_ids": [],
+                        # 頁內容在完整 markdown（raw_text）的起訖，結果 API 用來切每頁文字
+                        "start": page_text_start.get(m["page"]),
+                        "end": page_text_end.get(m["page"]),
                     }
                     for m in pages_meta
                 ],
@@ -268,15 +605,31 @@ def run_job(job_id: str) -> None:
             raw_text = (vlm_extract_markdown(path) or "").strip()
 
         raw_text = raw_text or ""
+        if saved is None:
+            checkpoints.save(job_id, "extract", {
+                "route": route,
+                "raw_text": raw_text,
+                "pages_meta": pages_meta,
+                "page_info": page_info,
+                "images_dir": images_dir,
+                "page_text_start": page_text_start,
+                "page_text_end": page_text_end,
+            })
 
         # =========================
         # 2) Chunking（逐頁切片 + 產生 start/end/page）
         # =========================
-        job["stage"] = "chunking"
+        _set_stage(job, token, "chunking")
         print("[run_job] chunking...")
 
+        saved = checkpoints.load(job_id, "chunking")
+        if saved is not None:
+            chunks = saved["chunks"]
+            per_chunk_meta = saved["per_chunk_meta"]
+            page_info = saved["page_info"]
+
         # 走 docling 時：用 pages_meta 的每頁結果 chunk（page 天然正確）
-        if route in ("docling",) and pages_meta:
+        elif route in ("docling",) and pages_meta:
             # 建一個 quick lookup（page -> used_route/ocr_score/image）
             page_meta_map = {
                 m["page"]: {
@@ -343,6 +696,8 @@ def run_job(job_id: str) -> None:
         else:
             # 非 PDF/或沒有 pages_meta：當作 single page
             # 讓 page=1，start/end 用 raw_text anchor 推估
+            # used_route / ocr_score 跟 PDF 頁一樣寫進每個 chunk，/v1/search 的 used_route / ocr_score 過濾才對得上
+            single_score = round(page_classify.ocr_verdict(raw_text)[1], 3) if route == "ocr" else None
             cks = chunk_text(raw_text, chunk_size=800, overlap=120)
             cursor = 0
             for i, ck in enumerate(cks):
@@ -364,6 +719,8 @@ def run_job(job_id: str) -> None:
                     "page": 1,
                     "start": start,
                     "end": end,
+                    "used_route": route,
+                    "ocr_score": single_score,
                 })
 
             if page_info is None:
@@ -377,17 +734,21 @@ def run_job(job_id: str) -> None:
                         "is_scanned": False,
                         "image": None,
                         "used_route": route,
-                        "ocr_score": None,
+                        "ocr_score": single_score,
                         "chunk_ids": [m["chunk_id"] for m in per_chunk_meta],
                     }],
                 }
 
+        if saved is None:
+            checkpoints.save(job_id, "chunking", {"chunks": chunks, "per_chunk_meta": per_chunk_meta, "page_info": page_info})
+
         if not chunks:
             # 沒 chunk 直接結束，避免後面 embedding/upsert 空跑
             job["status"] = "finished"
             job["chunks"] = 0
             job["qdrant_points"] = 0
             job["text_preview"] = raw_text[:300]
+            results.save_markdown(job_id, raw_text)
             lineage_path = write_lineage(
                 job_id=job_id,
                 filename=filename,
@@ -398,90 +759,189 @@ def run_job(job_id: str) -> None:
                 elapsed_sec=round(time.time() - t0, 3),
                 chunks=[],
                 page_info=page_info,
+                out_dir=LINEAGE_DIR,
+                memory=mem.summary() if mem is not None else None,
             )
             job["lineage_path"] = lineage_path
             job["updated_at"] = time.time()
+            checkpoints.clear(job_id)
+            return
+
+        # =========================
+        # 3) 去重：重複 / 近似重複的 chunk 不 embed，指向 canonical 的 point
+        # =========================
+        _set_stage(job, token, "dedup")
+        fingerprints: list[dict] = []
+        dups: dict[int, dict] = {}
+        saved = checkpoints.load(job_id, "dedup")
+        if saved is not None:
+            fingerprints = saved["fingerprints"]
+            dups = {int(k): v for k, v in saved["dups"].items()}
+        else:
+            if DEDUP_ENABLED:
+                fingerprints, dups = find_duplicates(chunks, job_id)
+            checkpoints.save(job_id, "dedup", {"fingerprints": fingerprints, "dups": dups})
+
+        if stop_after == "dedup":
+            job["status"] = "queued"
+            job["chunks"] = len(chunks)
+            job["updated_at"] = time.time()
+            print("[run_job] paused after dedup", job_id)
             return
+        unique_idx = [i for i in range(len(chunks)) if i not in dups]
+        job["duplicate_chunks"] = len(dups)
 
         # =========================
-        # 3) Embedding + Qdrant upsert
+        # 4) Embedding + Qdrant upsert（只處理非重複的 chunk）
         # =========================
-        job["stage"] = "embedding"
+        _set_stage(job, token, "embedding")
         ensure_collection()
 
-        vectors = embed_texts(chunks)
+        qdrant_meta = {"job_id": job_id, "filename": filename, "route": route}
+        unique_chunks = [chunks[i] for i in unique_idx]
+        unique_meta = [per_chunk_meta[i] for i in unique_idx]
+        unique_pids: list[str] = []
+        saved = checkpoints.load(job_id, "qdrant_upsert")
+        if saved is not None:
+            unique_pids = saved["point_ids"]
+            wrote_points = True
+        elif unique_chunks and _low_memory(job_id):
+            _set_stage(job, token, "qdrant_upsert")
+            wrote_points = True
+            unique_pids = _embed_and_upsert_batched(job_id, token, unique_chunks, unique_meta, qdrant_meta, unique_idx)
+        elif unique_chunks:
+            vectors = checkpoints.load_vectors(job_id)
+            if vectors is None or len(vectors) != len(unique_chunks):
+                vectors = embed_texts(unique_chunks)
+                checkpoints.save_vectors(job_id, vectors)
+
+            _set_stage(job, token, "qdrant_upsert")
+            wrote_points = True
+            unique_pids = upsert_chunks(
+                chunks=unique_chunks,
+                vectors=vectors,
+                meta=qdrant_meta,
+                per_chunk_meta=unique_meta,
+                indices=unique_idx,
+            )
+            del vectors
+        del unique_chunks, unique_meta
 
-        job["stage"] = "qdrant_upsert"
-        point_ids = upsert_chunks(
-            chunks=chunks,
-            vectors=vectors,
-            meta={"job_id": job_id, "filename": filename, "route": route},
-            per_chunk_meta=per_chunk_meta,
-        )
+        written = dict(zip(unique_idx, unique_pids))
+        if saved is None:
+            checkpoints.save(job_id, "qdrant_upsert", {"point_ids": unique_pids})
+
+        # 重複 chunk 用 canonical 的 point id
+        point_ids = []
+        for i in range(len(chunks)):
+            d = dups.get(i)
+            if d is None:
+                point_ids.append(written.get(i))
+            elif d["scope"] == "document":
+                point_ids.append(written.get(d["chunk_id"]))
+            else:
+                point_ids.append(d["qdrant_point_id"])
 
         # =========================
-        # 4) Build chunks_payload + Neo4j
+        # 5) Build chunks_payload + Neo4j
         # =========================
-        job["stage"] = "neo4j"
-        # 保底：如果回傳點數比 chunks 少，補齊
-        if len(point_ids) < len(chunks):
-            point_ids = list(point_ids) + [None] * (len(chunks) - len(point_ids))
+        _set_stage(job, token, "neo4j")
 
         for i in range(len(chunks)):
             pid = point_ids[i]
             cm = per_chunk_meta[i]
-            chunks_payload.append({
+            item = {
                 "chunk_id": i,
                 "text": chunks[i],
                 "qdrant_point_id": (str(pid) if pid is not None else None),
                 "page": cm.get("page"),
                 "start": cm.get("start"),
                 "end": cm.get("end"),
-            })
+            }
+            if i in dups:
+                item["duplicate_of"] = dups[i]
+            chunks_payload.append(item)
 
-        upsert_doc_and_chunks(
-            job_id=job_id,
-            filename=filename,
-            input_path=path,
-            route=route or "unknown",
-            chunks=chunks_payload
-        )
+        wrote_graph = True
+        if checkpoints.load(job_id, "neo4j") is None:
+            upsert_doc_and_chunks(
+                job_id=job_id,
+                filename=filename,
+                input_path=path,
+                route=route or "unknown",
+                chunks=chunks_payload
+            )
+            checkpoints.save(job_id, "neo4j", {"chunks": len(chunks_payload)})
 
         # =========================
-        # 5) Lineage
+        # 6) Lineage
         # =========================
-        job["stage"] = "lineage"
+        _set_stage(job, token, "lineage")
         if page_info is None and path.endswith(".pdf"):
             # 你原本也有這條路徑，保留相容性
             page_info = build_page_info_for_pdf(path, images_dir=images_dir)
 
+        # 完整 markdown 落地：/v1/jobs/{id}/result/markdown 直接串流，chunk / 頁面的 start / end 都是它的 offset
+        results.save_markdown(job_id, raw_text)
         lineage_path = write_lineage(
             job_id=job_id,
             filename=filename,
             route=route or "unknown",
             input_path=path,
             chunk_count=len(chunks),
-            qdrant_points=len(point_ids),
+            qdrant_points=len(written),
             elapsed_sec=round(time.time() - t0, 3),
             chunks=chunks_payload,
             page_info=page_info,
+            include_text=not _low_memory(job_id),
+            out_dir=LINEAGE_DIR,
+            memory=mem.summary() if mem is not None else None,
         )
 
+        # 頁面圖片只在抽取階段需要；不保留就現在刪（否則交給 retention sweeper）
+        if PAGE_IMAGES_RETAIN_SEC <= 0 and images_dir and os.path.isdir(images_dir):
+            shutil.rmtree(images_dir, ignore_errors=True)
+
         # =========================
-        # 6) Done
+        # 7) Done
         # =========================
+        # 跨文件去重的指紋最後才登記：還沒完成（之後可能被取消 / 拒絕 / 失敗清掉）的 job 不能當別人的 canonical
+        if fingerprints and written:
+            register_fingerprints(job_id, fingerprints, written)
+
         job["status"] = "finished"
         job["chunks"] = len(chunks)
-        job["qdrant_points"] = len(point_ids)
+        job["qdrant_points"] = len(written)
         job["lineage_path"] = lineage_path
         job["text_preview"] = (raw_text[:300] + "...") if len(raw_text) > 300 else raw_text
         job["updated_at"] = time.time()
         job["stage"] = "finished"
+        job["resume_from"] = None
+        checkpoints.clear(job_id)
         print("[run_job] finished", job_id)
 
+    except MemoryBudgetExceeded as e:
+        # 預算超過：當成拒絕處理，清掉已寫出的部分結果（跟取消一樣）
+        _cleanup_partial(job_id, images_dir, wrote_points, wrote_graph)
+        job["status"] = "failed"
+        job["error"] = f"memory_budget_exceeded: {e}"
+        job["updated_at"] = time.time()
+        job["stage"] = "failed"
+        print("[run_job] rejected (memory budget)", job_id, str(e))
+
+    except JobCancelled as e:
+        _cleanup_partial(job_id, images_dir, wrote_points, wrote_graph)
+        job["status"] = "cancelled"
+        job["error"] = e.reason
+        job["updated_at"] = time.time()
+        job["stage"] = "cancelled"
+        print("[run_job] cancelled", job_id, e.reason)
+
     except Exception as e:
         job["status"] = "failed"
         job["error"] = f"{type(e).__name__}: {e}"
         job["updated_at"] = time.time()
         job["stage"] = "failed"
-        print("[run_job] failed", job_id, repr(e))
+        # checkpoint 留著：POST /v1/jobs/{id}/retry 從這裡接著跑
+        job["resume_from"] = checkpoints.resume_stage(job_id)
+        print("[run_job] failed", job_id, repr(e), f"(resumable from {job['resume_from']})" if job["resume_from"] else "")
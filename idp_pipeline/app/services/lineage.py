@@ -2,6 +2,7 @@
 from __future__ import annotations
 from pathlib import Path
 
+import gzip
 import json
 import os
 from datetime import datetime
@@ -98,11 +99,13 @@ def write_lineage(
     include_text: bool = True,
     preview_chars: int = 200,
     out_dir: str = "data/lineage",
+    memory: Optional[Dict[str, Any]] = None,
 ) -> str:
     """
     產生更完整的 lineage JSON：
     - chunk-level: chunk_id, qdrant_point_id, page, start/end, text_len, preview (+ text 可選)
     - page-level: page_info (由 jobs.py build_page_info() 產生的結果)
+    - memory: 各 stage 的 RSS 量測（有開 MEMPROF / 記憶體預算才有）
     """
 
     _ensure_dir(out_dir)
@@ -130,6 +133,10 @@ def write_lineage(
             "preview": _safe_preview(text, preview_chars),
         }
 
+        # 去重：這個 chunk 沒有自己的 point，qdrant_point_id 指向 canonical
+        if ch.get("duplicate_of"):
+            item["duplicate_of"] = ch["duplicate_of"]
+
         # 老師要「完整內容」→ 建議 include_text=True
         if include_text:
             item["text"] = text
@@ -148,9 +155,52 @@ def write_lineage(
         "chunks": normalized_chunks,
         "page_info": page_info,  # 你已經在 jobs.py build_page_info(...) 做好了就塞進來
     }
+    if memory is not None:
+        payload["memory"] = memory
 
     out_path = os.path.join(out_dir, f"{job_id}.json")
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(payload, f, ensure_ascii=False, indent=2)
 
+    # 查詢索引：失敗不影響 job（JSON 才是完整紀錄，之後可用 backfill script 補）
+    try:
+        from app.services.lineage_index import index_lineage
+        index_lineage(payload)
+    except Exception as e:
+        print("[lineage] index failed", job_id, repr(e))
+
+    return out_path
+
+
+def lineage_path_for(job_id: str, out_dir: str = "data/lineage") -> Optional[str]:
+    """回傳 job 的 lineage 檔（原始 .json 或壓縮後的 .json.gz），不存在回 None"""
+    for ext in (".json", ".json.gz"):
+        p = os.path.join(out_dir, f"{job_id}{ext}")
+        if os.path.exists(p):
+            return p
+    return None
+
+
+def read_lineage(path: str) -> Dict[str, Any]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compact_lineage(path: str) -> str:
+    """
+    舊 lineage 壓縮：去掉 chunk 全文（保留 preview / text_len / offset）、不縮排、gzip。
+    寫成 {job_id}.json.gz 後刪掉原檔，回傳新路徑。
+    """
+    payload = read_lineage(path)
+    for ch in payload.get("chunks") or []:
+        ch.pop("text", None)
+    payload["compacted_at"] = _now_iso()
+
+    out_path = path[: -len(".json")] + ".json.gz"
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, out_path)
+    os.remove(path)
     return out_path
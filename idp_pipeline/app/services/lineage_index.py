@@ -0,0 +1,351 @@
+"""
+lineage 的可查詢索引（SQLite，{DATA_DIR}/lineage/index.sqlite）
+
+lineage JSON 仍是完整紀錄；這裡只存查詢需要的欄位，write_lineage 寫 JSON 時順便寫入：
+
+    jobs   (job_id PK, filename, route, input_path, chunk_count, qdrant_points, elapsed_sec, created_at,
+            pages_total, pages_docling, pages_ocr, pages_vlm)
+    pages  (job_id, page) PK, used_route, ocr_score, is_scanned, text_chars, image
+    chunks (job_id, chunk_id) PK, qdrant_point_id（索引）, page, start, end, text_len, preview, duplicate_of
+    chunk_fingerprints  跨文件去重用的 chunk 指紋（exact hash + SimHash 4 個 band，見 dedup.py）
+
+- 每個 thread 一條連線；WAL 模式，API / worker 多 process 同時讀寫
+- 舊 lineage 可用 `python -m scripts.backfill_lineage_index` 補進來
+"""
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.services.config import LINEAGE_DB_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    filename TEXT,
+    route TEXT,
+    input_path TEXT,
+    chunk_count INTEGER,
+    qdrant_points INTEGER,
+    elapsed_sec REAL,
+    created_at TEXT,
+    pages_total INTEGER NOT NULL DEFAULT 0,
+    pages_docling INTEGER NOT NULL DEFAULT 0,
+    pages_ocr INTEGER NOT NULL DEFAULT 0,
+    pages_vlm INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_filename ON jobs(filename);
+
+CREATE TABLE IF NOT EXISTS pages (
+    job_id TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    used_route TEXT,
+    ocr_score REAL,
+    is_scanned INTEGER,
+    text_chars INTEGER,
+    image TEXT,
+    PRIMARY KEY (job_id, page)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS chunks (
+    job_id TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    qdrant_point_id TEXT,
+    page INTEGER,
+    start INTEGER,
+    "end" INTEGER,
+    text_len INTEGER,
+    preview TEXT,
+    PRIMARY KEY (job_id, chunk_id)
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_point ON chunks(qdrant_point_id);
+CREATE INDEX IF NOT EXISTS idx_chunks_page ON chunks(job_id, page);
+
+CREATE TABLE IF NOT EXISTS chunk_fingerprints (
+    exact_hash TEXT NOT NULL,
+    simhash INTEGER,
+    b0 INTEGER, b1 INTEGER, b2 INTEGER, b3 INTEGER,
+    job_id TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    qdrant_point_id TEXT NOT NULL,
+    digits_hash TEXT,
+    PRIMARY KEY (job_id, chunk_id)
+);
+CREATE INDEX IF NOT EXISTS idx_fp_exact ON chunk_fingerprints(exact_hash);
+CREATE INDEX IF NOT EXISTS idx_fp_b0 ON chunk_fingerprints(b0);
+CREATE INDEX IF NOT EXISTS idx_fp_b1 ON chunk_fingerprints(b1);
+CREATE INDEX IF NOT EXISTS idx_fp_b2 ON chunk_fingerprints(b2);
+CREATE INDEX IF NOT EXISTS idx_fp_b3 ON chunk_fingerprints(b3);
+"""
+
+# 舊版 DB 補欄位
+MIGRATIONS = [
+    ("chunks", "duplicate_of", "ALTER TABLE chunks ADD COLUMN duplicate_of TEXT"),
+    ("chunk_fingerprints", "digits_hash", "ALTER TABLE chunk_fingerprints ADD COLUMN digits_hash TEXT"),
+]
+
+# 同一個 band 的候選上限（大量相似樣板時避免掃太多）
+_FP_CANDIDATE_LIMIT = 200
+
+_LOCAL = threading.local()
+_SCHEMA_LOCK = threading.Lock()
+_SCHEMA_READY = False
+
+
+def _conn() -> sqlite3.Connection:
+    global _SCHEMA_READY
+    conn = getattr(_LOCAL, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(LINEAGE_DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(LINEAGE_DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _LOCAL.conn = conn
+    if not _SCHEMA_READY:
+        with _SCHEMA_LOCK:
+            if not _SCHEMA_READY:
+                conn.executescript(SCHEMA)
+                for table, col, ddl in MIGRATIONS:
+                    cols = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+                    if col not in cols:
+                        conn.execute(ddl)
+                _SCHEMA_READY = True
+    return conn
+
+
+def index_lineage(payload: Dict[str, Any]) -> None:
+    """把一份 lineage（write_lineage 的 payload 格式）寫進索引；同一個 job_id 重寫會整份覆蓋"""
+    job_id = payload["job_id"]
+    page_info = payload.get("page_info") or {}
+    pages = page_info.get("pages") or []
+    routes = [p.get("used_route") or payload.get("route") for p in pages]
+
+    conn = _conn()
+    with conn:
+        conn.execute("DELETE FROM chunks WHERE job_id = ?", (job_id,))
+        conn.execute("DELETE FROM pages WHERE job_id = ?", (job_id,))
+        conn.execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+            (
+                job_id,
+                payload.get("filename"),
+                payload.get("route"),
+                payload.get("input_path"),
+                payload.get("chunk_count"),
+                payload.get("qdrant_points"),
+                payload.get("elapsed_sec"),
+                payload.get("created_at"),
+                len(pages),
+                routes.count("docling"),
+                routes.count("ocr"),
+                routes.count("vlm"),
+            ),
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO pages VALUES (?,?,?,?,?,?,?)",
+            [
+                (
+                    job_id,
+                    p.get("page"),
+                    p.get("used_route") or payload.get("route"),
+                    p.get("ocr_score"),
+                    None if p.get("is_scanned") is None else int(bool(p.get("is_scanned"))),
+                    p.get("text_chars"),
+                    p.get("image"),
+                )
+                for p in pages
+                if p.get("page") is not None
+            ],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO chunks VALUES (?,?,?,?,?,?,?,?,?)",
+            [
+                (
+                    job_id,
+                    ch.get("chunk_id"),
+                    ch.get("qdrant_point_id"),
+                    ch.get("page"),
+                    ch.get("start"),
+                    ch.get("end"),
+                    ch.get("text_len"),
+                    ch.get("preview"),
+                    _dup_ref(ch.get("duplicate_of")),
+                )
+                for ch in payload.get("chunks") or []
+            ],
+        )
+
+
+def _dup_ref(dup: Optional[Dict[str, Any]]) -> Optional[str]:
+    """duplicate_of → "{job_id}#{chunk_id}"（文件內重複 job_id 為空字串）"""
+    if not dup:
+        return None
+    return f"{dup.get('job_id') or ''}#{dup.get('chunk_id')}"
+
+
+def delete_job(job_id: str) -> None:
+    conn = _conn()
+    with conn:
+        conn.execute("DELETE FROM chunk_fingerprints WHERE job_id = ?", (job_id,))
+        conn.execute("DELETE FROM chunks WHERE job_id = ?", (job_id,))
+        conn.execute("DELETE FROM pages WHERE job_id = ?", (job_id,))
+        conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+
+def point_source(point_id: str) -> Optional[Dict[str, Any]]:
+    """qdrant_point_id → 來源 job / 檔案 / 頁 / 頁面圖片 / 抽取路徑"""
+    row = _conn().execute(
+        """
+        SELECT c.job_id, j.filename, j.input_path, j.route AS job_route,
+               c.chunk_id, c.page, c.start, c."end", c.text_len, c.preview,
+               p.used_route, p.ocr_score, p.is_scanned, p.image
+        FROM chunks c
+        JOIN jobs j ON j.job_id = c.job_id
+        LEFT JOIN pages p ON p.job_id = c.job_id AND p.page = c.page
+        WHERE c.qdrant_point_id = ?
+        ORDER BY c.duplicate_of IS NOT NULL
+        LIMIT 1
+        """,
+        (point_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    out = dict(row)
+    out["qdrant_point_id"] = point_id
+    # 去重後多個 chunk 會共用同一個 point（canonical 排第一）
+    out["duplicates"] = _conn().execute(
+        "SELECT COUNT(*) FROM chunks WHERE qdrant_point_id = ? AND duplicate_of IS NOT NULL", (point_id,)
+    ).fetchone()[0]
+    if out["is_scanned"] is not None:
+        out["is_scanned"] = bool(out["is_scanned"])
+    return out
+
+
+def job_pages(job_id: str) -> List[Dict[str, Any]]:
+    rows = _conn().execute(
+        """
+        SELECT p.page, p.used_route, p.ocr_score, p.is_scanned, p.text_chars, p.image,
+               (SELECT COUNT(*) FROM chunks c WHERE c.job_id = p.job_id AND c.page = p.page) AS chunks
+        FROM pages p WHERE p.job_id = ? ORDER BY p.page
+        """,
+        (job_id,),
+    ).fetchall()
+    out = [dict(r) for r in rows]
+    for p in out:
+        if p["is_scanned"] is not None:
+            p["is_scanned"] = bool(p["is_scanned"])
+    return out
+
+
+def find_jobs(
+    *,
+    route: Optional[str] = None,
+    min_ratio: float = 0.0,
+    filename: Optional[str] = None,
+    limit: int = 100,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    依每頁抽取路徑的比例找 job，例如 route="vlm", min_ratio=0.5 → VLM 用在超過一半頁面的 job
+    """
+    where, params = [], []
+    if route is not None:
+        col = {"docling": "pages_docling", "ocr": "pages_ocr", "vlm": "pages_vlm"}[route]
+        where.append(f"pages_total > 0 AND {col} > ? * pages_total")
+        params.append(min_ratio)
+    if filename is not None:
+        where.append("filename = ?")
+        params.append(filename)
+    sql = "SELECT * FROM jobs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
+    rows = _conn().execute(sql, (*params, limit, offset)).fetchall()
+    return [dict(r) for r in rows]
+
+
+def route_stats() -> Dict[str, Any]:
+    """全體 job / 頁 / chunk 的彙總"""
+    conn = _conn()
+    j = conn.execute(
+        """
+        SELECT COUNT(*) AS jobs, COALESCE(SUM(pages_total), 0) AS pages,
+               COALESCE(SUM(pages_docling), 0) AS pages_docling,
+               COALESCE(SUM(pages_ocr), 0) AS pages_ocr,
+               COALESCE(SUM(pages_vlm), 0) AS pages_vlm,
+               COALESCE(SUM(chunk_count), 0) AS chunks,
+               AVG(elapsed_sec) AS avg_elapsed_sec
+        FROM jobs
+        """
+    ).fetchone()
+    by_route = conn.execute("SELECT route, COUNT(*) AS jobs FROM jobs GROUP BY route").fetchall()
+    ocr = conn.execute(
+        "SELECT AVG(ocr_score) AS avg_ocr_score, COUNT(ocr_score) AS ocr_scored_pages FROM pages"
+    ).fetchone()
+    return {**dict(j), **dict(ocr), "jobs_by_route": {r["route"]: r["jobs"] for r in by_route}}
+
+
+# =========================
+# chunk fingerprints（dedup.py）
+# =========================
+def _to_i64(h: int) -> int:
+    return h - (1 << 64) if h >= (1 << 63) else h
+
+
+def _from_i64(h: int) -> int:
+    return h + (1 << 64) if h < 0 else h
+
+
+def add_fingerprints(rows: List[Any]) -> None:
+    """rows: (exact_hash, simhash|None, bands|None, job_id, chunk_id, qdrant_point_id, digits_hash|None)"""
+    conn = _conn()
+    with conn:
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO chunk_fingerprints
+                (exact_hash, simhash, b0, b1, b2, b3, job_id, chunk_id, qdrant_point_id, digits_hash)
+            VALUES (?,?,?,?,?,?,?,?,?,?)
+            """,
+            [
+                (eh, None if sh is None else _to_i64(sh), *(bs or (None,) * 4), job_id, chunk_id, pid, dh)
+                for eh, sh, bs, job_id, chunk_id, pid, dh in rows
+            ],
+        )
+
+
+# 數字序列要相同；舊版指紋（digits_hash 為 NULL，數字被正規化成 0）只跟沒有數字的 chunk 比
+_DIGITS_MATCH = "(digits_hash = ? OR (digits_hash IS NULL AND ?))"
+
+
+def find_fingerprint_exact(
+    exact_hash: str, digits_hash: str, legacy_ok: bool, exclude_job_id: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    row = _conn().execute(
+        f"""
+        SELECT job_id, chunk_id, qdrant_point_id FROM chunk_fingerprints
+        WHERE exact_hash = ? AND {_DIGITS_MATCH} AND job_id != ? LIMIT 1
+        """,
+        (exact_hash, digits_hash, int(legacy_ok), exclude_job_id or ""),
+    ).fetchone()
+    return dict(row) if row is not None else None
+
+
+def find_fingerprint_candidates(
+    bands: List[int], digits_hash: str, legacy_ok: bool, exclude_job_id: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    rows = _conn().execute(
+        f"""
+        SELECT simhash, job_id, chunk_id, qdrant_point_id FROM chunk_fingerprints
+        WHERE (b0 = ? OR b1 = ? OR b2 = ? OR b3 = ?) AND simhash IS NOT NULL AND {_DIGITS_MATCH} AND job_id != ?
+        LIMIT ?
+        """,
+        (*bands, digits_hash, int(legacy_ok), exclude_job_id or "", _FP_CANDIDATE_LIMIT),
+    ).fetchall()
+    out = []
+    for r in rows:
+        d = dict(r)
+        d["simhash"] = _from_i64(d["simhash"])
+        out.append(d)
+    return out
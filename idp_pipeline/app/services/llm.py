@@ -1,4 +1,7 @@
-import os, requests
+import os, json
+from typing import Iterator
+
+from app.services.resilience import resilient_post
 
 LLM_API_URL = os.getenv("LLM_API_URL")  # 例如 https://ws-03.wade0426.me/v1/chat/completions
 LLM_MODEL = os.getenv("LLM_MODEL")      # 例如 /models/Qwen3-30B-A3B-Instruct-2507-FP8
@@ -12,7 +15,36 @@ def call_llm(prompt: str) -> str:
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0.2,
     }
-    r = requests.post(LLM_API_URL, json=payload, timeout=(10, 120))
-    r.raise_for_status()
+    r = resilient_post("llm", LLM_API_URL, json=payload, timeout=(10, 120))
     data = r.json()
     return data["choices"][0]["message"]["content"]
+
+
+def call_llm_stream(prompt: str) -> Iterator[str]:
+    """
+    OpenAI 風格 stream=True：逐段 yield delta.content（SSE 的 data: 行）
+    """
+    assert LLM_API_URL, "LLM_API_URL not set in .env"
+    assert LLM_MODEL, "LLM_MODEL not set in .env"
+
+    payload = {
+        "model": LLM_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.2,
+        "stream": True,
+    }
+    # 串流不重試、不 hedge（已送出的 token 收不回來），只吃 breaker
+    with resilient_post("llm_stream", LLM_API_URL, json=payload, timeout=(10, 120), stream=True, tries=1) as r:
+        for line in r.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
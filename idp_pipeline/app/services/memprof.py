@@ -0,0 +1,186 @@
+"""
+job 記憶體量測 + 記憶體預算
+
+- 每個 stage（_set_stage 切換點）記錄：RSS 起訖 / 增量、process peak RSS、耗時；
+  MEMPROF_TRACEMALLOC=true 時另外記 Python 物件配置的增量與峰值（較慢，排查用）
+- JOB_MEMORY_BUDGET_MB：job 開始後 RSS 增量超過預算時
+    - action=low_memory：切到低記憶體模式（embedding / upsert 分批、lineage 不存 chunk 全文），繼續跑；
+      低記憶體模式下增量再超過預算 2 倍才拒絕
+    - action=reject：直接丟 MemoryBudgetExceeded，job 標成 failed 並清掉部分結果（不是被 OOM kill）
+- 結果寫進 job 狀態、lineage 的 memory 欄位，並彙總到 /v1/metrics 的 memory
+
+注意：RSS 是整個 process 的值，同一 process 同時跑多個 job 時增量會互相干擾，只能當近似值。
+"""
+import gc
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from app.services import metrics
+from app.services.config import (
+    MEMPROF_ENABLED,
+    MEMPROF_TRACEMALLOC,
+    JOB_MEMORY_BUDGET_MB,
+    JOB_MEMORY_BUDGET_ACTION,
+)
+
+_MB = 1024 * 1024
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    pass
+
+
+def rss_mb() -> float:
+    """目前 RSS（Linux 讀 /proc；其他平台退回 peak）"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / _MB
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位是 KB，macOS 是 bytes
+    return peak / _MB if sys.platform == "darwin" else peak / 1024
+
+
+_TRACE_LOCK = threading.Lock()
+_TRACE_USERS = 0
+
+
+def _trace_start() -> None:
+    global _TRACE_USERS
+    with _TRACE_LOCK:
+        if _TRACE_USERS == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _TRACE_USERS += 1
+
+
+def _trace_stop() -> None:
+    global _TRACE_USERS
+    with _TRACE_LOCK:
+        _TRACE_USERS -= 1
+        if _TRACE_USERS == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+class JobMemory:
+    def __init__(self, job_id: str, budget_mb: float = JOB_MEMORY_BUDGET_MB, action: str = JOB_MEMORY_BUDGET_ACTION):
+        self.job_id = job_id
+        self.budget_mb = budget_mb
+        self.action = action
+        self.low_memory = False
+        self.pages: Optional[int] = None
+        self.baseline_mb = rss_mb()
+        self.max_delta_mb = 0.0
+        self.stages: List[Dict[str, Any]] = []
+        self._cur: Optional[Dict[str, Any]] = None
+        self._trace = MEMPROF_TRACEMALLOC
+        if self._trace:
+            _trace_start()
+
+    def enter(self, stage: str) -> None:
+        """結束上一個 stage 的量測，開始下一個"""
+        self._close()
+        self._cur = {"stage": stage, "t0": time.perf_counter(), "rss_start_mb": rss_mb()}
+        if self._trace:
+            self._cur["alloc_start"] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.check()
+
+    def _close(self) -> None:
+        cur, self._cur = self._cur, None
+        if cur is None:
+            return
+        end = rss_mb()
+        rec = {
+            "stage": cur["stage"],
+            "sec": round(time.perf_counter() - cur["t0"], 3),
+            "rss_start_mb": round(cur["rss_start_mb"], 1),
+            "rss_end_mb": round(end, 1),
+            "rss_delta_mb": round(end - cur["rss_start_mb"], 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+        if self._trace:
+            now, peak = tracemalloc.get_traced_memory()
+            rec["alloc_delta_mb"] = round((now - cur["alloc_start"]) / _MB, 2)
+            rec["alloc_peak_mb"] = round((peak - cur["alloc_start"]) / _MB, 2)
+        self.stages.append(rec)
+        metrics.set_gauge("job_stage_rss_delta_mb", rec["rss_delta_mb"], stage=rec["stage"])
+
+    def check(self) -> None:
+        """檢查 RSS 增量是否超過預算（stage 切換與逐頁處理時呼叫）"""
+        delta = rss_mb() - self.baseline_mb
+        self.max_delta_mb = max(self.max_delta_mb, delta)
+        if self.budget_mb <= 0 or delta <= self.budget_mb:
+            return
+        if self.low_memory and delta <= self.budget_mb * 2:
+            return
+        stage = self._cur["stage"] if self._cur else None
+        if self.action == "low_memory" and not self.low_memory:
+            self.low_memory = True
+            gc.collect()
+            metrics.inc("job_memory_low_memory_switch_total")
+            print(f"[memprof] {self.job_id} +{delta:.0f}MB > budget {self.budget_mb:.0f}MB at {stage}, switching to low-memory mode")
+            return
+        metrics.inc("job_memory_budget_exceeded_total")
+        raise MemoryBudgetExceeded(
+            f"memory budget exceeded at stage {stage}: +{delta:.0f}MB > {self.budget_mb:.0f}MB"
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        stages = list(self.stages)
+        heaviest = max(stages, key=lambda s: s["rss_delta_mb"])["stage"] if stages else None
+        if self._cur is not None:
+            stages.append({"stage": self._cur["stage"], "rss_start_mb": round(self._cur["rss_start_mb"], 1), "open": True})
+        out = {
+            "baseline_rss_mb": round(self.baseline_mb, 1),
+            "max_rss_delta_mb": round(self.max_delta_mb, 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "budget_mb": self.budget_mb or None,
+            "low_memory": self.low_memory,
+            "pages": self.pages,
+            "heaviest_stage": heaviest,
+            "stages": stages,
+        }
+        if self.pages:
+            out["rss_delta_mb_per_page"] = round(self.max_delta_mb / self.pages, 2)
+        return out
+
+    def finish(self) -> Dict[str, Any]:
+        self._close()
+        if self._trace:
+            _trace_stop()
+            self._trace = False
+        s = self.summary()
+        _RECENT.append({"job_id": self.job_id, **{k: v for k, v in s.items() if k != "stages"}})
+        return s
+
+
+def job_memory(job_id: str) -> Optional[JobMemory]:
+    """量測與預算都沒開就回 None（不額外花成本）"""
+    if not MEMPROF_ENABLED and JOB_MEMORY_BUDGET_MB <= 0:
+        return None
+    return JobMemory(job_id)
+
+
+_RECENT: deque = deque(maxlen=50)
+
+
+def _collect() -> Dict[str, Any]:
+    return {
+        "process_rss_mb": round(rss_mb(), 1),
+        "process_peak_rss_mb": round(peak_rss_mb(), 1),
+        "recent_jobs": list(_RECENT),
+    }
+
+
+metrics.register_collector("memory", _collect)
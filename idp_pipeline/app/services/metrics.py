@@ -0,0 +1,47 @@
+"""
+極簡 in-process metrics（GET /v1/metrics 以 JSON 輸出）：
+
+- inc(name, **labels)：計數器
+- set_gauge(name, value, **labels)：目前值
+- register_collector(name, fn)：輸出時才呼叫 fn() 取得動態狀態（例如 circuit breaker）
+"""
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict
+
+_LOCK = threading.Lock()
+_COUNTERS: Dict[str, float] = defaultdict(float)
+_GAUGES: Dict[str, float] = {}
+_COLLECTORS: Dict[str, Callable[[], Any]] = {}
+
+
+def _key(name: str, labels: Dict[str, Any]) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+    return f"{name}{{{inner}}}"
+
+
+def inc(name: str, value: float = 1.0, **labels: Any) -> None:
+    with _LOCK:
+        _COUNTERS[_key(name, labels)] += value
+
+
+def set_gauge(name: str, value: float, **labels: Any) -> None:
+    with _LOCK:
+        _GAUGES[_key(name, labels)] = value
+
+
+def register_collector(name: str, fn: Callable[[], Any]) -> None:
+    _COLLECTORS[name] = fn
+
+
+def snapshot() -> Dict[str, Any]:
+    with _LOCK:
+        out: Dict[str, Any] = {"counters": dict(_COUNTERS), "gauges": dict(_GAUGES)}
+    for name, fn in list(_COLLECTORS.items()):
+        try:
+            out[name] = fn()
+        except Exception as e:
+            out[name] = {"error": f"{type(e).__name__}: {e}"}
+    return out
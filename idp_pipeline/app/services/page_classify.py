@@ -0,0 +1,152 @@
+"""
+頁面分類：run_job 決定每頁走 docling / OCR / VLM 用的文字特徵與門檻
+
+原本 looks_like_table / assess_ocr_quality 每頁各自做好幾次逐字元的 Python 迴圈 + 每行 regex，OCR 輸出還要再算一遍。
+這裡一次算完所有特徵，而且整份文件的頁面一起向量化（numpy）：
+
+- features_batch(texts)：所有頁面接成一個 codepoint 陣列，數字 / CJK / 亂碼字元、非空行數、
+  「有 2 段以上連續空白」的行數（欄位對齊）都用陣列運算 + bincount 依頁加總
+- 字元分類（isdigit / isspace / 換行 / CJK / 亂碼）查一張 BMP 旗標表，結果跟原本逐字元的版本一致
+- 門檻在 config.py（PAGE_* / OCR_* / TABLE_*），python -m scripts.bench_page_classify 比較速度與一致性
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+
+from app.services.config import (
+    PAGE_MIN_TEXT_CHARS, OCR_MIN_SCORE, OCR_SHORT_TEXT_CHARS,
+    TABLE_MIN_LINES, TABLE_MIN_COLUMN_LINES, TABLE_MIN_DIGIT_RATIO,
+)
+
+# str.splitlines 會切的字元
+_LINE_BREAKS = frozenset("\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029")
+_BAD_CHAR = 0xFFFD
+
+
+# 每個 BMP 字元一個 byte 的旗標表（第一次用到才建，約 20ms）；BMP 以外的字元逐個判斷
+_DIGIT, _SPACE, _BREAK, _CJK, _BAD = 1, 2, 4, 8, 16
+_BMP_FLAGS = None
+
+
+def _flags_of(ch: str) -> int:
+    c = ord(ch)
+    return (
+        (_DIGIT if ch.isdigit() else 0)
+        | (_SPACE if ch.isspace() else 0)
+        | (_BREAK if ch in _LINE_BREAKS else 0)
+        | (_CJK if 0x4E00 <= c <= 0x9FFF else 0)
+        | (_BAD if c == _BAD_CHAR or c < 9 else 0)
+    )
+
+
+def _flags(cp):
+    """codepoint 陣列 → 旗標陣列（uint8）"""
+    global _BMP_FLAGS
+    import numpy as np
+
+    if _BMP_FLAGS is None:
+        _BMP_FLAGS = np.fromiter((_flags_of(chr(c)) for c in range(0x10000)), dtype=np.uint8, count=0x10000)
+    flags = _BMP_FLAGS[np.minimum(cp, 0xFFFF)]
+    astral = np.flatnonzero(cp > 0xFFFF)
+    if astral.size:
+        flags[astral] = [_flags_of(chr(c)) for c in cp[astral].tolist()]
+    return flags
+
+
+def features_batch(texts: Sequence[str]) -> List[Dict[str, Any]]:
+    """
+    每頁文字（會先 strip）→ 特徵 + 分類結果：
+    chars / digits / cjk / bad / lines（非空行）/ column_lines（2 段以上連續空白的行）/ *_ratio，
+    以及 table / quality / low_text（見 classify）
+    """
+    import numpy as np
+
+    stripped = [(t or "").strip() for t in texts]
+    n = len(stripped)
+    if n == 0:
+        return []
+
+    # 頁與頁之間用 "\n" 隔開：對行的計算來說就是換行，不會算進任何頁的字數
+    # surrogatepass：PDF 抽取 / JSON \udXXX 解出來的孤立 surrogate 照樣當一個字元算，不 raise
+    cp = np.frombuffer("\n".join(stripped).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    lengths = np.fromiter((len(s) for s in stripped), dtype=np.int64, count=n)
+    page_of = np.repeat(np.arange(n), lengths + 1)[:cp.size]
+
+    flags = _flags(cp)
+    digit, space, brk = (flags & _DIGIT) != 0, (flags & _SPACE) != 0, (flags & _BREAK) != 0
+    cjk, bad = (flags & _CJK) != 0, (flags & _BAD) != 0
+
+    def per_page(mask) -> "np.ndarray":
+        return np.bincount(page_of[mask], minlength=n)
+
+    # 非空行：含有非空白字元的行
+    line_id = np.cumsum(brk)
+    solid = ~space
+    ids, pages = line_id[solid], page_of[solid]
+    first = np.ones(ids.size, dtype=bool)
+    first[1:] = ids[1:] != ids[:-1]
+    lines = np.bincount(pages[first], minlength=n)
+
+    # 行內連續空白（長度 >= 2）的段數，一行有 2 段以上算欄位對齊
+    inline = space & ~brk
+    prev = np.zeros_like(inline)
+    prev[1:] = inline[:-1]
+    nxt = np.zeros_like(inline)
+    nxt[:-1] = inline[1:]
+    run_start = np.flatnonzero(inline & ~prev)
+    run_end = np.flatnonzero(inline & ~nxt)
+    long_runs = run_start[(run_end - run_start) >= 1]
+    column_lines = np.zeros(n, dtype=np.int64)
+    if long_runs.size:
+        _, first_idx, counts = np.unique(line_id[long_runs], return_index=True, return_counts=True)
+        column_lines = np.bincount(page_of[long_runs[first_idx[counts >= 2]]], minlength=n)
+
+    out = []
+    for i, (d, c, b, ln, col) in enumerate(zip(
+        per_page(digit).tolist(), per_page(cjk).tolist(), per_page(bad).tolist(), lines.tolist(), column_lines.tolist(),
+    )):
+        chars = int(lengths[i])
+        denom = max(1, chars)
+        f = {
+            "chars": chars,
+            "digits": d,
+            "cjk": c,
+            "bad": b,
+            "lines": ln,
+            "column_lines": col,
+            "digit_ratio": d / denom,
+            "cjk_ratio": c / denom,
+            "bad_ratio": b / denom,
+        }
+        f.update(classify(f))
+        out.append(f)
+    return out
+
+
+def features(text: str) -> Dict[str, Any]:
+    return features_batch([text])[0]
+
+
+def classify(f: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    - table：像表格 / 欄位對齊（行數夠、多行有欄位空白、數字比例偏高）→ 強制走 VLM
+    - quality：0~1，越高越像正常可讀文字（亂碼字元少、CJK 比例）
+    - low_text：可選文字太少 → 需要 OCR / VLM
+    """
+    table = (
+        f["lines"] >= TABLE_MIN_LINES
+        and f["column_lines"] >= TABLE_MIN_COLUMN_LINES
+        and f["digit_ratio"] > TABLE_MIN_DIGIT_RATIO
+    )
+    if f["chars"] == 0:
+        quality = 0.0
+    elif f["chars"] < OCR_SHORT_TEXT_CHARS:
+        quality = 0.1
+    else:
+        quality = 0.7 * (1 - f["bad_ratio"]) + 0.3 * min(1.0, f["cjk_ratio"] * 3)
+        quality = max(0.0, min(1.0, quality))
+    return {"table": table, "quality": quality, "low_text": f["chars"] < PAGE_MIN_TEXT_CHARS}
+
+
+def ocr_verdict(text: str) -> Tuple[bool, float]:
+    """OCR 輸出 → (可以直接用, 品質分數)：品質過門檻且不像表格"""
+    f = features(text)
+    return f["quality"] >= OCR_MIN_SCORE and not f["table"], f["quality"]
@@ -0,0 +1,193 @@
+"""
+逐頁路由：依歷史結果決定低文字頁要先 OCR 還是直接 VLM
+
+固定的 fallback 鏈（OCR → 品質差 → VLM）在某些文件上幾乎每頁都會走到 VLM，等於每頁付兩次模型呼叫。
+這裡依便宜的頁面特徵分桶，累積每桶的結果統計：
+
+    key = producer | 文字密度桶 | 圖片覆蓋率桶
+    stats = pages / ocr_ok（OCR 過關）/ vlm_after_ocr（OCR 被退回再叫 VLM）/ direct_vlm / 各自的累積延遲
+
+- 某桶樣本 >= ROUTING_MIN_SAMPLES 且「OCR 被退回」比例 >= ROUTING_VLM_DIRECT_RATIO → 直接 VLM
+- 樣本不夠 / 找不到桶 → 維持原本的啟發式規則
+- ROUTING_EXPLORE_RATE 的機率照舊先跑 OCR，統計才會跟著模型表現更新
+
+統計存在 {DATA_DIR}/routing_stats.sqlite（多個 worker process 共用）。
+"""
+import os
+import random
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.services import metrics
+from app.services.config import (
+    ROUTING_ADAPTIVE,
+    ROUTING_DB_PATH,
+    ROUTING_MIN_SAMPLES,
+    ROUTING_VLM_DIRECT_RATIO,
+    ROUTING_EXPLORE_RATE,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS route_stats (
+    feature_key TEXT PRIMARY KEY,
+    pages INTEGER NOT NULL DEFAULT 0,
+    ocr_tried INTEGER NOT NULL DEFAULT 0,
+    ocr_ok INTEGER NOT NULL DEFAULT 0,
+    vlm_after_ocr INTEGER NOT NULL DEFAULT 0,
+    direct_vlm INTEGER NOT NULL DEFAULT 0,
+    ocr_sec REAL NOT NULL DEFAULT 0,
+    vlm_sec REAL NOT NULL DEFAULT 0,
+    vlm_calls INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_LOCAL = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_LOCAL, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(ROUTING_DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(ROUTING_DB_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        _LOCAL.conn = conn
+    return conn
+
+
+# =========================
+# features
+# =========================
+def _density_bucket(chars: int) -> str:
+    if chars == 0:
+        return "t0"
+    if chars < 20:
+        return "t20"
+    if chars < 200:
+        return "t200"
+    return "tmany"
+
+
+def _coverage_bucket(ratio: Optional[float]) -> str:
+    if ratio is None:
+        return "cunk"
+    if ratio < 0.1:
+        return "c10"
+    if ratio < 0.6:
+        return "c60"
+    return "cfull"
+
+
+def _producer(meta: Dict[str, Any]) -> str:
+    # "Microsoft® Word 2016" / "Canon iR-ADV C5535" → 取第一個字，避免版本號讓桶太碎
+    raw = (meta.get("producer") or meta.get("creator") or "").strip().lower()
+    return (raw.split() or ["unknown"])[0][:32]
+
+
+def page_features(pdf_path: str) -> List[Dict[str, Any]]:
+    """每頁的 producer / 圖片覆蓋率（PyMuPDF，不用渲染）；失敗回空 list"""
+    try:
+        import fitz
+    except Exception:
+        return []
+    out: List[Dict[str, Any]] = []
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception:
+        return []
+    try:
+        producer = _producer(doc.metadata or {})
+        for page in doc:
+            area = abs(page.rect) or 1.0
+            covered = 0.0
+            for info in page.get_image_info():
+                covered += abs(fitz.Rect(info["bbox"]) & page.rect)
+            out.append({"producer": producer, "image_coverage": round(min(1.0, covered / area), 3)})
+    finally:
+        doc.close()
+    return out
+
+
+def feature_key(features: Optional[Dict[str, Any]], text_chars: int) -> str:
+    f = features or {}
+    return "|".join([f.get("producer", "unknown"), _density_bucket(text_chars), _coverage_bucket(f.get("image_coverage"))])
+
+
+# =========================
+# policy
+# =========================
+def _load(key: str) -> Optional[sqlite3.Row]:
+    return _conn().execute("SELECT * FROM route_stats WHERE feature_key = ?", (key,)).fetchone()
+
+
+def ocr_reject_ratio(key: str) -> Optional[float]:
+    """
+    這類頁面 OCR 被退回（改叫 VLM）的比例；樣本不夠回 None
+    先查完整 key，樣本不夠再退到不含 producer 的 key
+    """
+    _, rest = key.split("|", 1)
+    for k in (key, f"*|{rest}"):
+        row = _load(k)
+        if row is None or row["ocr_tried"] < ROUTING_MIN_SAMPLES:
+            continue
+        return row["vlm_after_ocr"] / row["ocr_tried"]
+    return None
+
+
+def predict(key: str) -> Optional[str]:
+    """回傳 "vlm"（跳過 OCR 直接 VLM）或 None（照原本規則：先 OCR）"""
+    if not ROUTING_ADAPTIVE or random.random() < ROUTING_EXPLORE_RATE:
+        return None
+    ratio = ocr_reject_ratio(key)
+    if ratio is not None and ratio >= ROUTING_VLM_DIRECT_RATIO:
+        return "vlm"
+    return None
+
+
+def record(key: str, *, ocr_tried: bool, ocr_ok: bool, vlm_called: bool, direct_vlm: bool,
+           ocr_sec: float = 0.0, vlm_sec: float = 0.0) -> None:
+    """記一頁的結果；同時累加到完整 key 與不含 producer 的 key"""
+    vlm_after_ocr = ocr_tried and vlm_called
+    _, rest = key.split("|", 1)
+    conn = _conn()
+    with conn:
+        for k in (key, f"*|{rest}"):
+            conn.execute(
+                """
+                INSERT INTO route_stats (feature_key, pages, ocr_tried, ocr_ok, vlm_after_ocr, direct_vlm, ocr_sec, vlm_sec, vlm_calls)
+                VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(feature_key) DO UPDATE SET
+                    pages = pages + 1,
+                    ocr_tried = ocr_tried + excluded.ocr_tried,
+                    ocr_ok = ocr_ok + excluded.ocr_ok,
+                    vlm_after_ocr = vlm_after_ocr + excluded.vlm_after_ocr,
+                    direct_vlm = direct_vlm + excluded.direct_vlm,
+                    ocr_sec = ocr_sec + excluded.ocr_sec,
+                    vlm_sec = vlm_sec + excluded.vlm_sec,
+                    vlm_calls = vlm_calls + excluded.vlm_calls
+                """,
+                (k, int(ocr_tried), int(ocr_ok), int(vlm_after_ocr), int(direct_vlm), ocr_sec, vlm_sec, int(vlm_called)),
+            )
+    if vlm_after_ocr:
+        metrics.inc("routing_double_call_total")
+    elif direct_vlm:
+        metrics.inc("routing_direct_vlm_total")
+    elif ocr_tried:
+        metrics.inc("routing_ocr_only_total")
+
+
+def stats() -> List[Dict[str, Any]]:
+    rows = _conn().execute("SELECT * FROM route_stats ORDER BY pages DESC").fetchall()
+    out = []
+    for r in rows:
+        d = dict(r)
+        d["double_call_rate"] = round(d["vlm_after_ocr"] / d["ocr_tried"], 3) if d["ocr_tried"] else None
+        d["avg_ocr_sec"] = round(d["ocr_sec"] / d["ocr_tried"], 3) if d["ocr_tried"] else None
+        d["avg_vlm_sec"] = round(d["vlm_sec"] / d["vlm_calls"], 3) if d["vlm_calls"] else None
+        d["policy"] = "vlm" if (
+            d["ocr_tried"] >= ROUTING_MIN_SAMPLES and d["vlm_after_ocr"] / d["ocr_tried"] >= ROUTING_VLM_DIRECT_RATIO
+        ) else "ocr_first"
+        out.append(d)
+    return out
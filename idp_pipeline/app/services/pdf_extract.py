@@ -1,6 +1,6 @@
-from pypdf import PdfReader
-
 def extract_pdf_text(pdf_path: str) -> str:
+    from pypdf import PdfReader  # 延後 import，加快啟動
+
     reader = PdfReader(pdf_path)
     texts = []
     for i, page in enumerate(reader.pages):
@@ -31,6 +31,8 @@ def extract_pdf_pages(pdf_path: str) -> list[dict]:
         {"page": 2, "text": "..."},
       ]
     """
+    from pypdf import PdfReader
+
     reader = PdfReader(pdf_path)
     out = []
     for i, page in enumerate(reader.pages, start=1):
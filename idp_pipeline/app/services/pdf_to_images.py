@@ -1,11 +1,12 @@
 import os
-import fitz  # PyMuPDF
 
 def pdf_first_page_to_png(pdf_path: str, out_dir: str, dpi: int = 200) -> str:
     """
     Convert the first page of a PDF into a PNG image.
     Returns the output image path.
     """
+    import fitz  # PyMuPDF（延後 import，加快啟動）
+
     os.makedirs(out_dir, exist_ok=True)
     doc = fitz.open(pdf_path)
     page = doc.load_page(0)
@@ -38,4 +39,61 @@ def pdf_to_pngs(pdf_path: str, out_dir: str, dpi: int = 200) -> list[str]:
         paths.append(out_path)
 
     doc.close()
-    return paths
\ No newline at end of file
+    return paths
+
+class PageImages:
+    """
+    逐頁渲染、以 PNG bytes 交給 OCR / VLM（不經磁碟）：
+    - get(page_no)：第一次要才渲染，之後用快取；drop(page_no) 用完釋放，記憶體只留還沒送出的頁
+    - persist_dir 有給時渲染當下把同一份 bytes 寫成 page_{n}.png（lineage 追溯用，pipeline 不會讀回）
+    """
+
+    def __init__(self, pdf_path: str, dpi: int = 200, persist_dir: str | None = None):
+        try:
+            import fitz  # PyMuPDF
+        except Exception as e:
+            raise RuntimeError("Missing dependency: PyMuPDF (fitz). Install: pip install pymupdf") from e
+
+        self.dpi = dpi
+        self.persist_dir = persist_dir
+        self._doc = fitz.open(pdf_path)
+        self.page_count = self._doc.page_count
+        self._cache: dict[int, bytes] = {}
+        self._paths: dict[int, str] = {}
+        self.rendered = 0
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+
+    def has(self, page_no: int) -> bool:
+        return 1 <= page_no <= self.page_count
+
+    def get(self, page_no: int) -> bytes:
+        data = self._cache.get(page_no)
+        if data is not None:
+            return data
+        if self._doc is None:
+            raise RuntimeError("PageImages already closed")
+        pix = self._doc.load_page(page_no - 1).get_pixmap(dpi=self.dpi)
+        data = pix.tobytes("png")
+        del pix
+        self.rendered += 1
+        if self.persist_dir and page_no not in self._paths:
+            out_path = os.path.join(self.persist_dir, f"page_{page_no}.png")
+            with open(out_path, "wb") as f:
+                f.write(data)
+            self._paths[page_no] = out_path
+        self._cache[page_no] = data
+        return data
+
+    def path(self, page_no: int) -> str | None:
+        """已落地的圖片路徑（沒渲染過 / 不落地 → None）"""
+        return self._paths.get(page_no)
+
+    def drop(self, page_no: int) -> None:
+        self._cache.pop(page_no, None)
+
+    def close(self) -> None:
+        self._cache.clear()
+        if self._doc is not None:
+            self._doc.close()
+            self._doc = None
@@ -0,0 +1,359 @@
+"""
+換 embedding 模型 / 維度不用重跑 OCR / VLM：把 Qdrant 裡存的 chunk 文字重新 embedding 到新 collection，再原子切換 alias
+
+    1. copy     掃舊 collection（payload 的 text；沒有就從 lineage JSON 找），節流批次 embed，寫進新 collection（point id / payload 不變）
+    2. catchup  遷移期間線上 job 仍寫舊 collection：依 ingested_at 補抄上一輪開始後寫入的 point，直到一輪只剩少量
+    3. switch   alias QDRANT_COLLECTION 改指新 collection（Qdrant 同一個請求內刪 / 建 alias，搜尋不中斷），
+                同時更新 EMBED_PROFILE_PATH，API / worker 下一次 embed 就改用新後端
+    4. final    再補抄一次切換前最後寫進舊 collection 的 point；--drop-old 才刪舊 collection（否則留著可切回去）
+
+進度存在 {REEMBED_DIR}/{target}.json（每批更新）：中斷後 --resume <target> 從上次的 scroll 位置接著跑。
+
+限制：
+- 切換的瞬間（alias 與 profile 檔之間，毫秒級）查詢可能用到不同模型的向量；切換前後正在 embed 的 job 可能把舊模型向量寫進新 collection，
+  遷移時建議暫停 worker（或事後對那段時間的 job 重跑）
+- 舊部署的實體 collection 名稱就是 QDRANT_COLLECTION（沒有 alias）：alias 不能跟 collection 同名，
+  需要 --replace-legacy 刪掉舊 collection 再建 alias，中間有短暫空窗；之後的遷移都是無中斷切換
+- 遷移期間被刪除的 point（取消 / 清理）不會同步到新 collection
+"""
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.config import (
+    DATA_DIR, QDRANT_COLLECTION, EMBED_API_URL, EMBED_TASK_DESCRIPTION, EMBED_PROFILE_PATH,
+    REEMBED_DIR, REEMBED_BATCH, REEMBED_MAX_CHUNKS_PER_SEC, REEMBED_CATCHUP_MARGIN_SEC,
+)
+from app.services.embeddings import active_profile, embed_texts
+from app.services.lineage import lineage_path_for, read_lineage
+from app.services.vstore_qdrant import (
+    aliases, build_filter, collection_create_kwargs, ensure_payload_indexes, get_client, invalidate_readiness, scroll_points, switch_alias,
+)
+
+# 追補到一輪少於這麼多 point 就切換
+CATCHUP_DONE_POINTS = 200
+CATCHUP_MAX_PASSES = 5
+
+
+def _state_path(target: str) -> str:
+    return os.path.join(REEMBED_DIR, f"{target}.json")
+
+
+def load_state(target: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_state_path(target), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_state(state: Dict[str, Any]) -> None:
+    os.makedirs(REEMBED_DIR, exist_ok=True)
+    path = _state_path(state["target"])
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({**state, "updated_at": time.time()}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _write_profile(collection: str, profile: Dict[str, Any]) -> None:
+    """EMBED_PROFILE_PATH：各 collection 的 embedding 設定 + 目前線上的是哪個"""
+    data: Dict[str, Any] = {}
+    try:
+        with open(EMBED_PROFILE_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        pass
+    data.setdefault("collections", {})[collection] = profile
+    data["active"] = collection
+    os.makedirs(os.path.dirname(EMBED_PROFILE_PATH) or ".", exist_ok=True)
+    tmp = EMBED_PROFILE_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, EMBED_PROFILE_PATH)
+
+
+def _known_profile(collection: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(EMBED_PROFILE_PATH, "r", encoding="utf-8") as f:
+            return (json.load(f).get("collections") or {}).get(collection)
+    except FileNotFoundError:
+        return None
+
+
+class _LineageTexts:
+    """payload 沒有 text 的 point 從 lineage JSON 補（壓縮過的 lineage 沒有全文就補不到）"""
+
+    def __init__(self, lineage_dir: str):
+        self.lineage_dir = lineage_dir
+        self._job: Optional[str] = None
+        self._texts: Dict[int, str] = {}
+
+    def get(self, job_id: Optional[str], chunk_index: Optional[int]) -> Optional[str]:
+        if not job_id or chunk_index is None:
+            return None
+        if job_id != self._job:
+            self._job, self._texts = job_id, {}
+            path = lineage_path_for(job_id, out_dir=self.lineage_dir)
+            if path:
+                try:
+                    for ch in read_lineage(path).get("chunks") or []:
+                        if ch.get("text"):
+                            self._texts[int(ch["chunk_id"])] = ch["text"]
+                except (OSError, ValueError, KeyError) as e:
+                    print("[reembed] unreadable lineage", path, repr(e))
+        return self._texts.get(int(chunk_index))
+
+
+class _Throttle:
+    """平均速率上限（chunk/s）；0 = 不限"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.t0 = time.monotonic()
+        self.sent = 0
+
+    def wait(self, n: int) -> None:
+        if self.rate > 0:
+            ahead = self.sent / self.rate - (time.monotonic() - self.t0)
+            if ahead > 0:
+                time.sleep(ahead)
+        self.sent += n
+
+
+class Migration:
+    def __init__(
+        self,
+        *,
+        embed_url: str,
+        task_description: Optional[str] = None,
+        target: Optional[str] = None,
+        batch_size: int = REEMBED_BATCH,
+        max_chunks_per_sec: float = REEMBED_MAX_CHUNKS_PER_SEC,
+        lineage_dir: str = os.path.join(DATA_DIR, "lineage"),
+        replace_legacy: bool = False,
+        drop_old: bool = False,
+        progress_every: float = 10.0,
+        source: Optional[str] = None,
+    ):
+        """source 只有續跑時給（alias 可能已經切過去了）"""
+        self.client = get_client()
+        self.alias = QDRANT_COLLECTION
+        if source is None:
+            current = aliases().get(self.alias)
+            if current is None and not self.client.collection_exists(self.alias):
+                raise RuntimeError(f"collection / alias {self.alias} not found")
+            if current is None and not replace_legacy:
+                raise RuntimeError(
+                    f"{self.alias} is a plain collection, not an alias; "
+                    "rerun with --replace-legacy (drops it right before creating the alias, brief search outage)"
+                )
+            source = current or self.alias
+        self.legacy = source == self.alias
+        self.source = source
+        self.target = target or f"{self.alias}__{time.strftime('%Y%m%d%H%M%S')}"
+        if self.target == self.source:
+            raise RuntimeError(f"target {self.target} is the live collection")
+
+        self.embed_url = embed_url
+        self.task_description = task_description or EMBED_TASK_DESCRIPTION
+        self.batch_size = max(1, batch_size)
+        self.throttle = _Throttle(max_chunks_per_sec)
+        self.lineage = _LineageTexts(lineage_dir)
+        self.drop_old = drop_old
+        self.progress_every = progress_every
+        self.dim: Optional[int] = None
+        self.state: Dict[str, Any] = {
+            "source": self.source,
+            "target": self.target,
+            "alias": self.alias,
+            "embed_url": embed_url,
+            "task_description": self.task_description,
+            "phase": "copy",
+            "offset": None,
+            "copied": 0,
+            "missing_text": 0,
+            "passes": [],
+            "started_at": time.time(),
+        }
+
+    @classmethod
+    def resume(cls, target: str, **kwargs: Any) -> "Migration":
+        state = load_state(target)
+        if state is None:
+            raise RuntimeError(f"no migration state for {target}")
+        if state["phase"] == "done":
+            raise RuntimeError(f"migration to {target} already finished")
+        if state["phase"] in ("copy", "catchup"):
+            current = aliases().get(QDRANT_COLLECTION, QDRANT_COLLECTION)
+            if current != state["source"]:
+                raise RuntimeError(f"alias now points to {current}, migration was started from {state['source']}")
+        kwargs.setdefault("task_description", state.get("task_description"))
+        m = cls(embed_url=state["embed_url"], target=target, source=state["source"], **kwargs)
+        m.state.update({k: v for k, v in state.items() if k != "updated_at"})
+        return m
+
+    # =========================
+    # 抄寫
+    # =========================
+    def _ensure_target(self, dim: int) -> None:
+        if self.dim is not None:
+            return
+        if not self.client.collection_exists(self.target):
+            self.client.create_collection(collection_name=self.target, **collection_create_kwargs(size=dim))
+        else:
+            size = self.client.get_collection(self.target).config.params.vectors.size
+            if size != dim:
+                raise RuntimeError(f"{self.target} has vector size {size}, new model returns {dim}")
+        ensure_payload_indexes(self.target)
+        self.dim = dim
+
+    def _texts(self, records: List[Any]) -> Tuple[List[Any], List[str]]:
+        keep, texts = [], []
+        for rec in records:
+            p = rec.payload or {}
+            text = p.get("text") or self.lineage.get(p.get("job_id"), p.get("chunk_index"))
+            if not text:
+                self.state["missing_text"] += 1
+                print("[reembed] no text for point", rec.id, p.get("job_id"), p.get("chunk_index"))
+                continue
+            keep.append(rec)
+            texts.append(text)
+        return keep, texts
+
+    def _copy(self, records: List[Any]) -> int:
+        from qdrant_client.http import models as qm
+
+        records, texts = self._texts(records)
+        if not records:
+            return 0
+        self.throttle.wait(len(texts))
+        vectors = embed_texts(texts, url=self.embed_url, task_description=self.task_description)
+        if len(vectors) != len(records):
+            raise RuntimeError(f"embed returned {len(vectors)} vectors for {len(records)} texts")
+        self._ensure_target(len(vectors[0]))
+        points = [qm.PointStruct(id=rec.id, vector=vec, payload=rec.payload) for rec, vec in zip(records, vectors)]
+        self.client.upsert(collection_name=self.target, points=points, wait=True)
+        return len(points)
+
+    def _count(self, filters: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        try:
+            return self.client.count(collection_name=self.source, count_filter=build_filter(filters), exact=False).count
+        except Exception:
+            return None
+
+    def _pass(self, name: str, filters: Optional[Dict[str, Any]] = None, resume_offset: Any = None) -> int:
+        """掃一輪舊 collection 抄到新 collection；回傳這輪抄了幾個 point"""
+        total = self._count(filters)
+        t0 = time.monotonic()
+        last_report = t0
+        copied = 0
+        for records in scroll_points(filters, batch_size=self.batch_size, collection=self.source, offset=resume_offset):
+            n = self._copy(records)
+            copied += n
+            self.state["copied"] += n
+            if name == "copy":
+                # scroll 的 offset 包含該點本身，續跑時重抄一個 point 無妨
+                self.state["offset"] = records[-1].id
+            _save_state(self.state)
+            now = time.monotonic()
+            if now - last_report >= self.progress_every:
+                last_report = now
+                rate = copied / max(1e-9, now - t0)
+                line = f"[reembed] {name}: {copied}"
+                if total:
+                    line += f"/{total} ({100.0 * copied / total:.1f}%)"
+                    if rate > 0 and total > copied:
+                        line += f" ETA {(total - copied) / rate / 60:.1f}m"
+                print(f"{line} {rate:.0f} chunks/s")
+        sec = time.monotonic() - t0
+        self.state["passes"].append({"name": name, "copied": copied, "sec": round(sec, 2)})
+        print(f"[reembed] {name} done: {copied} points in {sec:.1f}s ({copied / max(1e-9, sec):.0f} chunks/s)")
+        return copied
+
+    # =========================
+    # 切換
+    # =========================
+    def _switch(self) -> None:
+        if self.dim is None:
+            # 這次執行沒抄到任何 point（續跑 / 空 collection）：用既有的 target 或探測一次新模型的維度
+            if self.client.collection_exists(self.target):
+                self.dim = self.client.get_collection(self.target).config.params.vectors.size
+            else:
+                probe = embed_texts(["dimension probe"], url=self.embed_url, task_description=self.task_description)
+                self._ensure_target(len(probe[0]))
+        previous_profile = active_profile() or {"embed_url": EMBED_API_URL, "task_description": EMBED_TASK_DESCRIPTION}
+        if self.legacy:
+            # alias 不能跟 collection 同名：刪掉舊 collection 後立刻建 alias（中間的請求會失敗）
+            self.client.delete_collection(self.source)
+            self.state["source_dropped"] = True
+        switch_alias(self.target, self.alias)
+        if not self.legacy and _known_profile(self.source) is None:
+            # 記下舊 collection 的設定，之後可以切回去
+            _write_profile(self.source, previous_profile)
+        _write_profile(self.target, {"embed_url": self.embed_url, "task_description": self.task_description, "dim": self.dim})
+        invalidate_readiness()
+        self.state["switched_at"] = time.time()
+        print(f"[reembed] alias {self.alias}: {self.source} → {self.target}")
+
+    def run(self) -> Dict[str, Any]:
+        t0 = time.time()
+        margin = REEMBED_CATCHUP_MARGIN_SEC
+        if self.state["phase"] == "copy":
+            self.state.setdefault("copy_started_at", time.time())
+            _save_state(self.state)
+            self._pass("copy", resume_offset=self.state["offset"])
+            self.state.update({"phase": "catchup", "since": self.state["copy_started_at"]})
+            _save_state(self.state)
+
+        if self.state["phase"] == "catchup":
+            for k in range(CATCHUP_MAX_PASSES):
+                pass_start = time.time()
+                n = self._pass(f"catchup{k + 1}", {"ingested_after": self.state["since"] - margin})
+                self.state["since"] = pass_start
+                _save_state(self.state)
+                if n <= CATCHUP_DONE_POINTS:
+                    break
+            # 舊部署：刪 collection 前把最後一段寫入也抄過去
+            if self.legacy:
+                self._pass("final", {"ingested_after": self.state["since"] - margin})
+            final_since = time.time()
+            self._switch()
+            self.state.update({"phase": "final", "since": final_since})
+            _save_state(self.state)
+
+        if self.state["phase"] == "final":
+            if not self.state.get("source_dropped"):
+                # 切換前最後寫進舊 collection 的
+                self._pass("final", {"ingested_after": self.state["since"] - margin})
+                if self.drop_old:
+                    self.client.delete_collection(self.source)
+                    self.state["source_dropped"] = True
+            self.state["phase"] = "done"
+            _save_state(self.state)
+
+        summary = {
+            "alias": self.alias,
+            "source": self.source,
+            "target": self.target,
+            "copied": self.state["copied"],
+            "missing_text": self.state["missing_text"],
+            "passes": self.state["passes"],
+            "source_dropped": bool(self.state.get("source_dropped")),
+            "sec": round(time.time() - t0, 1),
+        }
+        print(f"[reembed] done: {summary['copied']} points → {self.target} in {summary['sec']}s")
+        return summary
+
+
+def switch_back(collection: str) -> Optional[str]:
+    """手動切回（例如新模型效果不好）：alias 指回 collection，embedding 設定一起換回"""
+    profile = _known_profile(collection)
+    if profile is None:
+        raise RuntimeError(f"no embedding profile recorded for {collection}")
+    if not get_client().collection_exists(collection):
+        raise RuntimeError(f"collection {collection} not found")
+    previous = switch_alias(collection)
+    _write_profile(collection, profile)
+    return previous
@@ -0,0 +1,323 @@
+"""
+外部模型後端（olm / vlm / llm / embed）共用的韌性層：
+
+- circuit breaker：連續失敗達門檻就 open，COOLDOWN 內直接 fail fast（不再每頁 1+2+4 秒地等）
+- 重試：只針對 502/503/504 與連線錯誤，breaker open 就停
+- 自適應 timeout：依最近成功請求的延遲分佈（p99 × multiplier）縮短 read timeout
+- hedged request（可選）：超過 p95 還沒回來就再送一份，取先成功的
+- 狀態透過 metrics 輸出（/v1/metrics 的 backends 欄位）
+
+所有呼叫仍走 cancellable_post，job 取消 / deadline 照常生效。
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import requests
+
+from app.services import metrics
+from app.services.cancel import CancelToken, JobCancelled, bind_token, cancellable_post, cancellable_sleep, current_token
+from app.services.config import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_COOLDOWN_SEC,
+    BACKEND_RETRY_TRIES,
+    BACKEND_RETRY_BASE_SLEEP,
+    ADAPTIVE_TIMEOUT_ENABLED,
+    ADAPTIVE_TIMEOUT_MULTIPLIER,
+    ADAPTIVE_TIMEOUT_MIN_SEC,
+    LATENCY_WINDOW,
+    LATENCY_MIN_SAMPLES,
+    HEDGE_BACKENDS,
+)
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class CircuitOpenError(RuntimeError):
+    """breaker open：後端近期持續失敗，直接拒絕呼叫"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, cooldown_sec: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown_sec = cooldown_sec
+        self.state = "closed"  # closed / open / half_open
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_inflight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.time() - (self.opened_at or 0) < self.cooldown_sec:
+                    return False
+                self.state = "half_open"
+                self._probe_inflight = False
+            # half_open：一次只放一個試探請求
+            if self._probe_inflight:
+                return False
+            self._probe_inflight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.opened_at = None
+            self._probe_inflight = False
+
+    def release(self) -> None:
+        """呼叫被中止（job 取消）：不算成功也不算失敗，只把 half_open 的試探名額還回去"""
+        with self._lock:
+            self._probe_inflight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_inflight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "opened_at": self.opened_at}
+
+
+class LatencyStats:
+    """最近 N 筆請求的延遲（秒）：成功的實際耗時，read timeout 的以 timeout 值計"""
+
+    def __init__(self, window: int):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, sec: float) -> None:
+        with self._lock:
+            self._samples.append(sec)
+
+    def count(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            s = sorted(self._samples)
+        return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+
+class Backend:
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN_SEC)
+        self.latency = LatencyStats(LATENCY_WINDOW)
+        self.hedge = name in HEDGE_BACKENDS
+
+    def read_timeout(self, default: Optional[float]) -> Optional[float]:
+        """自適應 read timeout：p99 × multiplier，夾在 [MIN_SEC, default]"""
+        if default is None or not ADAPTIVE_TIMEOUT_ENABLED or self.latency.count() < LATENCY_MIN_SAMPLES:
+            return default
+        p99 = self.latency.percentile(99) or default
+        return max(ADAPTIVE_TIMEOUT_MIN_SEC, min(default, p99 * ADAPTIVE_TIMEOUT_MULTIPLIER))
+
+    def timeout(self, default: Any) -> Any:
+        if isinstance(default, tuple):
+            connect, read = default
+            return (connect, self.read_timeout(read))
+        return self.read_timeout(default)
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge or self.latency.count() < LATENCY_MIN_SAMPLES:
+            return None
+        return self.latency.percentile(95)
+
+    def snapshot(self) -> Dict[str, Any]:
+        p = self.latency.percentile
+        return {
+            **self.breaker.snapshot(),
+            "samples": self.latency.count(),
+            "p50_sec": p(50),
+            "p95_sec": p(95),
+            "p99_sec": p(99),
+            "hedge": self.hedge,
+        }
+
+
+_BACKENDS: Dict[str, Backend] = {}
+_BACKENDS_LOCK = threading.Lock()
+# hedge 備援請求用的執行緒池（主請求在呼叫端 thread 跑）
+_HEDGE_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+def get_backend(name: str) -> Backend:
+    with _BACKENDS_LOCK:
+        be = _BACKENDS.get(name)
+        if be is None:
+            be = _BACKENDS[name] = Backend(name)
+        return be
+
+
+def backends_snapshot() -> Dict[str, Any]:
+    with _BACKENDS_LOCK:
+        items = list(_BACKENDS.items())
+    return {name: be.snapshot() for name, be in items}
+
+
+metrics.register_collector("backends", backends_snapshot)
+
+
+def _hedge_call(token: CancelToken, loser: CancelToken, url: str, kwargs: Dict[str, Any]) -> requests.Response:
+    with bind_token(token):
+        r = cancellable_post(url, **kwargs)
+    if r.status_code < 500:
+        loser.cancel("hedge_won")  # 主請求還在等：拆掉它的連線
+    return r
+
+
+def _send(be: Backend, url: str, kwargs: Dict[str, Any]) -> requests.Response:
+    """
+    hedge：主請求在呼叫端 thread 跑，超過 p95 才把備援請求丟進 _HEDGE_POOL；
+    先成功的一方取消另一方的子 token（連線一起關掉），輸家不會一直佔著 pool
+    """
+    delay = None if kwargs.get("stream") else be.hedge_delay()
+    if delay is None:
+        return cancellable_post(url, **kwargs)
+
+    parent = current_token()
+
+    def child() -> CancelToken:
+        return parent.child() if parent is not None else CancelToken("hedge")
+
+    primary_tok, hedge_tok = child(), child()
+    lock = threading.Lock()
+    state: Dict[str, Any] = {"hedge": None, "closed": False}
+
+    def launch() -> None:
+        with lock:
+            if state["closed"]:
+                return
+            metrics.inc("backend_hedges_total", backend=be.name)
+            # 帶上目前的 contextvars，pool thread 裡才看得到
+            ctx = contextvars.copy_context()
+            state["hedge"] = _HEDGE_POOL.submit(ctx.run, _hedge_call, hedge_tok, primary_tok, url, kwargs)
+
+    timer = threading.Timer(delay, launch)
+    timer.daemon = True
+    timer.start()
+
+    r: Optional[requests.Response] = None
+    primary_err: Optional[BaseException] = None
+    try:
+        with bind_token(primary_tok):
+            r = cancellable_post(url, **kwargs)
+    except Exception as e:
+        primary_err = e
+    finally:
+        with lock:
+            state["closed"] = True
+            timer.cancel()
+
+    hedge = state["hedge"]
+    if parent is not None and parent.cancelled:
+        hedge_tok.cancel(parent.reason or "cancelled")
+        parent.check()
+    if r is not None and (r.status_code < 500 or hedge is None):
+        if hedge is not None:
+            hedge.cancel()  # 還在 pool 排隊就直接不跑
+        hedge_tok.cancel("hedge_lost")
+        return r
+    if hedge is None:
+        raise primary_err
+
+    try:
+        hr = hedge.result()
+    except Exception:
+        if parent is not None:
+            parent.check()
+        if r is not None:
+            return r
+        raise primary_err
+    if hr.status_code < 500 or r is None:
+        metrics.inc("backend_hedge_wins_total", backend=be.name)
+        return hr
+    return r
+
+
+def resilient_post(
+    backend: str,
+    url: str,
+    *,
+    timeout: Any,
+    tries: int = BACKEND_RETRY_TRIES,
+    base_sleep: float = BACKEND_RETRY_BASE_SLEEP,
+    timeout_is_failure: bool = True,
+    **kwargs: Any,
+) -> requests.Response:
+    """
+    取代 requests.post / post_with_retry；回傳已 raise_for_status 的 Response
+    - timeout_is_failure=False：read timeout 代表請求本身太大（例如多頁 VLM 批次），
+      不算 breaker 失敗也不重試，直接 raise 讓呼叫端退回較小的請求
+    """
+    be = get_backend(backend)
+    last_err: Optional[BaseException] = None
+
+    for i in range(max(1, tries)):
+        if not be.breaker.allow():
+            metrics.inc("backend_short_circuited_total", backend=backend)
+            raise CircuitOpenError(f"{backend} circuit open") from last_err
+
+        metrics.inc("backend_calls_total", backend=backend)
+        t0 = time.perf_counter()
+        call_timeout = be.timeout(timeout)
+        try:
+            r = _send(be, url, {**kwargs, "timeout": call_timeout})
+            r.raise_for_status()
+        except requests.HTTPError as e:
+            code = e.response.status_code if e.response is not None else None
+            if code not in RETRY_STATUSES:
+                # 4xx / 其他 5xx：後端有回應，不算 breaker 失敗
+                be.breaker.record_success()
+                raise
+            last_err = e
+        except requests.ReadTimeout as e:
+            # timeout 被壓到比實際延遲還低時，慢的請求永遠拿不到樣本；
+            # 以 timeout 值記一筆，p99 才會跟著往上長回來
+            read = call_timeout[1] if isinstance(call_timeout, tuple) else call_timeout
+            be.latency.add(max(time.perf_counter() - t0, read or 0.0))
+            if not timeout_is_failure:
+                be.breaker.release()
+                metrics.inc("backend_timeouts_total", backend=backend)
+                raise
+            last_err = e
+        except requests.RequestException as e:
+            last_err = e
+        except JobCancelled:
+            be.breaker.release()
+            raise
+        except BaseException as e:
+            # 非預期錯誤（hedge pool、breaker 以外的例外）：算一次失敗，確保試探名額一定會釋放
+            if isinstance(e, Exception):
+                be.breaker.record_failure()
+                metrics.inc("backend_failures_total", backend=backend)
+            else:
+                be.breaker.release()
+            raise
+        else:
+            be.latency.add(time.perf_counter() - t0)
+            be.breaker.record_success()
+            return r
+
+        be.breaker.record_failure()
+        metrics.inc("backend_failures_total", backend=backend)
+        if i < tries - 1 and be.breaker.state == "closed":
+            cancellable_sleep(base_sleep * (2 ** i))  # 1s, 2s, 4s...
+            continue
+        break
+
+    raise last_err if last_err else RuntimeError(f"{backend} call failed without exception")
@@ -0,0 +1,225 @@
+"""
+job 結果查詢：chunk / 頁面分頁 + 欄位選擇、完整 markdown 檔、ETag 與壓縮
+
+    {RESULTS_DIR}/{job_id}.md   job 完成時寫出的完整抽取結果（# Page N marker + 每頁內容），由 API 直接串流（支援 Range）
+
+- chunk / 頁面資料來自 lineage JSON：解析過的放 LRU（RESULT_CACHE_JOBS 份，以檔案 mtime / size 判斷是否過期），
+  翻頁不會每次重新解析幾十 MB 的 JSON
+- lineage 沒存全文（低記憶體模式 / 已壓縮）時，chunk / 頁面的 text 從 markdown 依 start / end 切出來
+- ETag 只看檔案 stat + 查詢參數，條件式 GET（If-None-Match）在讀檔之前就能回 304
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.services.config import RESULTS_DIR, RESULT_CACHE_JOBS, RESULT_COMPRESS_MIN_BYTES
+from app.services.lineage import lineage_path_for, read_lineage
+
+os.makedirs(RESULTS_DIR, exist_ok=True)
+
+CHUNK_FIELDS = ("chunk_id", "qdrant_point_id", "page", "start", "end", "text_len", "preview", "text", "duplicate_of")
+PAGE_FIELDS = ("page", "text_chars", "is_scanned", "image", "used_route", "ocr_score", "chunk_ids", "start", "end", "text")
+
+_CACHE: "OrderedDict[Tuple[str, str], Tuple[Tuple[int, int], Any]]" = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def markdown_path(job_id: str) -> str:
+    return os.path.join(RESULTS_DIR, f"{job_id}.md")
+
+
+def save_markdown(job_id: str, text: str) -> str:
+    path = markdown_path(job_id)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return path
+
+
+def delete_markdown(job_id: str) -> int:
+    """回傳刪掉的 bytes（retention 統計用）"""
+    path = markdown_path(job_id)
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def _stat_key(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _cached(kind: str, path: str, loader) -> Any:
+    key = (kind, path)
+    stat = _stat_key(path)
+    with _CACHE_LOCK:
+        hit = _CACHE.get(key)
+        if hit is not None and hit[0] == stat:
+            _CACHE.move_to_end(key)
+            return hit[1]
+    value = loader(path)
+    with _CACHE_LOCK:
+        _CACHE[key] = (stat, value)
+        _CACHE.move_to_end(key)
+        # lineage + markdown 各算一份
+        while len(_CACHE) > max(1, RESULT_CACHE_JOBS) * 2:
+            _CACHE.popitem(last=False)
+    return value
+
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def lineage_file(job_id: str) -> Optional[str]:
+    from app.services.jobs import LINEAGE_DIR
+
+    return lineage_path_for(job_id, out_dir=LINEAGE_DIR)
+
+
+def etag(job_id: str, *params: Any) -> Optional[str]:
+    """lineage / markdown 的 stat + 查詢參數 → weak ETag；沒有 lineage 回 None"""
+    path = lineage_file(job_id)
+    if path is None:
+        return None
+    parts = [path, *_stat_key(path)]
+    md = markdown_path(job_id)
+    if os.path.exists(md):
+        parts += list(_stat_key(md))
+    parts += list(params)
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    """If-None-Match 用弱比較（忽略 W/ 前綴）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = tag[2:] if tag.startswith("W/") else tag
+    for candidate in if_none_match.split(","):
+        c = candidate.strip()
+        if (c[2:] if c.startswith("W/") else c) == bare:
+            return True
+    return False
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """"a,b,c" → ["a", "b", "c"]；None = 全部（text 除外由呼叫端決定）；未知欄位 raise ValueError"""
+    if not fields:
+        return None
+    out = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in out if f not in allowed]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)} (allowed: {', '.join(allowed)})")
+    return out
+
+
+def _markdown(job_id: str) -> Optional[str]:
+    path = markdown_path(job_id)
+    if not os.path.exists(path):
+        return None
+    return _cached("markdown", path, _read_text)
+
+
+def _slice(md: Optional[str], start: Any, end: Any) -> Optional[str]:
+    if md is None or start is None or end is None:
+        return None
+    return md[int(start):int(end)]
+
+
+def _window(items: List[Dict[str, Any]], offset: int, limit: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    page = items[offset:offset + limit]
+    nxt = offset + len(page)
+    return page, (nxt if nxt < len(items) else None)
+
+
+def chunks_page(job_id: str, offset: int, limit: int, fields: Optional[List[str]]) -> Dict[str, Any]:
+    """fields=None：除了 text 以外的欄位（text 可能很大，要明確指定）"""
+    payload = _cached("lineage", lineage_file(job_id), read_lineage)
+    items, next_offset = _window(payload.get("chunks") or [], offset, limit)
+    want = fields or [f for f in CHUNK_FIELDS if f != "text"]
+    md = _markdown(job_id) if "text" in want else None
+    out = []
+    for ch in items:
+        row = {f: ch.get(f) for f in want if f != "text"}
+        if "text" in want:
+            row["text"] = ch.get("text") if ch.get("text") is not None else _slice(md, ch.get("start"), ch.get("end"))
+        out.append(row)
+    return {
+        "job_id": job_id,
+        "total": len(payload.get("chunks") or []),
+        "offset": offset,
+        "next_offset": next_offset,
+        "chunks": out,
+    }
+
+
+def pages_page(job_id: str, offset: int, limit: int, fields: Optional[List[str]]) -> Dict[str, Any]:
+    payload = _cached("lineage", lineage_file(job_id), read_lineage)
+    pages = (payload.get("page_info") or {}).get("pages") or []
+    items, next_offset = _window(pages, offset, limit)
+    want = fields or [f for f in PAGE_FIELDS if f != "text"]
+    md = _markdown(job_id) if "text" in want else None
+    out = []
+    for p in items:
+        row = {f: p.get(f) for f in want if f != "text"}
+        if "text" in want:
+            text = _slice(md, p.get("start"), p.get("end"))
+            if text is None and len(pages) == 1 and md is not None:
+                text = md.strip()
+            row["text"] = text
+        out.append(row)
+    return {
+        "job_id": job_id,
+        "total": len(pages),
+        "offset": offset,
+        "next_offset": next_offset,
+        "pages": out,
+    }
+
+
+def pick_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """br（有裝 brotli 才用）> gzip；q=0 視為不接受"""
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name] = q
+    if accepted.get("br", 0) > 0 and _brotli() is not None:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def _brotli():
+    try:
+        import brotli  # 選用相依：pip install brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def compress(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """太小的 body 不壓（壓了反而變大）；回傳 (body, 實際用的 encoding)"""
+    if encoding is None or len(body) < RESULT_COMPRESS_MIN_BYTES:
+        return body, None
+    if encoding == "br":
+        return _brotli().compress(body, quality=5), "br"
+    return gzip.compress(body, compresslevel=6), "gzip"
@@ -0,0 +1,259 @@
+"""
+資料保留 / 回收：背景 sweeper 每 RETENTION_SWEEP_INTERVAL_SEC 跑一次 sweep()
+
+- job 紀錄：已結束的 job 超過 JOB_RECORD_TTL_SEC 或總數超過 JOB_RECORD_MAX_COUNT → 從 _JOBS 與 queue/jobs 移除
+- 頁面圖片（{job_id}__*_images/）：job 結束超過 PAGE_IMAGES_RETAIN_SEC 就刪
+- 上傳原檔：job 結束超過 UPLOAD_TTL_SEC 就刪；總量超過 UPLOAD_MAX_BYTES 從最舊的開始刪
+- lineage：超過 LINEAGE_COMPACT_AFTER_SEC 壓縮成 .json.gz；超過 LINEAGE_TTL_SEC 刪除（連同 results/{job_id}.md）
+- 階段 checkpoint（失敗 job 重試用）：job 結束超過 CHECKPOINT_TTL_SEC 就刪
+
+queued / running 的 job 的檔案一律不動；找不到 job 紀錄的檔案（孤兒）以檔案 mtime 計算年齡。
+UPLOAD_DIR 裡只管 {job_id}__ 開頭的項目，其他（例如 repo 附的 data/uploads/pdf、images 範例）一律不動。
+"""
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services import checkpoints, jobs, job_queue, lineage_index, metrics, results
+from app.services.config import (
+    JOB_EXECUTOR,
+    RETENTION_SWEEP_INTERVAL_SEC,
+    JOB_RECORD_TTL_SEC,
+    JOB_RECORD_MAX_COUNT,
+    UPLOAD_TTL_SEC,
+    UPLOAD_MAX_BYTES,
+    PAGE_IMAGES_RETAIN_SEC,
+    LINEAGE_COMPACT_AFTER_SEC,
+    LINEAGE_TTL_SEC,
+    CHECKPOINT_DIR,
+    CHECKPOINT_TTL_SEC,
+)
+from app.services.lineage import compact_lineage
+
+TERMINAL_STATUSES = ("finished", "failed", "cancelled")
+# 剛上傳、job 紀錄還沒建好的檔案不要當孤兒刪掉
+_ORPHAN_MIN_AGE_SEC = 300
+# jobs.create_job 存檔用的前綴：uuid4().hex + "__"
+_JOB_ENTRY = re.compile(r"^([0-9a-f]{32})__")
+
+_LAST_REPORT: Dict[str, Any] = {}
+_STOP = threading.Event()
+_THREAD: Optional[threading.Thread] = None
+
+
+def _path_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path: str) -> int:
+    """刪檔或資料夾，回傳回收的 bytes"""
+    size = _path_size(path)
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        return 0
+    return size
+
+
+def _known_jobs() -> Dict[str, Dict[str, Any]]:
+    known = {jid: job for jid, job in list(jobs._JOBS.items())}
+    if JOB_EXECUTOR == "queue":
+        for rec in job_queue.list_job_records():
+            known.setdefault(rec["job_id"], rec)
+    return known
+
+
+def _finished_at(job: Dict[str, Any]) -> float:
+    return job.get("updated_at") or job.get("created_at") or 0.0
+
+
+def _sweep_job_records(known: Dict[str, Dict[str, Any]], now: float) -> int:
+    done = [j for j in known.values() if j.get("status") in TERMINAL_STATUSES and j["job_id"] not in jobs._TOKENS]
+    done.sort(key=_finished_at)
+
+    evict = set()
+    if JOB_RECORD_TTL_SEC > 0:
+        evict |= {j["job_id"] for j in done if now - _finished_at(j) >= JOB_RECORD_TTL_SEC}
+    if JOB_RECORD_MAX_COUNT > 0:
+        over = len(known) - len(evict) - JOB_RECORD_MAX_COUNT
+        for j in done:
+            if over <= 0:
+                break
+            if j["job_id"] not in evict:
+                evict.add(j["job_id"])
+                over -= 1
+
+    for jid in evict:
+        jobs._JOBS.pop(jid, None)
+        if JOB_EXECUTOR == "queue":
+            job_queue.delete_job_record(jid)
+    return len(evict)
+
+
+def _upload_entries(known: Dict[str, Dict[str, Any]], now: float) -> List[Tuple[str, bool, float]]:
+    """
+    UPLOAD_DIR 裡可回收的項目：(path, is_images_dir, age_sec)
+    - 只認 {job_id}__{filename} / {job_id}__{stem}_images，其他名稱不是 pipeline 寫的，不碰
+    - queued / running 的 job 跳過
+    """
+    out = []
+    for name in os.listdir(jobs.UPLOAD_DIR):
+        m = _JOB_ENTRY.match(name)
+        if not m:
+            continue
+        path = os.path.join(jobs.UPLOAD_DIR, name)
+        job_id = m.group(1)
+        job = known.get(job_id)
+        if job is not None and job.get("status") not in TERMINAL_STATUSES:
+            continue
+        try:
+            mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            continue
+        if job is None and now - mtime < _ORPHAN_MIN_AGE_SEC:
+            continue
+        age = now - (_finished_at(job) if job is not None else mtime)
+        out.append((path, os.path.isdir(path) and name.endswith("_images"), age))
+    return out
+
+
+def _sweep_uploads(known: Dict[str, Dict[str, Any]], now: float, report: Dict[str, Any]) -> None:
+    entries = _upload_entries(known, now)
+    kept = []
+    for path, is_images, age in entries:
+        ttl = PAGE_IMAGES_RETAIN_SEC if is_images else UPLOAD_TTL_SEC
+        if (is_images or ttl > 0) and age >= ttl:
+            report["bytes_reclaimed"] += _remove(path)
+            report["images_dirs_deleted" if is_images else "uploads_deleted"] += 1
+        else:
+            kept.append((path, is_images, age))
+
+    if UPLOAD_MAX_BYTES <= 0:
+        return
+    # 只算 job 的上傳（含 queued / running），範例等其他檔案不佔額度
+    total = sum(_path_size(os.path.join(jobs.UPLOAD_DIR, n)) for n in os.listdir(jobs.UPLOAD_DIR) if _JOB_ENTRY.match(n))
+    # 超量：從最舊的已結束 job 開始刪
+    for path, is_images, _age in sorted(kept, key=lambda e: -e[2]):
+        if total <= UPLOAD_MAX_BYTES:
+            break
+        freed = _remove(path)
+        total -= freed
+        report["bytes_reclaimed"] += freed
+        report["images_dirs_deleted" if is_images else "uploads_deleted"] += 1
+
+
+def _sweep_lineage(now: float, report: Dict[str, Any]) -> None:
+    for name in os.listdir(jobs.LINEAGE_DIR):
+        path = os.path.join(jobs.LINEAGE_DIR, name)
+        if not (name.endswith(".json") or name.endswith(".json.gz")):
+            continue
+        try:
+            age = now - os.path.getmtime(path)
+        except FileNotFoundError:
+            continue
+
+        if LINEAGE_TTL_SEC > 0 and age >= LINEAGE_TTL_SEC:
+            report["bytes_reclaimed"] += _remove(path)
+            report["lineage_deleted"] += 1
+            job_id = name.split(".", 1)[0]
+            lineage_index.delete_job(job_id)
+            # 完整 markdown 跟 lineage 一起過期
+            report["bytes_reclaimed"] += results.delete_markdown(job_id)
+        elif name.endswith(".json") and LINEAGE_COMPACT_AFTER_SEC > 0 and age >= LINEAGE_COMPACT_AFTER_SEC:
+            before = os.path.getsize(path)
+            try:
+                new_path = compact_lineage(path)
+            except (OSError, ValueError) as e:
+                print("[retention] compact lineage failed", name, repr(e))
+                continue
+            report["bytes_reclaimed"] += max(0, before - os.path.getsize(new_path))
+            report["lineage_compacted"] += 1
+
+
+def _sweep_checkpoints(known: Dict[str, Dict[str, Any]], now: float, report: Dict[str, Any]) -> None:
+    if CHECKPOINT_TTL_SEC <= 0 or not os.path.isdir(CHECKPOINT_DIR):
+        return
+    for job_id in os.listdir(CHECKPOINT_DIR):
+        job = known.get(job_id)
+        if job is not None and job.get("status") not in TERMINAL_STATUSES:
+            continue
+        try:
+            mtime = os.path.getmtime(checkpoints.job_dir(job_id))
+        except FileNotFoundError:
+            continue
+        age = now - (_finished_at(job) if job is not None else mtime)
+        if age >= CHECKPOINT_TTL_SEC:
+            report["bytes_reclaimed"] += _remove(checkpoints.job_dir(job_id))
+            report["checkpoints_deleted"] += 1
+
+
+def sweep(now: Optional[float] = None) -> Dict[str, Any]:
+    """跑一輪回收，回傳報告（也會出現在 /v1/metrics 的 retention 欄位）"""
+    now = now or time.time()
+    t0 = time.perf_counter()
+    report: Dict[str, Any] = {
+        "jobs_evicted": 0,
+        "uploads_deleted": 0,
+        "images_dirs_deleted": 0,
+        "lineage_compacted": 0,
+        "lineage_deleted": 0,
+        "checkpoints_deleted": 0,
+        "bytes_reclaimed": 0,
+    }
+
+    known = _known_jobs()
+    # 先看檔案（需要 job 狀態判斷能不能刪），最後才移除 job 紀錄
+    _sweep_uploads(known, now, report)
+    _sweep_lineage(now, report)
+    _sweep_checkpoints(known, now, report)
+    report["jobs_evicted"] = _sweep_job_records(known, now)
+
+    report["elapsed_sec"] = round(time.perf_counter() - t0, 3)
+    report["swept_at"] = now
+    _LAST_REPORT.clear()
+    _LAST_REPORT.update(report)
+    for k in ("jobs_evicted", "uploads_deleted", "images_dirs_deleted", "lineage_compacted", "lineage_deleted", "checkpoints_deleted", "bytes_reclaimed"):
+        if report[k]:
+            metrics.inc(f"retention_{k}_total", report[k])
+    if report["bytes_reclaimed"] or report["jobs_evicted"]:
+        print("[retention] sweep", report)
+    return report
+
+
+metrics.register_collector("retention", lambda: dict(_LAST_REPORT))
+
+
+def _loop() -> None:
+    while not _STOP.wait(RETENTION_SWEEP_INTERVAL_SEC):
+        try:
+            sweep()
+        except Exception as e:  # sweeper 不能死，下一輪再試
+            print("[retention] sweep failed", repr(e))
+
+
+def start_sweeper() -> None:
+    global _THREAD
+    if RETENTION_SWEEP_INTERVAL_SEC <= 0 or (_THREAD is not None and _THREAD.is_alive()):
+        return
+    _STOP.clear()
+    _THREAD = threading.Thread(target=_loop, name="retention-sweeper", daemon=True)
+    _THREAD.start()
+
+
+def stop_sweeper() -> None:
+    _STOP.set()
@@ -0,0 +1,125 @@
+"""
+latency mode：邊界頁（低文字、OCR 結果難預測）同時跑 OCR 與 VLM，取先可用的結果
+
+序列路徑 OCR → 評分 → VLM 在品質差的掃描頁要付「兩個延遲相加」；這裡改成：
+- OCR 先回來且 accept（品質分數過門檻、不像表格）→ OCR 勝，取消 VLM
+- VLM 先回來 → VLM 勝，取消 OCR
+- OCR 回來但不合格 → 等 VLM；VLM 失敗才退回 OCR 文字
+- 兩邊都失敗 → used=None，由 run_job 退回序列路徑（OCR → 第二輪 VLM），不把這頁當成空白
+取消用子 CancelToken：輸家的等待 / 重試立刻停止，已送出的 HTTP 請求連線關掉（後端已算的部分就是額外成本）。
+
+回傳每頁的勝者與花掉的額外成本，由 run_job 彙總到 job["speculation"]。
+"""
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.services import metrics
+from app.services.cancel import CancelToken, JobCancelled, bind_token, current_token
+from app.services.config import SPECULATIVE_MAX_WORKERS
+from app.services.image_payload import ImageInput, image_label
+
+_POOL = ThreadPoolExecutor(max_workers=SPECULATIVE_MAX_WORKERS, thread_name_prefix="speculative")
+
+
+def _branch(token: CancelToken, fn: Callable[[ImageInput], str], image: ImageInput) -> Tuple[str, float]:
+    t0 = time.perf_counter()
+    with bind_token(token):
+        token.check()
+        text = (fn(image) or "").strip()
+    return text, time.perf_counter() - t0
+
+
+def _submit(token: CancelToken, fn: Callable[[ImageInput], str], image: ImageInput):
+    ctx = contextvars.copy_context()
+    return _POOL.submit(ctx.run, _branch, token, fn, image)
+
+
+def race_ocr_vlm(
+    image: ImageInput,
+    *,
+    ocr_fn: Callable[[ImageInput], str],
+    vlm_fn: Callable[[ImageInput], str],
+    accept: Callable[[str], Tuple[bool, float]],
+) -> Dict[str, Any]:
+    """
+    accept(ocr_text) -> (可以直接用, 品質分數)
+    回傳 {"text", "used"（ocr/vlm；兩邊都失敗為 None）, "ocr_score", "ocr_done", "ocr_ok",
+          "discarded_calls", "extra_vlm_call", "discarded_sec", "sec"}
+    - ocr_done / ocr_ok：OCR 有跑完才有意義（給路由統計用）
+    - extra_vlm_call：序列路徑不會呼叫的 VLM（OCR 已合格）
+    """
+    parent = current_token()
+    tokens = {
+        name: parent.child() if parent is not None else CancelToken("speculative")
+        for name in ("ocr", "vlm")
+    }
+    t0 = time.perf_counter()
+    futs = {
+        "ocr": _submit(tokens["ocr"], ocr_fn, image),
+        "vlm": _submit(tokens["vlm"], vlm_fn, image),
+    }
+    started = {name: time.perf_counter() for name in futs}
+
+    res: Dict[str, Any] = {"ocr": None, "vlm": None}  # (text, sec) / None（失敗）
+    ocr_ok, ocr_score = False, 0.0
+    winner: Optional[str] = None
+    pending = set(futs.values())
+
+    while pending and winner is None:
+        done, pending = wait(pending, timeout=CancelToken.POLL_SEC, return_when=FIRST_COMPLETED)
+        if parent is not None:
+            parent.check()
+        for name, fut in futs.items():
+            if fut not in done:
+                continue
+            try:
+                res[name] = fut.result()
+            except JobCancelled:
+                if parent is not None:
+                    parent.check()
+                res[name] = None
+            except Exception as e:
+                print(f"[speculative] {name} failed", image_label(image), repr(e))
+                res[name] = None
+            if name == "ocr" and res["ocr"] is not None:
+                ocr_ok, ocr_score = accept(res["ocr"][0])
+
+        if res["vlm"] is not None:
+            winner = "vlm"
+        elif res["ocr"] is not None and (ocr_ok or futs["vlm"].done()):
+            # OCR 合格，或 VLM 已失敗 → 只能用 OCR
+            winner = "ocr"
+        elif futs["ocr"].done() and futs["vlm"].done():
+            break
+
+    loser = {"ocr": "vlm", "vlm": "ocr"}.get(winner or "")
+    discarded_calls, discarded_sec = 0, 0.0
+    if loser is not None:
+        fut = futs[loser]
+        if not fut.done():
+            tokens[loser].cancel("speculation_lost")
+            discarded_sec = time.perf_counter() - started[loser]
+            discarded_calls = 1
+        elif res[loser] is not None:
+            discarded_sec = res[loser][1]
+            discarded_calls = 1
+
+    out = {
+        "text": res[winner][0] if winner else "",
+        "used": winner,
+        "ocr_score": round(ocr_score, 3) if res["ocr"] is not None else None,
+        "ocr_done": res["ocr"] is not None,
+        "ocr_ok": ocr_ok,
+        "ocr_sec": res["ocr"][1] if res["ocr"] is not None else 0.0,
+        "vlm_sec": res["vlm"][1] if res["vlm"] is not None else 0.0,
+        "discarded_calls": discarded_calls,
+        "extra_vlm_call": winner == "ocr" and discarded_calls == 1,
+        "discarded_sec": round(discarded_sec, 3),
+        "sec": round(time.perf_counter() - t0, 3),
+    }
+    metrics.inc("speculative_pages_total", winner=winner or "none")
+    if discarded_calls:
+        metrics.inc("speculative_discarded_calls_total", backend=loser)
+    return out
@@ -1,32 +1,93 @@
-import base64
-import requests
-from app.services.config import VLM_API_URL, VLM_MODEL
+import re
+from typing import List, Optional
 
-def _to_data_url(image_bytes: bytes, mime: str) -> str:
-    b64 = base64.b64encode(image_bytes).decode("utf-8")
-    return f"data:{mime};base64,{b64}"
+from app.services import metrics
+from app.services.cancel import JobCancelled
+from app.services.config import VLM_API_URL, VLM_MODEL, VLM_BATCH_SIZE
+from app.services.image_payload import JSON_HEADERS, ImageInput, chat_body, image_label, image_part
+from app.services.resilience import resilient_post
 
-def vlm_extract_markdown(image_path: str) -> str:
-    with open(image_path, "rb") as f:
-        content = f.read()
+VLM_PROMPT = "請理解這份文件/圖片內容，輸出結構化 Markdown（保留標題、列表、表格）。"
 
-    data_url = _to_data_url(content, mime="image/png")
+# 多頁批次：第 k 張圖的輸出前面要有 <<<PAGE k>>>（k 從 1 開始，只在這個請求內編號）
+BATCH_PROMPT = (
+    "以下依序有 {n} 張文件頁面圖片。請逐頁理解內容，輸出結構化 Markdown（保留標題、列表、表格）。\n"
+    "每一頁的輸出前面單獨一行寫分隔標記 <<<PAGE k>>>（k 為圖片順序 1 到 {n}），"
+    "每頁都要有標記、不可合併或省略頁面，標記以外不要加任何說明。"
+)
+PAGE_DELIM = re.compile(r"^\s*<<<\s*PAGE\s+(\d+)\s*>>>\s*$", re.MULTILINE)
 
+def _chat(content: list, timeout: float, backend: str = "vlm", timeout_is_failure: bool = True) -> str:
     payload = {
         "model": VLM_MODEL,
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "請理解這份文件/圖片內容，輸出結構化 Markdown（保留標題、列表、表格）。"},
-                    {"type": "image_url", "image_url": {"url": data_url}},
-                ],
-            }
-        ],
+        "messages": [{"role": "user", "content": content}],
         "temperature": 0.2,
     }
-
-    r = requests.post(VLM_API_URL, json=payload, timeout=180)
-    r.raise_for_status()
+    r = resilient_post(
+        backend, VLM_API_URL, data=chat_body(payload), headers=JSON_HEADERS,
+        timeout=timeout, timeout_is_failure=timeout_is_failure,
+    )
     j = r.json()
     return j["choices"][0]["message"]["content"]
+
+def vlm_extract_markdown(image: ImageInput) -> str:
+    """image：檔案路徑或 PNG bytes"""
+    return _chat([{"type": "text", "text": VLM_PROMPT}, image_part(image)], timeout=180)
+
+def split_pages(text: str, n: int) -> Optional[List[str]]:
+    """
+    依 <<<PAGE k>>> 切回每頁；1..n 每個都要剛好出現一次，否則回 None（交給呼叫端退回逐頁）
+    """
+    marks = list(PAGE_DELIM.finditer(text or ""))
+    if [int(m.group(1)) for m in marks] != list(range(1, n + 1)):
+        return None
+    out = []
+    for i, m in enumerate(marks):
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(text)
+        out.append(text[m.end():end].strip())
+    return out
+
+def _extract_group(images: List[ImageInput]) -> Optional[List[str]]:
+    n = len(images)
+    content = [{"type": "text", "text": BATCH_PROMPT.format(n=n)}]
+    content += [image_part(img) for img in images]
+    # 輸出量跟頁數成正比，timeout 跟著放寬
+    # 獨立的 vlm_batch 後端：自適應 timeout 依批次請求自己的延遲，不會被單頁的 p99 壓低；
+    # 批次 timeout 只代表請求太大（退回逐頁），不算 breaker 失敗，也不會擋到逐頁 fallback
+    return split_pages(_chat(content, timeout=120 + 60 * n, backend="vlm_batch", timeout_is_failure=False), n)
+
+def _extract_single_safe(image: ImageInput) -> Optional[str]:
+    try:
+        return vlm_extract_markdown(image)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        print("[vlm] page failed", image_label(image), repr(e))
+        return None
+
+def vlm_extract_markdown_batch(images: List[ImageInput], batch_size: int = VLM_BATCH_SIZE) -> List[Optional[str]]:
+    """
+    多頁 VLM：每 batch_size 張圖一個請求，回傳跟 images 等長的 list
+    - 批次請求失敗或分隔標記對不上 → 該批退回逐頁呼叫
+    - 單頁也失敗的位置回 None（呼叫端用原本的 docling / OCR 文字）
+    """
+    out: List[Optional[str]] = []
+    size = max(1, batch_size)
+    for b in range(0, len(images), size):
+        group = images[b:b + size]
+        texts: Optional[List[str]] = None
+        if len(group) > 1:
+            try:
+                texts = _extract_group(group)
+                metrics.inc("vlm_batch_requests_total")
+            except JobCancelled:
+                raise
+            except Exception as e:
+                print("[vlm] batch failed, falling back to single pages", repr(e))
+            if texts is None:
+                metrics.inc("vlm_batch_fallback_total")
+        if texts is None:
+            texts = [_extract_single_safe(p) for p in group]
+        metrics.inc("vlm_pages_total", len(group))
+        out.extend(texts)
+    return out
@@ -1,26 +1,227 @@
-from typing import List, Dict, Any, Optional, Sequence
-from qdrant_client import QdrantClient
-from qdrant_client.http import models as qm
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, List, Dict, Any, Iterator, Optional, Sequence
+import functools
+import threading
+import time
 import uuid
 
-from app.services.config import QDRANT_URL, QDRANT_COLLECTION, QDRANT_VECTOR_SIZE
+from app.services.config import (
+    QDRANT_URL,
+    QDRANT_COLLECTION,
+    QDRANT_VECTOR_SIZE,
+    QDRANT_QUANTIZATION,
+    QDRANT_QUANTIZATION_ALWAYS_RAM,
+    QDRANT_QUANTIZATION_RESCORE,
+    QDRANT_QUANTIZATION_OVERSAMPLING,
+    QDRANT_ON_DISK_VECTORS,
+    QDRANT_ON_DISK_PAYLOAD,
+    QDRANT_HNSW_M,
+    QDRANT_HNSW_EF_CONSTRUCT,
+    QDRANT_HNSW_EF,
+)
 from app.services.embeddings import embed_texts
 
-_client = QdrantClient(url=QDRANT_URL)
+if TYPE_CHECKING:
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models as qm
 
-def ensure_collection() -> None:
-    existing = [c.name for c in _client.get_collections().collections]
-    if QDRANT_COLLECTION in existing:
-        return
+_client: Optional[QdrantClient] = None
+_client_lock = threading.Lock()
 
-    _client.create_collection(
-        collection_name=QDRANT_COLLECTION,
-        vectors_config=qm.VectorParams(
-            size=QDRANT_VECTOR_SIZE,
+# collection + payload index 是否已確認存在（process 內快取；後端出錯就失效）
+_READY: Dict[str, Any] = {"ready": False, "error": None, "checked_at": None}
+
+def _models():
+    """qdrant_client 很重（import 約 1 秒），第一次用到才載入"""
+    from qdrant_client.http import models
+    return models
+
+def get_client() -> QdrantClient:
+    """第一次使用才建立 client（不在 import 時連線）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from qdrant_client import QdrantClient
+                _client = QdrantClient(url=QDRANT_URL)
+    return _client
+
+def invalidate_readiness(err: Optional[BaseException] = None) -> None:
+    _READY["ready"] = False
+    _READY["error"] = f"{type(err).__name__}: {err}" if err is not None else None
+    _READY["checked_at"] = time.time()
+
+def readiness() -> Dict[str, Any]:
+    return dict(_READY)
+
+def _invalidate_on_error(fn):
+    """Qdrant / 連線錯誤 → 讓 readiness 快取失效，下次呼叫重新確認 collection"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            from qdrant_client.http.exceptions import ApiException
+            if isinstance(e, (ApiException, OSError)):
+                invalidate_readiness(e)
+            raise
+    return wrapper
+
+# run_job 寫進 payload、/v1/search 可以過濾的欄位 → 建 payload index，過濾時不用掃全部 points
+# 值為 qm.PayloadSchemaType
+PAYLOAD_INDEXES: Dict[str, str] = {
+    "job_id": "keyword",
+    "filename": "keyword",
+    "used_route": "keyword",
+    "page": "integer",
+    "ocr_score": "float",
+    "ingested_at": "float",  # 增量匯出（corpus_export）用
+}
+
+# 範圍條件：filter key -> (payload 欄位, Range 參數)
+RANGE_FILTERS: Dict[str, tuple] = {
+    "ocr_score_min": ("ocr_score", "gte"),
+    "ocr_score_max": ("ocr_score", "lte"),
+    "ingested_after": ("ingested_at", "gt"),
+    "ingested_until": ("ingested_at", "lte"),
+}
+
+# collection 設定 profile（config.py 的預設值；benchmark 會自己組不同 profile 比較）
+DEFAULT_PROFILE: Dict[str, Any] = {
+    "quantization": QDRANT_QUANTIZATION,
+    "always_ram": QDRANT_QUANTIZATION_ALWAYS_RAM,
+    "rescore": QDRANT_QUANTIZATION_RESCORE,
+    "oversampling": QDRANT_QUANTIZATION_OVERSAMPLING,
+    "on_disk_vectors": QDRANT_ON_DISK_VECTORS,
+    "on_disk_payload": QDRANT_ON_DISK_PAYLOAD,
+    "hnsw_m": QDRANT_HNSW_M,
+    "hnsw_ef_construct": QDRANT_HNSW_EF_CONSTRUCT,
+    "hnsw_ef": QDRANT_HNSW_EF,
+}
+
+def collection_create_kwargs(profile: Optional[Dict[str, Any]] = None, size: int = QDRANT_VECTOR_SIZE) -> Dict[str, Any]:
+    """
+    profile → create_collection 參數（vectors / HNSW / 量化 / on-disk）
+    """
+    qm = _models()
+    p = {**DEFAULT_PROFILE, **(profile or {})}
+    quant = (p.get("quantization") or "none").lower()
+
+    quantization_config = None
+    if quant == "scalar":
+        quantization_config = qm.ScalarQuantization(
+            scalar=qm.ScalarQuantizationConfig(
+                type=qm.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=p["always_ram"],
+            )
+        )
+    elif quant == "binary":
+        quantization_config = qm.BinaryQuantization(
+            binary=qm.BinaryQuantizationConfig(always_ram=p["always_ram"])
+        )
+    elif quant != "none":
+        raise ValueError(f"unknown QDRANT_QUANTIZATION: {quant}")
+
+    return {
+        "vectors_config": qm.VectorParams(
+            size=size,
             distance=qm.Distance.COSINE,
+            on_disk=p["on_disk_vectors"],
+        ),
+        "hnsw_config": qm.HnswConfigDiff(m=p["hnsw_m"], ef_construct=p["hnsw_ef_construct"]),
+        "quantization_config": quantization_config,
+        "on_disk_payload": p["on_disk_payload"],
+    }
+
+def search_params(profile: Optional[Dict[str, Any]] = None, exact: bool = False) -> Optional[qm.SearchParams]:
+    """
+    查詢時參數：hnsw_ef、量化 rescore / oversampling；全部預設就回傳 None
+    """
+    qm = _models()
+    p = {**DEFAULT_PROFILE, **(profile or {})}
+    quant = (p.get("quantization") or "none").lower()
+    if not exact and not p.get("hnsw_ef") and quant == "none":
+        return None
+    return qm.SearchParams(
+        hnsw_ef=p.get("hnsw_ef") or None,
+        exact=exact,
+        quantization=(
+            qm.QuantizationSearchParams(rescore=p["rescore"], oversampling=p["oversampling"])
+            if quant != "none" else None
         ),
     )
 
+def ensure_payload_indexes(collection: Optional[str] = None) -> None:
+    """補齊缺少的 payload index（舊 collection 也適用）"""
+    qm = _models()
+    client = get_client()
+    collection = collection or resolve_collection()
+    schema = client.get_collection(collection).payload_schema or {}
+    for field, ftype in PAYLOAD_INDEXES.items():
+        if field not in schema:
+            client.create_payload_index(
+                collection_name=collection,
+                field_name=field,
+                field_schema=qm.PayloadSchemaType(ftype),
+            )
+
+def aliases() -> Dict[str, str]:
+    """alias → 實體 collection"""
+    return {a.alias_name: a.collection_name for a in get_client().get_aliases().aliases}
+
+def resolve_collection(name: str = QDRANT_COLLECTION) -> str:
+    """QDRANT_COLLECTION 是 alias 時回傳它指向的實體 collection，否則原樣回傳（舊部署直接用實體名稱）"""
+    return aliases().get(name, name)
+
+@_invalidate_on_error
+def switch_alias(target: str, alias: str = QDRANT_COLLECTION) -> Optional[str]:
+    """
+    把 alias 改指到 target（刪舊 alias + 建新 alias 在同一個請求裡，Qdrant 原子套用，搜尋不會中斷）
+    回傳原本指向的 collection
+    """
+    qm = _models()
+    previous = aliases().get(alias)
+    ops: List[Any] = []
+    if previous is not None:
+        ops.append(qm.DeleteAliasOperation(delete_alias=qm.DeleteAlias(alias_name=alias)))
+    ops.append(qm.CreateAliasOperation(create_alias=qm.CreateAlias(collection_name=target, alias_name=alias)))
+    get_client().update_collection_aliases(change_aliases_operations=ops)
+    invalidate_readiness()
+    return previous
+
+@_invalidate_on_error
+def ensure_collection() -> None:
+    """
+    確認 collection + payload index；成功後快取在 process 內，
+    熱路徑（每個 job / 每次搜尋）不再多打一次 get_collections
+    - 新部署建成實體 collection {QDRANT_COLLECTION}__v1 + alias QDRANT_COLLECTION，之後換 embedding 模型可以無中斷切換（見 reembed.py）
+    - 已經存在的同名實體 collection（舊部署）照用
+    """
+    if _READY["ready"]:
+        return
+    client = get_client()
+    if QDRANT_COLLECTION not in aliases() and not client.collection_exists(QDRANT_COLLECTION):
+        physical = f"{QDRANT_COLLECTION}__v1"
+        if not client.collection_exists(physical):
+            client.create_collection(
+                collection_name=physical,
+                **collection_create_kwargs(),
+            )
+        switch_alias(physical)
+    ensure_payload_indexes()
+    _READY.update({"ready": True, "error": None, "checked_at": time.time()})
+
+def warmup() -> Dict[str, Any]:
+    """啟動時呼叫：建立連線、確認 collection / index"""
+    invalidate_readiness()
+    ensure_collection()
+    return readiness()
+
+def point_id(job_id: str, chunk_index: int) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{job_id}-{chunk_index}"))
+
 def upsert_chunks(
     chunks: List[str],
     vectors: List[List[float]],
@@ -28,6 +229,9 @@ def upsert_chunks(
     per_chunk_meta: Optional[Sequence[Dict[str, Any]]] = None,
     batch_size: int = 128,
     wait: bool = True,
+    start_index: int = 0,
+    indices: Optional[Sequence[int]] = None,
+    job_ids: Optional[Sequence[str]] = None,
 ) -> List[str]:
     """
     Upsert chunks + vectors into Qdrant.
@@ -36,6 +240,11 @@ def upsert_chunks(
     - meta 會寫進每個 point 的 payload（job_id / filename / route 等）
     - per_chunk_meta 若提供，會「逐 chunk」merge 到 payload（例如 page / used_route / ocr_score / image...）
     - 回傳每個 chunk 對應的 qdrant point id（字串）
+    - payload 一律帶 ingested_at（寫入時間，epoch 秒；重寫同一個 point 會更新）
+    - start_index：分批寫入時這批第一個 chunk 在整份文件的 index（point id 才會跟一次寫入時相同）
+    - indices：只寫部分 chunk（例如去重後）時，每個 chunk 在整份文件的 index；給了就忽略 start_index
+    - job_ids：跨文件批次寫入（bulk ingest）時每個 chunk 所屬的 job，point id 依它計算；
+      文件層級欄位（job_id / filename / route）改放在 per_chunk_meta
     """
     if len(chunks) != len(vectors):
         raise ValueError(f"chunks/vectors length mismatch: {len(chunks)} != {len(vectors)}")
@@ -46,31 +255,36 @@ def upsert_chunks(
         # 改成「能用多少用多少」
         pass
 
+    qm = _models()
     job_id = str(meta.get("job_id", "job"))
+    ingested_at = time.time()
     ids: List[str] = []
 
+    @_invalidate_on_error
     def _do_upsert(points: List[qm.PointStruct]) -> None:
         # qdrant-client 版本差異：有的支援 wait 參數，有的沒有
         try:
-            _client.upsert(collection_name=QDRANT_COLLECTION, points=points, wait=wait)
+            get_client().upsert(collection_name=QDRANT_COLLECTION, points=points, wait=wait)
         except TypeError:
-            _client.upsert(collection_name=QDRANT_COLLECTION, points=points)
+            get_client().upsert(collection_name=QDRANT_COLLECTION, points=points)
 
     buf: List[qm.PointStruct] = []
 
-    for idx, (text, vec) in enumerate(zip(chunks, vectors)):
+    for i, (text, vec) in enumerate(zip(chunks, vectors)):
+        idx = indices[i] if indices is not None else start_index + i
         # 穩定可重現的 id（同 job 同 idx 會固定）
-        pid = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{job_id}-{idx}"))
+        pid = point_id(job_ids[i] if job_ids is not None else job_id, idx)
         ids.append(pid)
 
         payload: Dict[str, Any] = {
             **meta,
             "chunk_index": idx,
             "text": text,
+            "ingested_at": ingested_at,
         }
 
-        if per_chunk_meta is not None and idx < len(per_chunk_meta):
-            extra = per_chunk_meta[idx] or {}
+        if per_chunk_meta is not None and i < len(per_chunk_meta):
+            extra = per_chunk_meta[i] or {}
             if isinstance(extra, dict):
                 # per-chunk 欄位覆蓋/補上
                 payload.update(extra)
@@ -86,16 +300,31 @@ def upsert_chunks(
 
     return ids
 
-def qdrant_search(query: str, limit: int = 5) -> List[Dict[str, Any]]:
-    ensure_collection()
-    qvec = embed_texts([query])[0]
-    res = _client.search(
-        collection_name=QDRANT_COLLECTION,
-        query_vector=qvec,
-        limit=limit,
-        with_payload=True,
-    )
+def build_filter(filters: Optional[Dict[str, Any]]) -> Optional[qm.Filter]:
+    """
+    把 filter dict 轉成 Qdrant Filter（None 值忽略）：
+    - job_id / filename / page / used_route → 等值
+    - ocr_score_min / ocr_score_max → ocr_score 範圍
+    - ingested_after / ingested_until → ingested_at 範圍（epoch 秒）
+    """
+    if not filters:
+        return None
+    qm = _models()
+    must: List[qm.FieldCondition] = []
+    ranges: Dict[str, Dict[str, float]] = {}
+    for k, v in filters.items():
+        if v is None:
+            continue
+        if k in RANGE_FILTERS:
+            field, op = RANGE_FILTERS[k]
+            ranges.setdefault(field, {})[op] = v
+        else:
+            must.append(qm.FieldCondition(key=k, match=qm.MatchValue(value=v)))
+    for field, bounds in ranges.items():
+        must.append(qm.FieldCondition(key=field, range=qm.Range(**bounds)))
+    return qm.Filter(must=must) if must else None
 
+def _to_hits(res) -> List[Dict[str, Any]]:
     hits = []
     for r in res:
         hits.append({
@@ -104,3 +333,109 @@ def qdrant_search(query: str, limit: int = 5) -> List[Dict[str, Any]]:
             "payload": r.payload,
         })
     return hits
+
+@_invalidate_on_error
+def _search(**kwargs):
+    return get_client().search(**kwargs)
+
+@_invalidate_on_error
+def _search_batch(search_requests: List[qm.SearchRequest]):
+    return get_client().search_batch(collection_name=QDRANT_COLLECTION, requests=search_requests)
+
+def qdrant_search(
+    query: str,
+    limit: int = 5,
+    filters: Optional[Dict[str, Any]] = None,
+    offset: int = 0,
+    score_threshold: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    filters 直接下推到 Qdrant（有 payload index），offset 用於分頁
+    """
+    ensure_collection()
+    qvec = embed_texts([query])[0]
+    res = _search(
+        collection_name=QDRANT_COLLECTION,
+        query_vector=qvec,
+        query_filter=build_filter(filters),
+        search_params=search_params(),
+        limit=limit,
+        offset=offset,
+        score_threshold=score_threshold,
+        with_payload=True,
+    )
+    return _to_hits(res)
+
+def qdrant_search_batch(queries: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    一次 embedding + 一次 Qdrant search_batch：
+    - queries: [{"q": str, "limit": int, "filter": {...} | None, "score_threshold": float | None}, ...]
+    - 回傳順序與 queries 相同；相同的 query 文字只 embed 一次
+    """
+    if not queries:
+        return []
+    ensure_collection()
+
+    qm = _models()
+    texts = list(dict.fromkeys(q["q"] for q in queries))
+    vec_by_text = dict(zip(texts, embed_texts(texts)))
+
+    search_requests = [
+        qm.SearchRequest(
+            vector=vec_by_text[q["q"]],
+            limit=int(q.get("limit") or 5),
+            filter=build_filter(q.get("filter")),
+            score_threshold=q.get("score_threshold"),
+            params=search_params(),
+            with_payload=True,
+        )
+        for q in queries
+    ]
+    res = _search_batch(search_requests)
+    return [_to_hits(r) for r in res]
+
+@_invalidate_on_error
+def _scroll(collection: str, **kwargs):
+    return get_client().scroll(collection_name=collection, **kwargs)
+
+def scroll_points(
+    filters: Optional[Dict[str, Any]] = None,
+    with_vectors: bool = False,
+    batch_size: int = 1000,
+    collection: Optional[str] = None,
+    offset: Any = None,
+) -> Iterator[List[Any]]:
+    """
+    逐批掃過 collection（匯出 / 重新 embedding 用），每次 yield 一批 Record（.id / .payload / .vector）
+    - filters 跟 build_filter 相同；collection 預設 QDRANT_COLLECTION（alias 也可以）
+    - offset：從上次 scroll 停下的 point 接著掃
+    """
+    flt = build_filter(filters)
+    while True:
+        records, offset = _scroll(
+            collection or QDRANT_COLLECTION,
+            scroll_filter=flt,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=with_vectors,
+        )
+        if records:
+            yield records
+        if offset is None:
+            return
+
+@_invalidate_on_error
+def delete_job_points(job_id: str) -> None:
+    """
+    刪除某個 job 寫入的所有 points（取消 / 清理用）
+    """
+    qm = _models()
+    get_client().delete(
+        collection_name=QDRANT_COLLECTION,
+        points_selector=qm.FilterSelector(
+            filter=qm.Filter(
+                must=[qm.FieldCondition(key="job_id", match=qm.MatchValue(value=job_id))]
+            )
+        ),
+    )
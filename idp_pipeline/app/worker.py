@@ -0,0 +1,161 @@
+"""
+獨立 worker：從共享佇列領 job 來跑 run_job，跟 API process 分開擴展。
+
+    JOB_EXECUTOR=queue python -m app.worker --processes 2 --threads 4
+
+- 每個 process 一個 claim loop + ThreadPoolExecutor（threads 條 job 同時跑）
+- 每 WORKER_HEARTBEAT_SEC 寫一次 heartbeat；別的 worker 發現 heartbeat 過期會把它的 job 放回佇列
+- retention sweeper 只在一個 process 跑（單 process 就是它自己，多 process 時由父 process 負責）
+- SIGTERM / SIGINT：停止領新 job，等進行中的 job 跑完（最多 WORKER_SHUTDOWN_GRACE_SEC），
+  逾時就取消它們（走 run_job 的取消清理流程）
+"""
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.config import (
+    JOB_EXECUTOR,
+    WORKER_PROCESSES,
+    WORKER_THREADS,
+    WORKER_POLL_SEC,
+    WORKER_HEARTBEAT_SEC,
+    WORKER_STALE_SEC,
+    WORKER_SHUTDOWN_GRACE_SEC,
+)
+from app.services import job_queue
+
+
+def _worker_loop(threads: int, sweeper: bool = True) -> None:
+    # 延後 import：multiprocessing spawn 出來的子 process 各自建立 Qdrant / Neo4j client
+    from app.services.jobs import run_job, cancel_running_jobs
+    from app.services.backends import warmup_all, shutdown_all
+    from app.services.retention import start_sweeper, stop_sweeper
+
+    warmup_all()
+    if sweeper:
+        start_sweeper()
+
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    stop = threading.Event()
+    active: set[str] = set()
+    lock = threading.Lock()
+    stats = {"processed": 0, "started_at": time.time()}
+
+    def _on_signal(signum, _frame):
+        print(f"[worker] {worker_id} got signal {signum}, draining...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _on_signal)
+    signal.signal(signal.SIGINT, _on_signal)
+
+    def _heartbeat() -> None:
+        while True:
+            with lock:
+                info = {
+                    "pid": os.getpid(),
+                    "host": socket.gethostname(),
+                    "threads": threads,
+                    "active_jobs": sorted(active),
+                    "processed": stats["processed"],
+                    "started_at": stats["started_at"],
+                    "draining": stop.is_set(),
+                }
+            job_queue.write_heartbeat(worker_id, info)
+            try:
+                job_queue.requeue_stale(WORKER_STALE_SEC)
+            except OSError as e:
+                print("[worker] requeue_stale failed", repr(e))
+            if stop.wait(WORKER_HEARTBEAT_SEC):
+                return
+
+    def _run_one(job_id: str) -> None:
+        try:
+            run_job(job_id)
+        except Exception as e:  # run_job 自己會記錄 failed，這裡只防 worker thread 爆掉
+            print("[worker] run_job crashed", job_id, repr(e))
+        finally:
+            job_queue.ack(job_id, worker_id)
+            with lock:
+                active.discard(job_id)
+                stats["processed"] += 1
+
+    hb = threading.Thread(target=_heartbeat, name="worker-heartbeat", daemon=True)
+    hb.start()
+    print(f"[worker] {worker_id} started threads={threads}")
+
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="job")
+    try:
+        while not stop.is_set():
+            with lock:
+                busy = len(active) >= threads
+            job_id = None if busy else job_queue.claim(worker_id)
+            if job_id is None:
+                stop.wait(WORKER_POLL_SEC)
+                continue
+            with lock:
+                active.add(job_id)
+            pool.submit(_run_one, job_id)
+    finally:
+        # graceful shutdown：等進行中的 job，逾時就取消
+        deadline = time.time() + WORKER_SHUTDOWN_GRACE_SEC
+        while time.time() < deadline:
+            with lock:
+                if not active:
+                    break
+            time.sleep(0.5)
+        with lock:
+            leftover = bool(active)
+        if leftover:
+            print(f"[worker] {worker_id} grace period over, cancelling", cancel_running_jobs("worker_shutdown"))
+        pool.shutdown(wait=True)
+        job_queue.remove_heartbeat(worker_id)
+        if sweeper:
+            stop_sweeper()
+        shutdown_all()
+        print(f"[worker] {worker_id} stopped, processed={stats['processed']}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="IDP pipeline worker")
+    ap.add_argument("--processes", type=int, default=WORKER_PROCESSES, help="worker process 數")
+    ap.add_argument("--threads", type=int, default=WORKER_THREADS, help="每個 process 同時跑的 job 數")
+    args = ap.parse_args()
+
+    if JOB_EXECUTOR != "queue":
+        print("[worker] warning: JOB_EXECUTOR != queue，API 不會把 job 丟進共享佇列")
+
+    if args.processes <= 1:
+        _worker_loop(args.threads)
+        return
+
+    ctx = mp.get_context("spawn")
+    procs = [ctx.Process(target=_worker_loop, args=(args.threads, False), name=f"worker-{i}") for i in range(args.processes)]
+    for p in procs:
+        p.start()
+
+    # 所有子 process 共用同一批目錄，sweeper 只需要一份
+    from app.services.retention import start_sweeper, stop_sweeper
+
+    start_sweeper()
+
+    def _forward(signum, _frame):
+        for p in procs:
+            if p.is_alive():
+                os.kill(p.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, _forward)
+    signal.signal(signal.SIGINT, _forward)
+
+    for p in procs:
+        p.join()
+    stop_sweeper()
+
+
+if __name__ == "__main__":
+    main()
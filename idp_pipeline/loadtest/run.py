@@ -0,0 +1,340 @@
+"""
+對 gateway 跑情境壓測，輸出 throughput / p50 / p95 / p99 / 429 與 5xx 比例 / job 完成時間：
+
+    python -m loadtest.run loadtest/scenarios/mixed.json --base-url http://localhost:8080
+    python -m loadtest.run loadtest/scenarios/upload_burst.json --label "jobs_rps=3r/s burst=10" --out result.json
+
+情境檔（JSON）：
+    {
+      "name": "mixed",
+      "duration_sec": 60, "warmup_sec": 5,
+      "users": 20,              # 同時在跑的虛擬使用者（closed loop）
+      "rate_rps": null,         # 有設就把所有使用者合起來的送出速率壓在這個值（open loop 近似）
+      "think_time_sec": 0.2,
+      "poll": {"interval_sec": 1.0, "timeout_sec": 300},
+      "actions": [
+        {"name": "upload", "weight": 1, "method": "POST", "path": "/v1/jobs", "upload": "sample.pdf", "poll": true},
+        {"name": "search", "weight": 6, "method": "GET", "path": "/v1/search", "params": {"q": ["付款", "合約"], "limit": 5}},
+        {"name": "graphrag", "weight": 2, "method": "GET", "path": "/v1/graphrag", "params": {"keyword": ["付款"], "stream": true}}
+      ]
+    }
+
+- params 的值是 list 時每次隨機挑一個；upload 路徑相對於情境檔，檔案不存在就用內建的單頁 PDF
+- poll=true：建立 job 後在背景輪詢 /v1/jobs/{id}（輪詢本身也算進統計，名稱為 poll），直到 finished / failed / cancelled
+- 延遲從送出到讀完 body；串流回應另外記 ttfb（第一個 byte）
+- 同一份情境 + --seed 會產生相同的請求序列，方便調整 nginx 參數前後對照
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+
+TERMINAL = ("finished", "failed", "cancelled")
+
+
+def _pct(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+
+def _sample_pdf(text: str = "load test sample page") -> bytes:
+    """最小的單頁 PDF（含一行文字），不需要額外套件"""
+    stream = f"BT /F1 24 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+    objs = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objs, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    for off in offsets:
+        out += f"{off:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+class Recorder:
+    """收集每個請求的結果；warmup 期間與結束後（收尾輪詢）送出的請求不計入"""
+
+    def __init__(self, measure_from: float, measure_until: float):
+        self.measure_from = measure_from
+        self.measure_until = measure_until
+        self.samples: Dict[str, List[Dict[str, Any]]] = {}
+        self.jobs: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, t_start: float, sec: float, status: Optional[int], ttfb: Optional[float] = None) -> None:
+        if not (self.measure_from <= t_start < self.measure_until):
+            return
+        with self._lock:
+            self.samples.setdefault(name, []).append({"sec": sec, "status": status, "ttfb": ttfb, "t": t_start})
+
+    def add_job(self, created_at: float, sec: float, status: str) -> None:
+        if created_at < self.measure_from:
+            return
+        with self._lock:
+            self.jobs.append({"sec": sec, "status": status})
+
+
+class Runner:
+    def __init__(self, scenario: Dict[str, Any], base_url: str, scenario_dir: str, seed: int, timeout: float):
+        self.sc = scenario
+        self.base_url = base_url.rstrip("/")
+        self.scenario_dir = scenario_dir
+        self.seed = seed
+        self.timeout = timeout
+        self.actions = scenario["actions"]
+        self.weights = [float(a.get("weight", 1)) for a in self.actions]
+        self.poll_cfg = {"interval_sec": 1.0, "timeout_sec": 300, **(scenario.get("poll") or {})}
+        self._uploads: Dict[str, bytes] = {}
+        self._pace_lock = threading.Lock()
+        self._next_slot = 0.0
+        self._local = threading.local()
+        self.stop_at = 0.0
+        self.rec: Optional[Recorder] = None
+        self._pollers = ThreadPoolExecutor(max_workers=int(scenario.get("poll_workers", 32)), thread_name_prefix="poll")
+
+    # ---- helpers ----
+    def _session(self) -> requests.Session:
+        # 每個 thread 一個 Session（keepalive 連線重用，跟真實 client 一樣）
+        s = getattr(self._local, "session", None)
+        if s is None:
+            s = requests.Session()
+            self._local.session = s
+        return s
+
+    def _upload_bytes(self, rel: Optional[str]) -> bytes:
+        key = rel or ""
+        if key not in self._uploads:
+            path = os.path.join(self.scenario_dir, rel) if rel else ""
+            if path and os.path.exists(path):
+                with open(path, "rb") as f:
+                    self._uploads[key] = f.read()
+            else:
+                self._uploads[key] = _sample_pdf()
+        return self._uploads[key]
+
+    def _pace(self) -> None:
+        rps = self.sc.get("rate_rps")
+        if not rps:
+            return
+        with self._pace_lock:
+            now = time.time()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / float(rps)
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _request(self, name: str, method: str, path: str, **kwargs: Any) -> Optional[requests.Response]:
+        t0 = time.time()
+        p0 = time.perf_counter()
+        ttfb = None
+        status: Optional[int] = None
+        resp = None
+        try:
+            resp = self._session().request(method, self.base_url + path, timeout=self.timeout, stream=True, **kwargs)
+            status = resp.status_code
+            body = bytearray()
+            for chunk in resp.iter_content(chunk_size=None):
+                if ttfb is None:
+                    ttfb = time.perf_counter() - p0
+                body += chunk
+            resp._content = bytes(body)
+        except requests.RequestException:
+            status = None  # 連線錯誤 / client timeout
+        self.rec.add(name, t0, time.perf_counter() - p0, status, ttfb)
+        return resp
+
+    # ---- actions ----
+    def _do(self, action: Dict[str, Any], rng: random.Random) -> None:
+        params = {
+            k: (rng.choice(v) if isinstance(v, list) else v)
+            for k, v in (action.get("params") or {}).items()
+        }
+        kwargs: Dict[str, Any] = {"params": params}
+        if "upload" in action:
+            kwargs["files"] = {"file": (os.path.basename(action["upload"] or "sample.pdf"), self._upload_bytes(action["upload"]), "application/pdf")}
+        if "json" in action:
+            kwargs["json"] = action["json"]
+        resp = self._request(action["name"], action.get("method", "GET"), action["path"], **kwargs)
+
+        if action.get("poll") and resp is not None and resp.status_code == 200:
+            try:
+                job_id = resp.json()["job_id"]
+            except (ValueError, KeyError):
+                return
+            self._pollers.submit(self._poll_job, job_id, time.time())
+
+    def _poll_job(self, job_id: str, created_at: float) -> None:
+        interval = float(self.poll_cfg["interval_sec"])
+        deadline = created_at + float(self.poll_cfg["timeout_sec"])
+        status = "timeout"
+        while time.time() < deadline:
+            time.sleep(interval)
+            resp = self._request("poll", "GET", f"/v1/jobs/{job_id}")
+            if resp is None or resp.status_code != 200:
+                continue
+            try:
+                s = resp.json().get("status")
+            except ValueError:
+                continue
+            if s in TERMINAL:
+                status = s
+                break
+        self.rec.add_job(created_at, time.time() - created_at, status)
+
+    def _user(self, uid: int) -> None:
+        rng = random.Random(self.seed * 1000 + uid)
+        think = float(self.sc.get("think_time_sec", 0))
+        while time.time() < self.stop_at:
+            self._pace()
+            if time.time() >= self.stop_at:
+                break
+            action = rng.choices(self.actions, weights=self.weights, k=1)[0]
+            self._do(action, rng)
+            if think > 0:
+                time.sleep(rng.uniform(0.5, 1.5) * think)
+
+    def run(self) -> Dict[str, Any]:
+        duration = float(self.sc.get("duration_sec", 60))
+        warmup = float(self.sc.get("warmup_sec", 0))
+        users = int(self.sc.get("users", 10))
+        t0 = time.time()
+        self.stop_at = t0 + warmup + duration
+        self.rec = Recorder(measure_from=t0 + warmup, measure_until=self.stop_at)
+
+        threads = [threading.Thread(target=self._user, args=(i,), daemon=True) for i in range(users)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # 等還在輪詢的 job（最多 poll.timeout_sec）
+        self._pollers.shutdown(wait=True)
+        return report(self.rec, duration)
+
+
+def report(rec: Recorder, duration: float) -> Dict[str, Any]:
+    endpoints = {}
+    for name, rows in sorted(rec.samples.items()):
+        lat = [r["sec"] for r in rows]
+        ok = [r["sec"] for r in rows if r["status"] is not None and r["status"] < 400]
+        n = len(rows)
+        count = lambda pred: sum(1 for r in rows if pred(r["status"]))  # noqa: E731
+        ttfb = [r["ttfb"] for r in rows if r["ttfb"] is not None]
+        endpoints[name] = {
+            "requests": n,
+            "rps": round(n / duration, 2),
+            "p50_ms": _ms(_pct(lat, 50)),
+            "p95_ms": _ms(_pct(lat, 95)),
+            "p99_ms": _ms(_pct(lat, 99)),
+            "max_ms": _ms(max(lat) if lat else None),
+            "ok_p99_ms": _ms(_pct(ok, 99)),
+            "ttfb_p50_ms": _ms(_pct(ttfb, 50)),
+            "ttfb_p95_ms": _ms(_pct(ttfb, 95)),
+            "rate_429": round(count(lambda s: s == 429) / n, 4) if n else 0.0,
+            "rate_5xx": round(count(lambda s: s is not None and s >= 500) / n, 4) if n else 0.0,
+            "rate_conn_error": round(count(lambda s: s is None) / n, 4) if n else 0.0,
+            "status": _status_counts(rows),
+        }
+    job_sec = [j["sec"] for j in rec.jobs if j["status"] == "finished"]
+    jobs = {
+        "created": len(rec.jobs),
+        "by_status": _counts(j["status"] for j in rec.jobs),
+        "completion_p50_sec": _round(_pct(job_sec, 50)),
+        "completion_p95_sec": _round(_pct(job_sec, 95)),
+        "completion_p99_sec": _round(_pct(job_sec, 99)),
+    }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {"duration_sec": duration, "total_requests": total, "total_rps": round(total / duration, 2),
+            "endpoints": endpoints, "jobs": jobs}
+
+
+def _ms(v: Optional[float]) -> Optional[float]:
+    return round(v * 1000, 1) if v is not None else None
+
+
+def _round(v: Optional[float]) -> Optional[float]:
+    return round(v, 2) if v is not None else None
+
+
+def _counts(items) -> Dict[str, int]:
+    out: Dict[str, int] = {}
+    for it in items:
+        out[it] = out.get(it, 0) + 1
+    return out
+
+
+def _status_counts(rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    return _counts(str(r["status"]) if r["status"] is not None else "error" for r in rows)
+
+
+def print_report(res: Dict[str, Any]) -> None:
+    print()
+    print(f"{'endpoint':<12}{'req':>7}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'429':>8}{'5xx':>8}{'err':>8}")
+    for name, e in res["endpoints"].items():
+        print(f"{name:<12}{e['requests']:>7}{e['rps']:>8.2f}"
+              f"{_fmt(e['p50_ms'])}{_fmt(e['p95_ms'])}{_fmt(e['p99_ms'])}"
+              f"{e['rate_429']:>8.1%}{e['rate_5xx']:>8.1%}{e['rate_conn_error']:>8.1%}")
+    j = res["jobs"]
+    if j["created"]:
+        print(f"\njobs: created={j['created']} {j['by_status']} "
+              f"completion p50={j['completion_p50_sec']}s p95={j['completion_p95_sec']}s p99={j['completion_p99_sec']}s")
+    print(f"\ntotal: {res['total_requests']} requests, {res['total_rps']} req/s")
+
+
+def _fmt(v: Optional[float]) -> str:
+    return f"{v:>9.1f}" if v is not None else f"{'-':>9}"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("scenario", help="情境 JSON 檔")
+    ap.add_argument("--base-url", default="http://localhost:8080", help="gateway 位址")
+    ap.add_argument("--duration", type=float, default=None, help="覆蓋情境的 duration_sec")
+    ap.add_argument("--users", type=int, default=None, help="覆蓋情境的 users")
+    ap.add_argument("--rate", type=float, default=None, help="覆蓋情境的 rate_rps")
+    ap.add_argument("--timeout", type=float, default=180.0, help="client 端單一請求 timeout（秒）")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--label", default="", help="這次設定的說明（例如 nginx 參數），一起寫進結果")
+    ap.add_argument("--out", default=None, help="結果另存 JSON")
+    args = ap.parse_args()
+
+    with open(args.scenario, "r", encoding="utf-8") as f:
+        scenario = json.load(f)
+    for key, val in (("duration_sec", args.duration), ("users", args.users), ("rate_rps", args.rate)):
+        if val is not None:
+            scenario[key] = val
+
+    print(f"[loadtest] {scenario.get('name', args.scenario)} → {args.base_url} "
+          f"users={scenario.get('users', 10)} rate={scenario.get('rate_rps') or '-'} "
+          f"duration={scenario.get('duration_sec', 60)}s warmup={scenario.get('warmup_sec', 0)}s")
+    runner = Runner(scenario, args.base_url, os.path.dirname(os.path.abspath(args.scenario)), args.seed, args.timeout)
+    res = runner.run()
+    print_report(res)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"label": args.label, "base_url": args.base_url, "seed": args.seed,
+                       "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "scenario": scenario, **res},
+                      f, ensure_ascii=False, indent=2)
+        print(f"[loadtest] saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
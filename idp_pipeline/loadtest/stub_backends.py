@@ -0,0 +1,183 @@
+"""
+壓測用的本機替身服務（不需要 GPU / 外部模型）：
+
+    # 1) 模型後端替身：OpenAI 風格 chat.completions（OCR / VLM / LLM，含 stream）+ /embed
+    python -m loadtest.stub_backends models --port 9100 --chat-latency 0.8 --embed-latency 0.05
+    #    API 端把 OLM_API_URL / VLM_API_URL / LLM_API_URL 指到 http://127.0.0.1:9100/v1/chat/completions，
+    #    EMBED_API_URL 指到 http://127.0.0.1:9100/embed，就能跑完整流程（Qdrant / Neo4j 照常用 docker compose）
+
+    # 2) API 替身：只模擬 /v1/jobs、/v1/search、/v1/graphrag 的延遲與 job 生命週期，
+    #    放在 gateway 後面（uvicorn 原本的 :8000）單獨量 nginx 的 limit_req / keepalive / timeout
+    python -m loadtest.stub_backends api --port 8000 --search-latency 0.05 --graphrag-latency 1.5 --job-sec 8
+
+延遲用 lognormal（--jitter 控制離散程度），--error-rate 機率回 503，模擬後端尖峰與失敗。
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+import zlib
+from typing import Any, Dict
+
+from fastapi import FastAPI, File, Query, Request, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def _delay(mean: float, jitter: float) -> float:
+    if mean <= 0:
+        return 0.0
+    # lognormal，平均值維持在 mean
+    sigma = max(0.0, jitter)
+    return random.lognormvariate(math.log(mean) - sigma * sigma / 2, sigma)
+
+
+def _maybe_error(rate: float):
+    if rate > 0 and random.random() < rate:
+        return JSONResponse({"error": "stub overloaded"}, status_code=503)
+    return None
+
+
+# =========================
+# 模型後端替身
+# =========================
+def models_app(args: argparse.Namespace) -> FastAPI:
+    app = FastAPI(title="idp stub models")
+    answer = "這是壓測用的替身輸出。" * 20
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        err = _maybe_error(args.error_rate)
+        if err is not None:
+            return err
+        content = body["messages"][-1]["content"]
+        images = sum(1 for c in content if isinstance(c, dict) and c.get("type") == "image_url") if isinstance(content, list) else 0
+        # 圖片越多越慢（VLM 多頁批次）
+        total = _delay(args.chat_latency * max(1, images), args.jitter)
+
+        if images > 1:
+            text = "\n".join(f"<<<PAGE {k}>>>\n# Page\n{answer}" for k in range(1, images + 1))
+        else:
+            text = answer
+
+        if not body.get("stream"):
+            await asyncio.sleep(total)
+            return {"choices": [{"message": {"role": "assistant", "content": text}}]}
+
+        async def events():
+            pieces = [text[i:i + 8] for i in range(0, len(text), 8)]
+            step = total / max(1, len(pieces))
+            for p in pieces:
+                await asyncio.sleep(step)
+                yield f"data: {json.dumps({'choices': [{'delta': {'content': p}}]}, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        err = _maybe_error(args.error_rate)
+        if err is not None:
+            return err
+        texts = body.get("texts") or []
+        await asyncio.sleep(_delay(args.embed_latency, args.jitter) * max(1, len(texts)) ** 0.5)
+        out = []
+        for t in texts:
+            rnd = random.Random(zlib.crc32(t.encode("utf-8")))
+            v = [rnd.gauss(0, 1) for _ in range(args.dim)]
+            n = math.sqrt(sum(x * x for x in v)) or 1.0
+            out.append([x / n for x in v])
+        return {"embeddings": out}
+
+    return app
+
+
+# =========================
+# API 替身（gateway 後面）
+# =========================
+def api_app(args: argparse.Namespace) -> FastAPI:
+    app = FastAPI(title="idp stub api")
+    jobs: Dict[str, Dict[str, Any]] = {}
+
+    @app.post("/v1/jobs")
+    async def create_job(file: UploadFile = File(...)):
+        await file.read()
+        err = _maybe_error(args.error_rate)
+        if err is not None:
+            return err
+        job_id = uuid.uuid4().hex
+        jobs[job_id] = {"created_at": time.time(), "sec": _delay(args.job_sec, args.jitter)}
+        return {"job_id": job_id}
+
+    @app.get("/v1/jobs/{job_id}")
+    async def get_job(job_id: str):
+        job = jobs.get(job_id)
+        if job is None:
+            return {"job_id": job_id, "status": "failed", "error": "job_id not found"}
+        elapsed = time.time() - job["created_at"]
+        status = "finished" if elapsed >= job["sec"] else "running"
+        return {"job_id": job_id, "status": status}
+
+    @app.get("/v1/search")
+    async def search(q: str = Query(...), limit: int = 5):
+        err = _maybe_error(args.error_rate)
+        if err is not None:
+            return err
+        await asyncio.sleep(_delay(args.search_latency, args.jitter))
+        return {"query": q, "hits": [{"score": 1.0 - i * 0.01, "payload": {}} for i in range(limit)]}
+
+    @app.get("/v1/graphrag")
+    async def graphrag(keyword: str = Query(...), stream: bool = False):
+        err = _maybe_error(args.error_rate)
+        if err is not None:
+            return err
+        total = _delay(args.graphrag_latency, args.jitter)
+        if not stream:
+            await asyncio.sleep(total)
+            return {"keyword": keyword, "hits": [], "answer": "stub"}
+
+        async def events():
+            yield f"event: meta\ndata: {json.dumps({'keyword': keyword})}\n\n"
+            for _ in range(20):
+                await asyncio.sleep(total / 20)
+                yield "event: token\ndata: {\"text\": \"..\"}\n\n"
+            yield "event: done\ndata: {}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "component": "stub-api"}
+
+    return app
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("role", choices=["models", "api"])
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--jitter", type=float, default=0.3, help="lognormal sigma（0 = 固定延遲）")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="回 503 的機率")
+    # models
+    ap.add_argument("--chat-latency", type=float, default=0.8, help="每張圖 / 每次 chat 的平均秒數")
+    ap.add_argument("--embed-latency", type=float, default=0.05)
+    ap.add_argument("--dim", type=int, default=1024, help="embedding 維度（要跟 QDRANT_VECTOR_SIZE 一致）")
+    # api
+    ap.add_argument("--search-latency", type=float, default=0.05)
+    ap.add_argument("--graphrag-latency", type=float, default=1.5)
+    ap.add_argument("--job-sec", type=float, default=8.0, help="job 從建立到 finished 的平均秒數")
+    args = ap.parse_args()
+
+    import uvicorn
+
+    app = models_app(args) if args.role == "models" else api_app(args)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+把既有的 lineage JSON（含壓縮過的 .json.gz）補進 SQLite 索引：
+
+    python -m scripts.backfill_lineage_index
+    python -m scripts.backfill_lineage_index --dir ./data/lineage --skip-existing
+
+同一個 job_id 會整份覆蓋，重跑是安全的。
+"""
+import argparse
+import os
+import time
+
+from app.services import lineage_index
+from app.services.config import DATA_DIR
+from app.services.lineage import read_lineage
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dir", default=os.path.join(DATA_DIR, "lineage"), help="lineage JSON 目錄")
+    ap.add_argument("--skip-existing", action="store_true", help="索引裡已有的 job 跳過")
+    args = ap.parse_args()
+
+    existing = set()
+    if args.skip_existing:
+        existing = {r["job_id"] for r in lineage_index._conn().execute("SELECT job_id FROM jobs")}
+
+    t0 = time.time()
+    done = skipped = failed = 0
+    for name in sorted(os.listdir(args.dir)):
+        if not (name.endswith(".json") or name.endswith(".json.gz")):
+            continue
+        if name.split(".", 1)[0] in existing:
+            skipped += 1
+            continue
+        try:
+            lineage_index.index_lineage(read_lineage(os.path.join(args.dir, name)))
+            done += 1
+        except Exception as e:
+            failed += 1
+            print(f"[backfill] {name} failed: {e!r}")
+    print(f"[backfill] indexed={done} skipped={skipped} failed={failed} in {time.time() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+頁面分類特徵的 micro-benchmark：舊的逐字元版本 vs page_classify（逐頁 / 整份文件一次）
+
+    python -m scripts.bench_page_classify --pages 1000 --repeat 5
+    python -m scripts.bench_page_classify --pdf sample.pdf    # 用真實 PDF 的 docling 抽取文字
+
+- legacy：原本 run_job 裡的 looks_like_table + assess_ocr_quality（每頁兩個函式各掃一遍）
+- single：page_classify.features（每頁一次）
+- batch：page_classify.features_batch（整份文件一次，run_job 實際用的方式）
+- 同時比對三者的 table / quality / low_text 判斷，不一致時列出頁碼並以 exit code 1 結束
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from app.services import page_classify
+from app.services.config import (
+    PAGE_MIN_TEXT_CHARS, OCR_SHORT_TEXT_CHARS, TABLE_MIN_LINES, TABLE_MIN_COLUMN_LINES, TABLE_MIN_DIGIT_RATIO,
+)
+
+_ZH = "的一是在不了有和人這中大為上個國我以要他時來用們生到作地於出就分對成會可主發年動同工也能下過子說產種面而方後多定行學法所民得經十三之進著等部度家電力裡如水化高自二理起小物現實加量都兩體制機當使點從業本去把性好應開它合還因由其些然前外天政四日那社義事平形相全表間樣與關各重新線內數正心反你明看原又麼利比或但質氣第向道命此變條只沒結解問意建月公無系軍很情者最立代想已通並提直題黨程展五果料象員革位入常文總次品式活設及管特件長求老頭基資邊流路級少圖山統接知較將組見計別她手角期根論運農指幾九區強放決西被幹做必戰先回則任取據處理"
+
+
+def legacy_looks_like_table(t: str) -> bool:
+    t = (t or "").strip()
+    if not t:
+        return False
+    lines = [ln for ln in t.splitlines() if ln.strip()]
+    if len(lines) < TABLE_MIN_LINES:
+        return False
+    col_like = sum(1 for ln in lines if len(re.findall(r"\s{2,}", ln)) >= 2) >= TABLE_MIN_COLUMN_LINES
+    digit_ratio = sum(ch.isdigit() for ch in t) / max(1, len(t))
+    return col_like and digit_ratio > TABLE_MIN_DIGIT_RATIO
+
+
+def legacy_quality(text: str) -> float:
+    if not text:
+        return 0.0
+    t = text.strip()
+    if not t:
+        return 0.0
+    if len(t) < OCR_SHORT_TEXT_CHARS:
+        return 0.1
+    bad_ratio = sum(1 for ch in t if ch == "\ufffd" or ord(ch) < 9) / max(1, len(t))
+    cjk_ratio = sum(1 for ch in t if "\u4e00" <= ch <= "\u9fff") / max(1, len(t))
+    score = 0.7 * (1 - bad_ratio) + 0.3 * min(1.0, cjk_ratio * 3)
+    return max(0.0, min(1.0, score))
+
+
+def legacy(texts: List[str]) -> List[Dict[str, Any]]:
+    out = []
+    for t in texts:
+        s = (t or "").strip()
+        out.append({
+            "table": legacy_looks_like_table(s),
+            "quality": legacy_quality(s),
+            "low_text": len(s) < PAGE_MIN_TEXT_CHARS,
+        })
+    return out
+
+
+def synthetic_pages(n: int, seed: int) -> List[str]:
+    """中文段落 / 英文段落 / 空白對齊表格 / 幾乎空白（掃描頁）/ 亂碼 OCR 混合"""
+    rng = random.Random(seed)
+    words = ["invoice", "total", "amount", "section", "report", "the", "of", "and", "quarter", "revenue"]
+    pages = []
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.35:
+            paras = ["".join(rng.choice(_ZH) for _ in range(rng.randint(80, 200))) + "。" for _ in range(rng.randint(3, 8))]
+            pages.append("\n\n".join(paras))
+        elif kind < 0.55:
+            lines = [" ".join(rng.choice(words) for _ in range(rng.randint(8, 16))) for _ in range(rng.randint(10, 30))]
+            pages.append("\n".join(lines))
+        elif kind < 0.75:
+            rows = [f"項目{r:<4}  {rng.randint(0, 99999):>8}  {rng.random() * 1000:>10.2f}  {rng.choice('ABC')}"
+                    for r in range(rng.randint(5, 40))]
+            if rng.random() < 0.3:
+                rows = [r.replace("0", "０") for r in rows]  # 全形數字
+            pages.append("\r\n".join(rows))
+        elif kind < 0.85:
+            pages.append(rng.choice(["", "  ", "12", "第 3 頁", "\n\n  -  \n"]))
+        else:
+            chars = [rng.choice(_ZH + "\ufffd\x01\x02abc  \t\n") for _ in range(rng.randint(30, 600))]
+            pages.append("".join(chars))
+    return pages
+
+
+def pdf_pages(path: str) -> List[str]:
+    from app.services.pdf_extract import extract_pdf_pages
+
+    return [p.get("text") or "" for p in extract_pdf_pages(path)]
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> List[float]:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pages", type=int, default=1000, help="合成頁數")
+    ap.add_argument("--pdf", default=None, help="改用這份 PDF 的抽取文字")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--json", dest="json_out", default=None, help="把結果另存成 JSON")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    texts = pdf_pages(args.pdf) if args.pdf else synthetic_pages(args.pages, args.seed)
+    total_chars = sum(len(t) for t in texts)
+    print(f"[bench] pages={len(texts)} chars={total_chars} repeat={args.repeat}")
+
+    # 一致性
+    ref = legacy(texts)
+    batch = page_classify.features_batch(texts)
+    single = [page_classify.features(t) for t in texts]
+    mismatches = []
+    for i, (r, b, s) in enumerate(zip(ref, batch, single)):
+        for got in (b, s):
+            if got["table"] != r["table"] or got["low_text"] != r["low_text"] or abs(got["quality"] - r["quality"]) > 1e-9:
+                mismatches.append(i + 1)
+                break
+    print(f"[bench] mismatches: {len(mismatches)}" + (f" (pages {mismatches[:20]})" if mismatches else ""))
+
+    # 首次呼叫的 numpy import 不算進去
+    runs = {
+        "legacy": _time(lambda: legacy(texts), args.repeat),
+        "single": _time(lambda: [page_classify.features(t) for t in texts], args.repeat),
+        "batch": _time(lambda: page_classify.features_batch(texts), args.repeat),
+    }
+    results = []
+    base = statistics.median(runs["legacy"])
+    for name, secs in runs.items():
+        med = statistics.median(secs)
+        results.append({
+            "impl": name,
+            "median_ms": round(med * 1000, 3),
+            "best_ms": round(min(secs) * 1000, 3),
+            "us_per_page": round(med * 1e6 / max(1, len(texts)), 2),
+            "speedup": round(base / med, 2) if med > 0 else None,
+        })
+
+    print()
+    print(f"{'impl':<10}{'median ms':>12}{'best ms':>12}{'us/page':>10}{'speedup':>10}")
+    for r in results:
+        print(f"{r['impl']:<10}{r['median_ms']:>12.3f}{r['best_ms']:>12.3f}{r['us_per_page']:>10.2f}{r['speedup']:>10.2f}")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"pages": len(texts), "chars": total_chars, "mismatches": mismatches, "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"[bench] saved {args.json_out}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+比較不同 Qdrant collection profile 的 recall@k / 延遲 / 記憶體：
+
+    python -m scripts.bench_vector_profiles --n 50000 --queries 200 --k 10
+    python -m scripts.bench_vector_profiles --source collection --n 20000   # 用現有 collection 的真實向量
+
+- ground truth：baseline（float32、無量化）collection 上的 exact search
+- 每個 profile 建一個 bench_* collection，跑同一批 query，算 recall@k 與 p50/p95 延遲
+- 記憶體：依 profile 估算常駐 RAM（原始向量 / 量化向量 / HNSW 圖）；實際用量請對照 Qdrant 節點 RSS
+
+注意：random 向量分佈比真實 embedding 難搜，HNSW recall 會偏低；選 profile 時以 --source collection 為準。
+"""
+import argparse
+import json
+import statistics
+import time
+import uuid
+from typing import Any, Dict, List
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models as qm
+
+from app.services.config import QDRANT_URL, QDRANT_COLLECTION, QDRANT_VECTOR_SIZE, QDRANT_HNSW_M
+from app.services.vstore_qdrant import collection_create_kwargs, search_params
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "float": {"quantization": "none", "on_disk_vectors": False},
+    "float_ondisk": {"quantization": "none", "on_disk_vectors": True},
+    "scalar": {"quantization": "scalar", "on_disk_vectors": False, "rescore": True},
+    "scalar_ondisk": {"quantization": "scalar", "on_disk_vectors": True, "rescore": True},
+    "scalar_norescore": {"quantization": "scalar", "on_disk_vectors": True, "rescore": False},
+    "binary_ondisk": {"quantization": "binary", "on_disk_vectors": True, "rescore": True, "oversampling": 3.0},
+}
+
+
+def _load_vectors(client: QdrantClient, source: str, n: int, dim: int, seed: int) -> np.ndarray:
+    if source == "random":
+        rng = np.random.default_rng(seed)
+        v = rng.standard_normal((n, dim)).astype(np.float32)
+    else:
+        out: List[List[float]] = []
+        offset = None
+        while len(out) < n:
+            points, offset = client.scroll(
+                collection_name=QDRANT_COLLECTION,
+                limit=min(1000, n - len(out)),
+                offset=offset,
+                with_vectors=True,
+                with_payload=False,
+            )
+            out.extend(p.vector for p in points)
+            if offset is None:
+                break
+        if not out:
+            raise SystemExit(f"collection {QDRANT_COLLECTION} is empty")
+        v = np.asarray(out, dtype=np.float32)
+    v /= np.linalg.norm(v, axis=1, keepdims=True) + 1e-12
+    return v
+
+
+def _estimate_ram_mb(profile: Dict[str, Any], n: int, dim: int) -> float:
+    p = {"hnsw_m": QDRANT_HNSW_M, "always_ram": True, **profile}
+    total = 0.0
+    if not p.get("on_disk_vectors"):
+        total += n * dim * 4
+    quant = p.get("quantization", "none")
+    if quant != "none" and p.get("always_ram", True):
+        total += n * dim * (1 if quant == "scalar" else 1 / 8)
+    # HNSW：第 0 層 2m 條連結 + 上層約略；每條 4 bytes
+    total += n * p["hnsw_m"] * 2 * 4 * 1.1
+    return total / (1024 * 1024)
+
+
+def _wait_indexed(client: QdrantClient, name: str, timeout: float) -> None:
+    """等 collection 變 GREEN（索引 / 量化建完）；逾時或 RED 直接失敗，避免量到還在建索引的 collection"""
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        info = client.get_collection(name)
+        if info.status == qm.CollectionStatus.GREEN:
+            return
+        if info.status == qm.CollectionStatus.RED:
+            raise RuntimeError(f"collection {name} is RED: {info.optimizer_status}")
+        time.sleep(1)
+    raise RuntimeError(
+        f"collection {name} still {info.status} after {timeout:.0f}s "
+        f"(indexed {info.indexed_vectors_count}/{info.vectors_count}); raise --index-timeout"
+    )
+
+
+def _upload(client: QdrantClient, name: str, vectors: np.ndarray, profile: Dict[str, Any], index_timeout: float) -> float:
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    client.create_collection(collection_name=name, **collection_create_kwargs(profile, size=vectors.shape[1]))
+    t0 = time.time()
+    batch = 512
+    for i in range(0, len(vectors), batch):
+        client.upsert(
+            collection_name=name,
+            points=[
+                qm.PointStruct(id=i + j, vector=vec.tolist(), payload={})
+                for j, vec in enumerate(vectors[i:i + batch])
+            ],
+            wait=False,
+        )
+    _wait_indexed(client, name, index_timeout)
+    return time.time() - t0
+
+
+def _run_queries(client: QdrantClient, name: str, queries: np.ndarray, k: int, params) -> tuple[list, list]:
+    ids, lat = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        res = client.search(collection_name=name, query_vector=q.tolist(), limit=k, search_params=params)
+        lat.append((time.perf_counter() - t0) * 1000)
+        ids.append([r.id for r in res])
+    return ids, lat
+
+
+def _pct(values: List[float], p: float) -> float:
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--source", choices=["random", "collection"], default="random")
+    ap.add_argument("--n", type=int, default=20000, help="向量數")
+    ap.add_argument("--dim", type=int, default=QDRANT_VECTOR_SIZE)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--ef", type=int, default=0, help="搜尋 hnsw_ef（0 = Qdrant 預設）")
+    ap.add_argument("--profiles", default=",".join(PROFILES), help="逗號分隔")
+    ap.add_argument("--json", dest="json_out", default=None, help="把結果另存成 JSON")
+    ap.add_argument("--keep", action="store_true", help="保留 bench_* collections")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--index-timeout", type=float, default=600, help="等索引建完的秒數，逾時就失敗")
+    args = ap.parse_args()
+
+    client = QdrantClient(url=QDRANT_URL, timeout=120)
+    vectors = _load_vectors(client, args.source, args.n, args.dim, args.seed)
+    n, dim = vectors.shape
+    rng = np.random.default_rng(args.seed + 1)
+    queries = vectors[rng.choice(n, size=min(args.queries, n), replace=False)]
+    queries = queries + rng.normal(0, 0.01, queries.shape).astype(np.float32)
+
+    run_id = uuid.uuid4().hex[:6]
+    baseline = f"bench_{run_id}_baseline"
+    print(f"[bench] n={n} dim={dim} queries={len(queries)} k={args.k} source={args.source}")
+    _upload(client, baseline, vectors, PROFILES["float"], args.index_timeout)
+    truth, _ = _run_queries(client, baseline, queries, args.k, search_params(PROFILES["float"], exact=True))
+
+    results = []
+    created = [baseline]
+    try:
+        for name in [p.strip() for p in args.profiles.split(",") if p.strip()]:
+            profile = {**PROFILES[name], "hnsw_ef": args.ef}
+            coll = f"bench_{run_id}_{name}"
+            created.append(coll)
+            build_sec = _upload(client, coll, vectors, profile, args.index_timeout)
+            _run_queries(client, coll, queries[:20], args.k, search_params(profile))  # warmup
+            got, lat = _run_queries(client, coll, queries, args.k, search_params(profile))
+            recall = statistics.mean(len(set(g) & set(t)) / args.k for g, t in zip(got, truth))
+            results.append({
+                "profile": name,
+                f"recall@{args.k}": round(recall, 4),
+                "p50_ms": round(_pct(lat, 50), 2),
+                "p95_ms": round(_pct(lat, 95), 2),
+                "est_ram_mb": round(_estimate_ram_mb(profile, n, dim), 1),
+                "build_sec": round(build_sec, 1),
+            })
+            print(f"[bench] {name}: {results[-1]}")
+    finally:
+        if not args.keep:
+            for coll in created:
+                client.delete_collection(coll)
+
+    float_ram = next((r["est_ram_mb"] for r in results if r["profile"] == "float"), None)
+    print()
+    print(f"{'profile':<18}{'recall@' + str(args.k):>10}{'p50 ms':>9}{'p95 ms':>9}{'est RAM MB':>12}{'vs float':>10}")
+    for r in results:
+        ratio = f"{r['est_ram_mb'] / float_ram:.2f}x" if float_ram else "-"
+        print(f"{r['profile']:<18}{r[f'recall@{args.k}']:>10.4f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['est_ram_mb']:>12.1f}{ratio:>10}")
+    print("est RAM = 依向量數 / 維度 / 量化方式 / HNSW m 估算，不是量測值；實際用量請對照 Qdrant 節點 RSS")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"n": n, "dim": dim, "k": args.k, "source": args.source, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+把已索引的語料（Qdrant chunk + 中繼資料，可選向量）匯出成分區 Parquet / Arrow（需要 pyarrow）：
+
+    python -m scripts.export_corpus                    # 增量：從上次的 watermark 接著匯出
+    python -m scripts.export_corpus --full --vectors   # 全量 + 向量（重新 embedding / 評估用）
+    python -m scripts.export_corpus --since 2026-10-01 --format arrow --out /data/idp_export
+
+輸出可直接用 DuckDB / pandas / polars 讀：
+    SELECT used_route, count(*) FROM read_parquet('data/export/*/*.parquet', hive_partitioning=1) GROUP BY 1
+"""
+import argparse
+import json
+from datetime import datetime, timezone
+
+from app.services.config import EXPORT_DIR, EXPORT_ROWS_PER_FILE
+from app.services.corpus_export import FORMATS, export_corpus
+
+
+def _since(value: str) -> float:
+    """epoch 秒或 ISO 日期 / 時間（沒帶時區當 UTC）"""
+    try:
+        return float(value)
+    except ValueError:
+        dt = datetime.fromisoformat(value)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--out", default=EXPORT_DIR, help="輸出目錄（watermark 也存在這裡）")
+    ap.add_argument("--full", action="store_true", help="忽略 watermark，全部重新匯出")
+    ap.add_argument("--since", type=_since, default=None, help="從這個時間之後寫入的（epoch 秒或 ISO 日期）")
+    ap.add_argument("--vectors", action="store_true", help="一起匯出向量（vector 欄位）")
+    ap.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    ap.add_argument("--rows-per-file", type=int, default=EXPORT_ROWS_PER_FILE)
+    args = ap.parse_args()
+
+    summary = export_corpus(
+        args.out,
+        full=args.full,
+        since=args.since,
+        with_vectors=args.vectors,
+        fmt=args.format,
+        rows_per_file=args.rows_per_file,
+    )
+    print(json.dumps({**summary, "files": len(summary["files"]), "out_dir": args.out}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+換 embedding 模型 / 維度：把 Qdrant 裡的 chunk 文字重新 embedding 到新 collection，再原子切換 alias（搜尋不中斷）
+
+    python -m scripts.reembed_collection --embed-url http://new-embed:8080/embed
+    python -m scripts.reembed_collection --embed-url http://new-embed:8080/embed --max-rate 300 --drop-old
+    python -m scripts.reembed_collection --resume idp_docs__20261019120000     # 中斷後接著跑
+    python -m scripts.reembed_collection --status
+    python -m scripts.reembed_collection --switch-to idp_docs__v1              # 切回舊 collection / 舊模型
+
+只花 embedding 的時間，不重跑 OCR / VLM；流程與限制見 app/services/reembed.py。
+"""
+import argparse
+import json
+import os
+
+from app.services.config import QDRANT_COLLECTION, REEMBED_BATCH, REEMBED_DIR, REEMBED_MAX_CHUNKS_PER_SEC
+from app.services.embeddings import active_profile
+from app.services.reembed import Migration, load_state, switch_back
+from app.services.vstore_qdrant import aliases
+
+
+def _status() -> None:
+    print(json.dumps({
+        "alias": QDRANT_COLLECTION,
+        "points_to": aliases().get(QDRANT_COLLECTION),
+        "embed_profile": active_profile() or None,
+    }, ensure_ascii=False, indent=2))
+    if os.path.isdir(REEMBED_DIR):
+        for name in sorted(os.listdir(REEMBED_DIR)):
+            if not name.endswith(".json") or name == "active.json":
+                continue
+            st = load_state(name[:-len(".json")]) or {}
+            print(f"  {st.get('target')}: phase={st.get('phase')} copied={st.get('copied')} from={st.get('source')}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--embed-url", help="新的 embedding 服務（跟 EMBED_API_URL 同樣的 /embed 介面）")
+    ap.add_argument("--task-description", default=None, help="新模型的 task_description（預設沿用 EMBED_TASK_DESCRIPTION）")
+    ap.add_argument("--target", default=None, help="新 collection 名稱（預設 {QDRANT_COLLECTION}__<時間>）")
+    ap.add_argument("--batch", type=int, default=REEMBED_BATCH, help="每次 embed / upsert 的 chunk 數")
+    ap.add_argument("--max-rate", type=float, default=REEMBED_MAX_CHUNKS_PER_SEC, help="每秒最多 embed 幾個 chunk（0 = 不限）")
+    ap.add_argument("--drop-old", action="store_true", help="切換後刪掉舊 collection（不能再切回去）")
+    ap.add_argument("--replace-legacy", action="store_true", help="QDRANT_COLLECTION 還是實體 collection 時，允許刪掉它改成 alias")
+    ap.add_argument("--progress-every", type=float, default=10.0, help="進度輸出間隔秒數")
+    ap.add_argument("--resume", metavar="TARGET", help="接續中斷的遷移")
+    ap.add_argument("--status", action="store_true", help="目前 alias / embedding 設定與遷移紀錄")
+    ap.add_argument("--switch-to", metavar="COLLECTION", help="只切換 alias（連同該 collection 的 embedding 設定）")
+    args = ap.parse_args()
+
+    if args.status:
+        _status()
+        return
+    if args.switch_to:
+        previous = switch_back(args.switch_to)
+        print(f"[reembed] alias {QDRANT_COLLECTION}: {previous} → {args.switch_to}")
+        return
+
+    opts = dict(
+        batch_size=args.batch,
+        max_chunks_per_sec=args.max_rate,
+        drop_old=args.drop_old,
+        replace_legacy=args.replace_legacy,
+        progress_every=args.progress_every,
+    )
+    if args.resume:
+        m = Migration.resume(args.resume, **opts)
+    else:
+        if not args.embed_url:
+            ap.error("--embed-url is required")
+        m = Migration(embed_url=args.embed_url, task_description=args.task_description, target=args.target, **opts)
+    summary = m.run()
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    print("[reembed] 記得把 .env 的 EMBED_API_URL / QDRANT_VECTOR_SIZE 改成新模型（profile 檔已讓執行中的服務切過去）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# config.py 在 import 時讀環境變數並建立資料目錄：測試一律用暫存目錄，不碰 ./data
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="idp-test-")
+os.environ.setdefault("JOB_EXECUTOR", "inline")
+os.environ.setdefault("RETENTION_SWEEP_INTERVAL_SEC", "0")
@@ -0,0 +1,137 @@
+import uuid
+
+import pytest
+
+from app import bulk_ingest
+from app.bulk_ingest import EmbedBuffer, Ledger
+from app.services import checkpoints, embeddings, vstore_qdrant
+from app.services.vstore_qdrant import point_id
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return Ledger(str(tmp_path / "ledger.sqlite"))
+
+
+def test_ledger_skip_retry_force(ledger):
+    assert not ledger.should_skip("/a.pdf")
+
+    job_id = ledger.start("/a.pdf", 10)
+    assert not ledger.should_skip("/a.pdf")  # pending：中斷過，接著跑
+    ledger.update("/a.pdf", "done", chunks=3, points=3)
+    assert ledger.should_skip("/a.pdf")
+    assert ledger.should_skip("/a.pdf", retry_failed=True)
+    assert not ledger.should_skip("/a.pdf", force=True)
+
+    ledger.start("/b.pdf", 10)
+    ledger.update("/b.pdf", "failed", error="boom")
+    assert ledger.should_skip("/b.pdf")
+    assert not ledger.should_skip("/b.pdf", retry_failed=True)
+
+    # 重跑沿用同一個 job_id（checkpoint 才接得上），狀態 / 錯誤重設
+    assert ledger.start("/a.pdf", 12) == job_id
+    row = ledger.get("/a.pdf")
+    assert row["status"] == "pending" and row["size"] == 12
+    assert ledger.start("/b.pdf", 10) and ledger.get("/b.pdf")["error"] is None
+    assert ledger.counts() == {"pending": 2}
+
+
+class _FakeClient:
+    def __init__(self):
+        self.points = {}
+
+    def upsert(self, collection_name, points, wait=True):
+        for p in points:
+            self.points[p.id] = p.payload
+
+
+@pytest.fixture
+def fake_store(monkeypatch):
+    client = _FakeClient()
+    fail_on = set()
+
+    def embed(texts):
+        if fail_on & {t.split(":")[0] for t in texts}:
+            raise RuntimeError("embed backend down")
+        return [[0.1, 0.2] for _ in texts]
+
+    monkeypatch.setattr(embeddings, "embed_texts", embed)
+    monkeypatch.setattr(vstore_qdrant, "get_client", lambda: client)
+    return client, fail_on
+
+
+def _extracted_doc(name, n_chunks, dups=()):
+    """模擬 run_job(stop_after="dedup") 留下的 checkpoint"""
+    job_id = uuid.uuid4().hex
+    chunks = [f"{name}:{i}" for i in range(n_chunks)]
+    checkpoints.save(job_id, "extract", {"route": "docling"})
+    checkpoints.save(job_id, "chunking", {
+        "chunks": chunks,
+        "per_chunk_meta": [{"chunk_id": i, "chunk_index": i, "page": 1, "used_route": "docling"} for i in range(n_chunks)],
+        "page_info": None,
+    })
+    checkpoints.save(job_id, "dedup", {
+        "fingerprints": [],
+        "dups": {str(i): {"scope": "document", "kind": "exact", "chunk_id": 0} for i in dups},
+    })
+    return job_id
+
+
+def test_mixed_batches_use_run_job_point_ids(fake_store):
+    client, _ = fake_store
+    a, b = _extracted_doc("a", 3, dups=(2,)), _extracted_doc("b", 4)
+    buf = EmbedBuffer(embed_batch=4, upsert_batch=2)
+    assert buf.add(a, "/in/a.pdf") == [] and buf.add(b, "/in/b.pdf") == []
+
+    ready, failed = buf.flush()
+    assert failed == {} and ready == [a]  # 第一批 a0 a1 b0 b1：a 寫完
+    ready, failed = buf.flush(force=True)
+    assert failed == {} and ready == [b]
+
+    for job_id, unique in ((a, [0, 1]), (b, [0, 1, 2, 3])):
+        # 跟 run_job 單份寫入一樣：point_id(job_id, 文件內 index)，重複 chunk 不寫
+        expected = [point_id(job_id, i) for i in unique]
+        assert checkpoints.load(job_id, "qdrant_upsert") == {"point_ids": expected}
+        for i, pid in zip(unique, expected):
+            payload = client.points[pid]
+            assert payload["job_id"] == job_id and payload["chunk_index"] == i
+    assert len(client.points) == 6
+    for jid in (a, b):
+        checkpoints.clear(jid)
+
+
+def test_failed_batch_marks_only_its_documents(fake_store):
+    _client, fail_on = fake_store
+    a, b, c = _extracted_doc("a", 3), _extracted_doc("b", 2), _extracted_doc("c", 3)
+    fail_on.add("c")
+    buf = EmbedBuffer(embed_batch=4, upsert_batch=8)
+    for jid, name in ((a, "a"), (b, "b"), (c, "c")):
+        buf.add(jid, f"/in/{name}.pdf")
+
+    ready, failed = buf.flush(force=True)
+    # 第一批 a0 a1 a2 b0 成功；第二批 b1 c0 c1 c2 失敗 → 只有 b、c 失敗
+    assert ready == [a]
+    assert set(failed) == {b, c} and "embed backend down" in failed[c]
+    assert checkpoints.load(a, "qdrant_upsert") is not None
+    assert checkpoints.load(b, "qdrant_upsert") is None and checkpoints.load(c, "qdrant_upsert") is None
+    assert buf.items == [] and buf.docs == {}
+    for jid in (a, b, c):
+        checkpoints.clear(jid)
+
+
+def test_document_without_unique_chunks_is_ready_immediately(fake_store):
+    job_id = _extracted_doc("d", 2, dups=(0, 1))
+    buf = EmbedBuffer(embed_batch=4, upsert_batch=8)
+    assert buf.add(job_id, "/in/d.pdf") == [job_id]
+    assert checkpoints.load(job_id, "qdrant_upsert") == {"point_ids": []}
+    checkpoints.clear(job_id)
+
+
+def test_iter_inputs_manifest_relative_paths(tmp_path):
+    (tmp_path / "docs").mkdir()
+    manifest = tmp_path / "files.txt"
+    manifest.write_text('# comment\ndocs/a.pdf\n{"path": "docs/b.png", "route_hint": "ocr"}\n\n', encoding="utf-8")
+    assert list(bulk_ingest.iter_inputs(None, str(manifest))) == [
+        (str(tmp_path / "docs" / "a.pdf"), None),
+        (str(tmp_path / "docs" / "b.png"), "ocr"),
+    ]
@@ -0,0 +1,166 @@
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from app.services import cancel
+from app.services.cancel import (
+    CancelToken, JobCancelled, bind_token, cancellable_post, check_cancelled, current_token,
+)
+
+
+def test_cancel_and_check():
+    tok = CancelToken("j")
+    tok.check()
+    tok.cancel("cancelled")
+    tok.cancel("deadline_exceeded")  # 第一個原因為準
+    with pytest.raises(JobCancelled) as e:
+        tok.check()
+    assert e.value.reason == "cancelled"
+
+
+def test_deadline_exceeded():
+    tok = CancelToken("j", deadline_at=time.time() - 1)
+    assert tok.cancelled and tok.reason == "deadline_exceeded"
+    assert tok.remaining() == 0.0
+
+
+def test_child_follows_parent_but_not_the_other_way():
+    parent = CancelToken("j")
+    child = parent.child()
+    child.cancel()
+    assert not parent.cancelled
+    other = parent.child()
+    parent.cancel("deadline_exceeded")
+    assert other.cancelled and other.reason == "deadline_exceeded"
+
+
+def test_external_cancel_source_is_polled():
+    flag = {"set": False}
+    tok = CancelToken("j", external=lambda: flag["set"])
+    assert not tok.cancelled
+    flag["set"] = True
+    tok._external_checked_at = 0.0
+    assert tok.cancelled
+
+
+def test_clamp_timeout_to_deadline():
+    assert CancelToken("j").clamp_timeout((5, 120)) == (5, 120)
+    tok = CancelToken("j", deadline_at=time.time() + 2)
+    connect, read = tok.clamp_timeout((5, 120))
+    assert connect <= 2 and read <= 2
+    assert tok.clamp_timeout(None) is None
+
+
+def test_run_returns_result_and_propagates_errors():
+    tok = CancelToken("j")
+    assert tok.run(lambda x: x * 2, 21) == 42
+    with pytest.raises(ValueError):
+        tok.run(lambda: (_ for _ in ()).throw(ValueError("boom")))
+
+
+def test_run_stops_waiting_when_cancelled():
+    tok = CancelToken("j")
+    release = threading.Event()
+    threading.Timer(0.1, tok.cancel).start()
+    t0 = time.time()
+    with pytest.raises(JobCancelled):
+        tok.run(release.wait, 10)
+    assert time.time() - t0 < 2
+    release.set()
+
+
+def test_bind_token_scopes_current_token():
+    tok = CancelToken("j")
+    assert current_token() is None
+    with bind_token(tok):
+        assert current_token() is tok
+        check_cancelled()
+        tok.cancel()
+        with pytest.raises(JobCancelled):
+            check_cancelled()
+    assert current_token() is None
+
+
+def test_cancellable_post_clamps_timeout(monkeypatch):
+    seen = []
+    monkeypatch.setattr(requests, "post", lambda url, **kw: seen.append(kw["timeout"]) or "ok")
+    monkeypatch.setattr(requests.Session, "post", lambda self, url, **kw: seen.append(kw["timeout"]) or "ok")
+    assert cancellable_post("http://x", timeout=(5, 120)) == "ok"
+    with bind_token(CancelToken("j", deadline_at=time.time() + 3)):
+        assert cancellable_post("http://x", timeout=(5, 120)) == "ok"
+    assert seen[0] == (5, 120)
+    assert max(seen[1]) <= 3
+
+
+def test_cancellable_sleep_aborts(monkeypatch):
+    tok = CancelToken("j")
+    threading.Timer(0.1, tok.cancel).start()
+    t0 = time.time()
+    with bind_token(tok), pytest.raises(JobCancelled):
+        cancel.cancellable_sleep(10)
+    assert time.time() - t0 < 2
+
+
+def test_on_cancel_runs_callbacks_once():
+    tok = CancelToken("j")
+    calls = []
+    tok.on_cancel(lambda: calls.append("a"))
+    remove = tok.on_cancel(lambda: calls.append("b"))
+    remove()
+    tok.cancel()
+    tok.cancel()
+    assert calls == ["a"]
+    # 已經取消：登記時立刻呼叫
+    tok.on_cancel(lambda: calls.append("c"))
+    assert calls == ["a", "c"]
+
+
+@pytest.fixture
+def silent_server():
+    """收下請求、永遠不回應的 HTTP server；closed 在 client 關掉連線時 set"""
+    srv = socket.socket()
+    srv.bind(("127.0.0.1", 0))
+    srv.listen(1)
+    closed = threading.Event()
+
+    def serve():
+        conn, _ = srv.accept()
+        conn.settimeout(10)
+        try:
+            while conn.recv(4096):
+                pass
+            closed.set()
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.getsockname()[1]}/v1/chat", closed
+    srv.close()
+
+
+def test_cancel_closes_in_flight_connection(silent_server):
+    url, closed = silent_server
+    tok = CancelToken("j")
+    threading.Timer(0.3, tok.cancel).start()
+    t0 = time.time()
+    with bind_token(tok), pytest.raises(JobCancelled):
+        cancellable_post(url, json={"x": 1}, timeout=(5, 60))
+    assert time.time() - t0 < 2
+    # server 那端看到 EOF：連線被拆掉，不是掛到 60 秒的 read timeout
+    assert closed.wait(2)
+
+
+def test_deadline_closes_in_flight_connection(silent_server):
+    url, closed = silent_server
+    tok = CancelToken("j", deadline_at=time.time() + 60)
+    parent_cancel = threading.Timer(0.3, lambda: setattr(tok, "deadline_at", time.time() - 1))
+    parent_cancel.start()
+    with bind_token(tok), pytest.raises(JobCancelled) as e:
+        cancellable_post(url, json={"x": 1}, timeout=(5, 60))
+    assert e.value.reason == "deadline_exceeded"
+    assert closed.wait(2)
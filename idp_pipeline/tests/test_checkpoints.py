@@ -0,0 +1,72 @@
+import os
+import uuid
+
+import pytest
+
+from app.services import checkpoints, jobs
+
+
+@pytest.fixture
+def job_id():
+    jid = uuid.uuid4().hex
+    yield jid
+    checkpoints.clear(jid)
+
+
+def test_no_checkpoint_means_start_from_scratch(job_id):
+    assert checkpoints.completed(job_id) == []
+    assert checkpoints.resume_stage(job_id) is None
+    assert checkpoints.load(job_id, "extract") is None
+
+
+def test_save_load_and_resume_stage(job_id):
+    checkpoints.save(job_id, "extract", {"raw_text": "# Page 1\n你好"})
+    checkpoints.save(job_id, "chunking", {"chunks": ["你好"]})
+    assert checkpoints.load(job_id, "extract") == {"raw_text": "# Page 1\n你好"}
+    assert checkpoints.completed(job_id) == ["extract", "chunking"]
+    assert checkpoints.resume_stage(job_id) == "dedup"
+    assert not any(n.endswith(".tmp") for n in os.listdir(checkpoints.job_dir(job_id)))
+
+
+def test_missing_embedding_checkpoint_counts_as_done_when_later_stage_exists(job_id):
+    for stage in ("extract", "chunking", "dedup", "qdrant_upsert"):
+        checkpoints.save(job_id, stage, {})
+    assert checkpoints.completed(job_id)[-1] == "qdrant_upsert"
+    assert checkpoints.resume_stage(job_id) == "neo4j"
+    checkpoints.save(job_id, "neo4j", {})
+    assert checkpoints.resume_stage(job_id) == "lineage"
+
+
+def test_vectors_roundtrip(job_id):
+    checkpoints.save_vectors(job_id, [[0.5, 1.0], [0.25, -1.0]])
+    assert checkpoints.load_vectors(job_id) == [[0.5, 1.0], [0.25, -1.0]]
+    assert "embedding" in checkpoints.completed(job_id)
+
+
+def test_corrupt_checkpoint_is_ignored(job_id):
+    checkpoints.save(job_id, "extract", {"x": 1})
+    with open(os.path.join(checkpoints.job_dir(job_id), "extract.json"), "w") as f:
+        f.write("{not json")
+    assert checkpoints.load(job_id, "extract") is None
+
+
+def test_retry_job_requeues_failed_job_from_checkpoint(job_id, tmp_path):
+    src = tmp_path / "doc.pdf"
+    src.write_bytes(b"%PDF-1.4")
+    jobs._JOBS[job_id] = {"job_id": job_id, "status": "failed", "error": "boom", "path": str(src)}
+    try:
+        checkpoints.save(job_id, "extract", {})
+        job = jobs.retry_job(job_id)
+        assert job["status"] == "queued" and job["retries"] == 1
+        assert job["resume_from"] == "chunking" and job["last_error"] == "boom"
+
+        with pytest.raises(ValueError):
+            jobs.retry_job(job_id)  # 不是 failed
+        job.update(status="failed", retries=jobs.JOB_MAX_RETRIES)
+        with pytest.raises(ValueError):
+            jobs.retry_job(job_id)  # 超過重試次數
+    finally:
+        jobs._JOBS.pop(job_id, None)
+
+    with pytest.raises(LookupError):
+        jobs.retry_job(uuid.uuid4().hex)
@@ -0,0 +1,68 @@
+import uuid
+
+import pytest
+
+from app.services import dedup, lineage_index
+from app.services.dedup import find_duplicates, normalize, register_fingerprints
+
+_BODY = "本季營收與費用明細如下，所有金額以新台幣千元為單位，資料來源為財務部月結報表。" * 3
+
+
+def _invoice(total: int) -> str:
+    return f"{_BODY}\n品項 A    數量 12    單價 350\n品項 B    數量 3     單價 1200\n合計 {total}"
+
+
+@pytest.fixture
+def no_corpus(monkeypatch):
+    monkeypatch.setattr(dedup, "DEDUP_CROSS_CORPUS", False)
+
+
+def test_page_numbers_are_ignored():
+    assert normalize("Quarterly report\nConfidential\nPage 3") == normalize("Quarterly report\nConfidential\nPage 4 of 10")
+    assert normalize("第 3 頁\n年度報告") == normalize("第 12 頁，共 40 頁\n年度報告")
+    assert normalize("- 3 -\nannual report") == normalize("- 4 -\nannual report")
+    assert normalize("annual report confidential page 7") == "annual report confidential"
+
+
+def test_other_digits_are_kept():
+    assert normalize("合計 1200") != normalize("合計 1300")
+    # 一格一行的表格：結尾的數字旁邊也是數字，不能當頁碼去掉
+    assert normalize("amount\n100\n200") != normalize("amount\n100\n300")
+
+
+def test_number_only_differences_are_not_duplicates(no_corpus):
+    _, dups = find_duplicates([_invoice(4650), _invoice(4700), _invoice(4650)], job_id="doc")
+    assert dups == {2: {"scope": "document", "kind": "exact", "chunk_id": 0}}
+
+
+def test_near_duplicates_still_merge_when_digits_match(no_corpus):
+    a = _invoice(4650)
+    b = a + "。"
+    _, dups = find_duplicates([a, b], job_id="doc")
+    assert dups[1]["kind"] == "near" and dups[1]["chunk_id"] == 0
+
+
+def test_cross_corpus_respects_digits(monkeypatch):
+    monkeypatch.setattr(dedup, "DEDUP_CROSS_CORPUS", True)
+    first = f"job-{uuid.uuid4().hex[:8]}"
+    fps, dups = find_duplicates([_invoice(1111)], job_id=first)
+    assert dups == {}
+    register_fingerprints(first, fps, {0: "point-0"})
+
+    _, dups = find_duplicates([_invoice(1111), _invoice(2222)], job_id=f"job-{uuid.uuid4().hex[:8]}")
+    assert dups[0]["scope"] == "corpus" and dups[0]["qdrant_point_id"] == "point-0"
+    assert 1 not in dups
+
+
+def test_legacy_fingerprints_only_match_digit_free_chunks(monkeypatch):
+    monkeypatch.setattr(dedup, "DEDUP_CROSS_CORPUS", True)
+    legacy_job = f"legacy-{uuid.uuid4().hex[:8]}"
+    texts = [_BODY + " 沒有任何數字的段落", "總計 000 元（舊版會把數字正規化成 0）" + _BODY]
+    fps = [dedup.fingerprint(t) for t in texts]
+    lineage_index.add_fingerprints([
+        (fp["exact_hash"], fp["simhash"], dedup.bands(fp["simhash"]), legacy_job, i, f"legacy-{i}", None)
+        for i, fp in enumerate(fps)
+    ])
+    _, dups = find_duplicates(texts, job_id=f"job-{uuid.uuid4().hex[:8]}")
+    assert dups[0]["qdrant_point_id"] == "legacy-0"
+    assert 1 not in dups
@@ -0,0 +1,96 @@
+import os
+import threading
+import uuid
+
+import pytest
+
+from app.services import job_queue, jobs
+from app.services.cancel import CancelToken
+
+
+@pytest.fixture
+def queue_mode(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_EXECUTOR", "queue")
+
+
+def _record(status: str, **extra) -> dict:
+    rec = {"job_id": uuid.uuid4().hex, "status": status, "stage": status, "updated_at": 1.0, **extra}
+    job_queue.save_job_record(rec)
+    return rec
+
+
+def test_cancel_remote_running_job_only_writes_marker(queue_mode):
+    rec = _record("running", stage="embedding")
+    out = jobs.cancel_job(rec["job_id"])
+    assert out["cancel_requested"] is True
+    assert job_queue.cancel_requested(rec["job_id"])
+    # worker 的紀錄沒有被 API 手上的舊副本蓋掉
+    assert job_queue.load_job_record(rec["job_id"]) == rec
+    job_queue.clear_cancel(rec["job_id"])
+
+
+def test_cancel_queued_job(queue_mode):
+    rec = _record("queued")
+    out = jobs.cancel_job(rec["job_id"])
+    assert out["status"] == "cancelled"
+    assert job_queue.load_job_record(rec["job_id"])["status"] == "cancelled"
+
+
+def test_cancel_local_running_job_cancels_token():
+    job_id = uuid.uuid4().hex
+    tok = CancelToken(job_id)
+    jobs._JOBS[job_id] = {"job_id": job_id, "status": "running"}
+    jobs._TOKENS[job_id] = tok
+    try:
+        out = jobs.cancel_job(job_id)
+        assert tok.cancelled and out["cancel_requested"] is True
+    finally:
+        jobs._TOKENS.pop(job_id, None)
+        jobs._JOBS.pop(job_id, None)
+
+
+def test_cancel_finished_job_is_noop(queue_mode):
+    rec = _record("finished")
+    assert jobs.cancel_job(rec["job_id"])["status"] == "finished"
+    assert not job_queue.cancel_requested(rec["job_id"])
+
+
+def test_cancel_queued_job_leaves_marker_for_worker(queue_mode):
+    rec = _record("queued")
+    jobs.cancel_job(rec["job_id"])
+    assert job_queue.cancel_requested(rec["job_id"])
+    # worker 之後領到：不開跑，標記清掉
+    jobs.run_job(rec["job_id"])
+    assert job_queue.load_job_record(rec["job_id"])["status"] == "cancelled"
+    assert not job_queue.cancel_requested(rec["job_id"])
+
+
+def test_worker_claiming_during_cancel_does_not_run(queue_mode):
+    # API 已寫標記、還沒把 cancelled 存進紀錄時 worker 讀到 queued
+    rec = _record("queued")
+    job_queue.request_cancel(rec["job_id"])
+    jobs.run_job(rec["job_id"])
+    saved = job_queue.load_job_record(rec["job_id"])
+    assert saved["status"] == "cancelled" and saved["error"] == "cancelled"
+    assert not job_queue.cancel_requested(rec["job_id"])
+
+
+def test_concurrent_record_writes_in_one_process():
+    job_id = uuid.uuid4().hex
+    errors = []
+
+    def writer(n):
+        try:
+            for i in range(50):
+                job_queue.save_job_record({"job_id": job_id, "status": "running", "writer": n, "i": i})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert job_queue.load_job_record(job_id)["i"] == 49
+    assert not [n for n in os.listdir(job_queue.RECORDS_DIR) if n.startswith(job_id) and n.endswith(".tmp")]
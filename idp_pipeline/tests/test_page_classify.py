@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from app.services import page_classify
+from scripts.bench_page_classify import legacy, synthetic_pages
+
+_ALPHABET = list(
+    "0123456789 abc\t\n\r\v\f\x1c\x1d\x1e\x1f\x85  　\xa0�\x01\x00\x08\x09"
+    "一中文鿿䷿ꀀ١٢³²０９\U0001d7d8\U0001f600\U00020000𐏿"
+)
+
+
+def _fuzz_texts(rng: random.Random):
+    texts = []
+    for _ in range(rng.randint(1, 6)):
+        if rng.random() < 0.5:
+            texts.append("".join(rng.choice(_ALPHABET) for _ in range(rng.randint(0, 120))))
+        else:
+            cells = _ALPHABET[:14] + ["  ", "   "]
+            rows = ["".join(rng.choice(cells) for _ in range(rng.randint(0, 30))) for _ in range(rng.randint(0, 10))]
+            texts.append(rng.choice(["\n", "\r\n", " ", "\x1c"]).join(rows))
+    return texts
+
+
+def _same(got, ref):
+    return (
+        got["table"] == ref["table"]
+        and got["low_text"] == ref["low_text"]
+        and got["quality"] == pytest.approx(ref["quality"], abs=1e-12)
+    )
+
+
+def test_matches_legacy_on_fuzzed_text():
+    rng = random.Random(1)
+    for _ in range(500):
+        texts = _fuzz_texts(rng)
+        for got, ref, text in zip(page_classify.features_batch(texts), legacy(texts), texts):
+            assert _same(got, ref), repr(text)
+
+
+def test_matches_legacy_on_synthetic_pages():
+    texts = synthetic_pages(300, seed=7)
+    batch = page_classify.features_batch(texts)
+    for i, (got, ref) in enumerate(zip(batch, legacy(texts))):
+        assert _same(got, ref), i
+        assert _same(page_classify.features(texts[i]), ref), i
+
+
+def test_lone_surrogates_do_not_raise():
+    f = page_classify.features_batch(["abc\ud800def", "\udfff"])
+    assert [x["chars"] for x in f] == [7, 1]
+    ok, score = page_classify.ocr_verdict("正常文字\udc80" * 20)
+    assert ok and score > 0.9
+
+
+def test_empty_inputs():
+    assert page_classify.features_batch([]) == []
+    f = page_classify.features(None)
+    assert f["chars"] == 0 and f["quality"] == 0.0 and f["low_text"] and not f["table"]
+
+
+def test_table_detection():
+    rows = [f"item{i}    {i * 137:>6}    {i * 3.5:>8.2f}" for i in range(1, 8)]
+    assert page_classify.features("\n".join(rows))["table"]
+    prose = [f"item{i} costs {i * 137} dollars" for i in range(1, 8)]
+    assert not page_classify.features("\n".join(prose))["table"]
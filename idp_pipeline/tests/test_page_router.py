@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from app.services import page_router
+from app.services.page_router import feature_key, ocr_reject_ratio, predict, record
+
+
+@pytest.fixture(autouse=True)
+def router_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(page_router, "ROUTING_DB_PATH", str(tmp_path / "routing.sqlite"))
+    monkeypatch.setattr(page_router, "_LOCAL", threading.local())
+    monkeypatch.setattr(page_router, "ROUTING_ADAPTIVE", True)
+    monkeypatch.setattr(page_router, "ROUTING_EXPLORE_RATE", 0.0)
+    monkeypatch.setattr(page_router, "ROUTING_MIN_SAMPLES", 10)
+    monkeypatch.setattr(page_router, "ROUTING_VLM_DIRECT_RATIO", 0.8)
+
+
+def _record_pages(key, total, rejected):
+    for i in range(total):
+        rejected_page = i < rejected
+        record(key, ocr_tried=True, ocr_ok=not rejected_page, vlm_called=rejected_page, direct_vlm=False)
+
+
+def test_feature_key_buckets():
+    assert feature_key(None, 0) == "unknown|t0|cunk"
+    assert feature_key({"producer": "canon", "image_coverage": 0.05}, 19) == "canon|t20|c10"
+    assert feature_key({"producer": "canon", "image_coverage": 0.1}, 20) == "canon|t200|c60"
+    assert feature_key({"producer": "canon", "image_coverage": 0.95}, 500) == "canon|tmany|cfull"
+    # producer 只取第一個字、小寫，版本號不會讓桶變碎
+    assert page_router._producer({"producer": "Canon iR-ADV C5535"}) == "canon"
+    assert page_router._producer({"creator": "Microsoft® Word 2016"}) == "microsoft®"
+    assert page_router._producer({}) == "unknown"
+
+
+def test_predict_needs_min_samples():
+    key = "canon|t20|cfull"
+    _record_pages(key, 9, 9)
+    assert ocr_reject_ratio(key) is None
+    assert predict(key) is None
+    _record_pages(key, 1, 1)
+    assert ocr_reject_ratio(key) == 1.0
+    assert predict(key) == "vlm"
+
+
+def test_predict_ratio_threshold():
+    below, at = "a|t0|cfull", "b|t0|cfull"
+    _record_pages(below, 10, 7)
+    _record_pages(at, 10, 8)
+    assert predict(below) is None
+    assert predict(at) == "vlm"
+
+
+def test_direct_vlm_pages_do_not_count_as_ocr_samples():
+    key = "canon|t0|cfull"
+    for _ in range(20):
+        record(key, ocr_tried=False, ocr_ok=False, vlm_called=True, direct_vlm=True)
+    assert ocr_reject_ratio(key) is None
+
+
+def test_unknown_producer_falls_back_to_wildcard_bucket():
+    # 各 producer 樣本都不夠，但同一個密度 / 覆蓋率桶加總起來夠了
+    for producer in ("xerox", "ricoh"):
+        _record_pages(f"{producer}|t20|cfull", 5, 5)
+    assert ocr_reject_ratio("xerox|t20|cfull") == 1.0
+    assert predict("brandnew|t20|cfull") == "vlm"
+    # 桶不同就不會借用
+    assert predict("brandnew|t20|c10") is None
+
+
+def test_full_key_wins_over_wildcard():
+    _record_pages("good|t20|cfull", 10, 0)
+    _record_pages("bad|t20|cfull", 60, 60)
+    # 萬用桶 60/70 被退回（過門檻），但 good 自己的統計夠：以自己的為準
+    assert ocr_reject_ratio("other|t20|cfull") == pytest.approx(60 / 70)
+    assert predict("good|t20|cfull") is None
+    assert predict("bad|t20|cfull") == "vlm"
+
+
+def test_explore_and_disabled_always_try_ocr(monkeypatch):
+    key = "canon|t0|cunk"
+    _record_pages(key, 10, 10)
+    monkeypatch.setattr(page_router, "ROUTING_EXPLORE_RATE", 1.0)
+    assert predict(key) is None
+    monkeypatch.setattr(page_router, "ROUTING_EXPLORE_RATE", 0.0)
+    monkeypatch.setattr(page_router, "ROUTING_ADAPTIVE", False)
+    assert predict(key) is None
+
+
+def test_stats_policy():
+    _record_pages("canon|t0|cfull", 10, 9)
+    rows = {r["feature_key"]: r for r in page_router.stats()}
+    assert rows["canon|t0|cfull"]["policy"] == "vlm"
+    assert rows["canon|t0|cfull"]["double_call_rate"] == 0.9
+    assert rows["*|t0|cfull"]["pages"] == 10
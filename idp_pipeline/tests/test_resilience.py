@@ -0,0 +1,204 @@
+import threading
+import time
+import uuid
+
+import pytest
+import requests
+
+from app.services import resilience
+from app.services.cancel import CancelToken, JobCancelled, bind_token
+from app.services.resilience import CircuitOpenError, get_backend, resilient_post
+
+
+class _Resp:
+    def __init__(self, status_code: int = 200):
+        self.status_code = status_code
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+
+def _backend():
+    return get_backend(f"test-{uuid.uuid4().hex[:8]}")
+
+
+def _half_open(be) -> None:
+    be.breaker.state = "open"
+    be.breaker.opened_at = time.time() - be.breaker.cooldown_sec - 1
+
+
+def test_breaker_opens_after_threshold_and_short_circuits(monkeypatch):
+    be = _backend()
+
+    def fail(url, **kw):
+        raise requests.ConnectionError("down")
+
+    monkeypatch.setattr(resilience, "cancellable_post", fail)
+    for _ in range(be.breaker.failure_threshold):
+        with pytest.raises(requests.ConnectionError):
+            resilient_post(be.name, "http://x", timeout=1, tries=1)
+    assert be.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        resilient_post(be.name, "http://x", timeout=1, tries=1)
+
+
+def test_half_open_allows_single_probe():
+    be = _backend()
+    _half_open(be)
+    assert be.breaker.allow() is True
+    assert be.breaker.allow() is False
+    be.breaker.record_success()
+    assert be.breaker.state == "closed"
+    assert be.breaker.allow() is True
+
+
+def test_probe_aborted_by_cancellation_releases_breaker(monkeypatch):
+    be = _backend()
+    _half_open(be)
+    monkeypatch.setattr(requests, "post", lambda *a, **kw: pytest.fail("cancelled call must not be sent"))
+
+    token = CancelToken("job-1")
+    token.cancel()
+    with bind_token(token), pytest.raises(JobCancelled):
+        resilient_post(be.name, "http://x", timeout=1, tries=1)
+
+    # 取消不算失敗：仍是 half_open，下一個請求可以當試探
+    assert be.breaker.state == "half_open"
+    monkeypatch.setattr(resilience, "cancellable_post", lambda url, **kw: _Resp(200))
+    assert resilient_post(be.name, "http://x", timeout=1, tries=1).status_code == 200
+    assert be.breaker.state == "closed"
+
+
+def test_probe_aborted_by_unexpected_error_counts_as_failure(monkeypatch):
+    be = _backend()
+    _half_open(be)
+
+    def boom(url, **kw):
+        raise ValueError("bad payload")
+
+    monkeypatch.setattr(resilience, "cancellable_post", boom)
+    with pytest.raises(ValueError):
+        resilient_post(be.name, "http://x", timeout=1, tries=1)
+    assert be.breaker.state == "open"
+    assert be.breaker._probe_inflight is False
+
+
+def test_client_errors_do_not_trip_breaker(monkeypatch):
+    be = _backend()
+    monkeypatch.setattr(resilience, "cancellable_post", lambda url, **kw: _Resp(400))
+    for _ in range(be.breaker.failure_threshold + 1):
+        with pytest.raises(requests.HTTPError):
+            resilient_post(be.name, "http://x", timeout=1, tries=1)
+    assert be.breaker.state == "closed"
+
+
+def test_read_timeouts_let_adaptive_timeout_grow_back(monkeypatch):
+    be = _backend()
+    for _ in range(resilience.LATENCY_MIN_SAMPLES):
+        be.latency.add(0.1)
+    clamped = be.read_timeout(120)
+    assert clamped == resilience.ADAPTIVE_TIMEOUT_MIN_SEC
+
+    seen = []
+
+    def slow(url, timeout, **kw):
+        seen.append(timeout)
+        raise requests.ReadTimeout("slow")
+
+    monkeypatch.setattr(resilience, "cancellable_post", slow)
+    monkeypatch.setattr(be.breaker, "failure_threshold", 10_000)
+    for _ in range(resilience.LATENCY_MIN_SAMPLES):
+        with pytest.raises(requests.ReadTimeout):
+            resilient_post(be.name, "http://x", timeout=(5, 120), tries=1)
+    assert seen[0] == (5, clamped)
+    assert be.read_timeout(120) > clamped
+
+
+def test_timeout_not_counted_when_caller_opts_out(monkeypatch):
+    be = _backend()
+    _half_open(be)
+    calls = []
+
+    def slow(url, **kw):
+        calls.append(url)
+        raise requests.ReadTimeout("too big")
+
+    monkeypatch.setattr(resilience, "cancellable_post", slow)
+    with pytest.raises(requests.ReadTimeout):
+        resilient_post(be.name, "http://x", timeout=1, tries=3, base_sleep=0, timeout_is_failure=False)
+    assert len(calls) == 1
+    assert be.breaker.state == "half_open"
+    assert be.breaker.allow() is True
+
+
+def _hedged_backend():
+    be = _backend()
+    be.hedge = True
+    for _ in range(resilience.LATENCY_MIN_SAMPLES):
+        be.latency.add(0.05)
+    return be
+
+
+def _fake_post(calls, plan):
+    """plan：第 N 次呼叫 → (延遲秒數, status)；用 cancellable_sleep 等，取消時記下來"""
+    def post(url, **kw):
+        n = len(calls)
+        sec, status = plan[n]
+        rec = {"n": n, "thread": threading.current_thread().name, "cancelled": False}
+        calls.append(rec)
+        try:
+            resilience.cancellable_sleep(sec) if resilience.current_token() else time.sleep(sec)
+        except JobCancelled:
+            rec["cancelled"] = True
+            raise
+        return _Resp(status)
+
+    return post
+
+
+def test_hedge_runs_primary_in_caller_thread_and_cancels_loser(monkeypatch):
+    be = _hedged_backend()
+    calls = []
+    monkeypatch.setattr(resilience, "cancellable_post", _fake_post(calls, [(5, 200), (0.05, 201)]))
+    t0 = time.time()
+    r = resilience._send(be, "http://x", {"timeout": 10})
+    assert r.status_code == 201 and time.time() - t0 < 2
+    assert calls[0]["thread"] == threading.current_thread().name
+    assert calls[1]["thread"].startswith("hedge")
+    # 主請求輸了：被取消，不是等到自己結束
+    assert calls[0]["cancelled"]
+
+
+def test_fast_primary_does_not_hedge(monkeypatch):
+    be = _hedged_backend()
+    calls = []
+    monkeypatch.setattr(resilience, "cancellable_post", _fake_post(calls, [(0.0, 200)]))
+    assert resilience._send(be, "http://x", {"timeout": 10}).status_code == 200
+    time.sleep(0.1)
+    assert len(calls) == 1
+
+
+def test_primary_win_cancels_hedge(monkeypatch):
+    be = _hedged_backend()
+    calls = []
+    monkeypatch.setattr(resilience, "cancellable_post", _fake_post(calls, [(0.3, 200), (5, 201)]))
+    assert resilience._send(be, "http://x", {"timeout": 10}).status_code == 200
+    deadline = time.time() + 2
+    while not (len(calls) == 2 and calls[1]["cancelled"]) and time.time() < deadline:
+        time.sleep(0.05)
+    assert calls[1]["cancelled"]
+
+
+def test_hedge_follows_parent_cancel(monkeypatch):
+    be = _hedged_backend()
+    calls = []
+    monkeypatch.setattr(resilience, "cancellable_post", _fake_post(calls, [(5, 200), (5, 200)]))
+    tok = CancelToken("j")
+    threading.Timer(0.3, tok.cancel).start()
+    with bind_token(tok), pytest.raises(JobCancelled):
+        resilience._send(be, "http://x", {"timeout": 10})
+    deadline = time.time() + 2
+    while not all(c["cancelled"] for c in calls) and time.time() < deadline:
+        time.sleep(0.05)
+    assert len(calls) == 2 and all(c["cancelled"] for c in calls)
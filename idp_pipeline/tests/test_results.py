@@ -0,0 +1,117 @@
+import gzip
+import json
+import os
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routes import router
+from app.services import results
+from app.services.jobs import LINEAGE_DIR
+
+MARKDOWN = "# Page 1\nfirst page text\n\n# Page 2\nsecond page\n\n"
+
+
+@pytest.fixture
+def job_id():
+    """寫一份 lineage（不含 chunk 全文，模擬已壓縮 / 低記憶體模式）+ markdown"""
+    jid = uuid.uuid4().hex
+    p1 = MARKDOWN.index("first")
+    p2 = MARKDOWN.index("second")
+    payload = {
+        "job_id": jid,
+        "chunks": [
+            {"chunk_id": 0, "page": 1, "start": p1, "end": p1 + len("first page text"), "preview": "first"},
+            {"chunk_id": 1, "page": 2, "start": p2, "end": p2 + len("second page"), "preview": "second",
+             "text": "stored text"},
+        ],
+        "page_info": {"pages": [
+            {"page": 1, "used_route": "docling", "start": p1, "end": p1 + len("first page text")},
+            {"page": 2, "used_route": "vlm", "start": p2, "end": p2 + len("second page")},
+        ]},
+    }
+    with open(os.path.join(LINEAGE_DIR, f"{jid}.json"), "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    results.save_markdown(jid, MARKDOWN)
+    return jid
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router, prefix="/v1")
+    return TestClient(app)
+
+
+def test_parse_fields():
+    assert results.parse_fields(None, results.CHUNK_FIELDS) is None
+    assert results.parse_fields(" page , text ", results.CHUNK_FIELDS) == ["page", "text"]
+    with pytest.raises(ValueError):
+        results.parse_fields("page,nope", results.CHUNK_FIELDS)
+
+
+def test_etag_matches_weak_comparison():
+    assert results.etag_matches('"abc"', 'W/"abc"')
+    assert results.etag_matches('W/"x", W/"abc"', 'W/"abc"')
+    assert results.etag_matches("*", 'W/"abc"')
+    assert not results.etag_matches(None, 'W/"abc"')
+    assert not results.etag_matches('W/"other"', 'W/"abc"')
+
+
+def test_pick_encoding_and_compress(monkeypatch):
+    monkeypatch.setattr(results, "_brotli", lambda: None)
+    assert results.pick_encoding("br, gzip;q=0.5") == "gzip"
+    assert results.pick_encoding("gzip;q=0") is None
+    assert results.pick_encoding(None) is None
+
+    small = b"{}"
+    assert results.compress(small, "gzip") == (small, None)
+    big = b"x" * (results.RESULT_COMPRESS_MIN_BYTES + 1)
+    body, enc = results.compress(big, "gzip")
+    assert enc == "gzip" and gzip.decompress(body) == big
+
+
+def test_chunks_page_slices_text_from_markdown(job_id):
+    page = results.chunks_page(job_id, 0, 1, ["chunk_id", "text"])
+    assert page["total"] == 2 and page["next_offset"] == 1
+    assert page["chunks"] == [{"chunk_id": 0, "text": "first page text"}]
+
+    page = results.chunks_page(job_id, 1, 10, None)
+    assert page["next_offset"] is None
+    assert "text" not in page["chunks"][0]
+    assert results.chunks_page(job_id, 1, 10, ["text"])["chunks"] == [{"text": "stored text"}]
+
+
+def test_pages_page_text(job_id):
+    page = results.pages_page(job_id, 0, 10, ["page", "used_route", "text"])
+    assert [p["text"] for p in page["pages"]] == ["first page text", "second page"]
+
+
+def test_etag_changes_with_params_and_file(job_id):
+    a = results.etag(job_id, "chunks", 0, 10, None)
+    assert a == results.etag(job_id, "chunks", 0, 10, None)
+    assert a != results.etag(job_id, "chunks", 10, 10, None)
+    results.save_markdown(job_id, MARKDOWN + "more\n")
+    assert a != results.etag(job_id, "chunks", 0, 10, None)
+    assert results.etag(uuid.uuid4().hex, "chunks") is None
+
+
+def test_chunks_endpoint_conditional_get(client, job_id):
+    r = client.get(f"/v1/jobs/{job_id}/result/chunks", params={"fields": "chunk_id,page"})
+    assert r.status_code == 200 and r.json()["total"] == 2
+    r2 = client.get(f"/v1/jobs/{job_id}/result/chunks", params={"fields": "chunk_id,page"},
+                    headers={"If-None-Match": r.headers["etag"]})
+    assert r2.status_code == 304
+    assert client.get(f"/v1/jobs/{job_id}/result/chunks", params={"fields": "bogus"}).status_code == 400
+    assert client.get(f"/v1/jobs/{uuid.uuid4().hex}/result/chunks").status_code == 404
+
+
+def test_markdown_endpoint_range(client, job_id):
+    r = client.get(f"/v1/jobs/{job_id}/result/markdown", headers={"Range": "bytes=0-7"})
+    assert r.status_code == 206 and r.text == "# Page 1"
+    full = client.get(f"/v1/jobs/{job_id}/result/markdown")
+    assert full.status_code == 200 and full.text == MARKDOWN
+    assert client.get(f"/v1/jobs/{job_id}/result/markdown",
+                      headers={"If-None-Match": full.headers["etag"]}).status_code == 304
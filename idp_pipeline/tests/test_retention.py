@@ -0,0 +1,69 @@
+import os
+import time
+import uuid
+
+import pytest
+
+from app.services import jobs, retention
+
+_OLD = time.time() - 365 * 86400
+
+
+def _touch(path: str, data: bytes = b"x" * 100, mtime: float = _OLD) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    d = str(tmp_path / "uploads")
+    os.makedirs(d)
+    monkeypatch.setattr(jobs, "UPLOAD_DIR", d)
+    monkeypatch.setattr(jobs, "LINEAGE_DIR", str(tmp_path / "lineage"))
+    os.makedirs(jobs.LINEAGE_DIR)
+    return d
+
+
+def test_non_job_entries_survive_ttl_and_size_cap(upload_dir, monkeypatch):
+    monkeypatch.setattr(retention, "UPLOAD_TTL_SEC", 1.0)
+    monkeypatch.setattr(retention, "UPLOAD_MAX_BYTES", 1)
+    sample_pdf = _touch(os.path.join(upload_dir, "pdf", "sample_table.pdf"))
+    sample_png = _touch(os.path.join(upload_dir, "images", "clear_text.png"))
+    loose = _touch(os.path.join(upload_dir, "notes__keep.txt"))
+    for d in ("pdf", "images"):
+        os.utime(os.path.join(upload_dir, d), (_OLD, _OLD))
+    orphan = _touch(os.path.join(upload_dir, f"{uuid.uuid4().hex}__old.pdf"))
+
+    report = retention.sweep()
+
+    assert os.path.exists(sample_pdf) and os.path.exists(sample_png) and os.path.exists(loose)
+    assert not os.path.exists(orphan)
+    assert report["uploads_deleted"] == 1
+
+
+def test_running_job_upload_is_kept(upload_dir, monkeypatch):
+    monkeypatch.setattr(retention, "UPLOAD_TTL_SEC", 1.0)
+    job_id = uuid.uuid4().hex
+    path = _touch(os.path.join(upload_dir, f"{job_id}__doc.pdf"))
+    monkeypatch.setitem(jobs._JOBS, job_id, {"job_id": job_id, "status": "running", "updated_at": _OLD})
+    retention.sweep()
+    assert os.path.exists(path)
+
+
+def test_finished_job_images_dir_follows_page_images_ttl(upload_dir, monkeypatch):
+    monkeypatch.setattr(retention, "UPLOAD_TTL_SEC", 0.0)
+    monkeypatch.setattr(retention, "PAGE_IMAGES_RETAIN_SEC", 60.0)
+    job_id = uuid.uuid4().hex
+    images = os.path.join(upload_dir, f"{job_id}__doc_images")
+    _touch(os.path.join(images, "page_1.png"))
+    upload = _touch(os.path.join(upload_dir, f"{job_id}__doc.pdf"))
+    monkeypatch.setitem(jobs._JOBS, job_id, {"job_id": job_id, "status": "finished", "updated_at": time.time() - 120})
+
+    report = retention.sweep()
+
+    assert not os.path.exists(images) and report["images_dirs_deleted"] == 1
+    # UPLOAD_TTL_SEC = 0 → 原檔不過期
+    assert os.path.exists(upload)
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from app.services.cancel import CancelToken, JobCancelled, bind_token, cancellable_sleep
+from app.services.speculative import race_ocr_vlm
+
+
+def _accept(text):
+    ok = text.startswith("good")
+    return ok, 0.9 if ok else 0.2
+
+
+def _slow(text, sec, seen=None):
+    def fn(_image):
+        try:
+            cancellable_sleep(sec)
+        except JobCancelled:
+            if seen is not None:
+                seen.set()
+            raise
+        return text
+    return fn
+
+
+def _fail(_image):
+    raise RuntimeError("upstream down")
+
+
+def test_ocr_wins_and_vlm_is_cancelled():
+    vlm_cancelled = threading.Event()
+    out = race_ocr_vlm(b"img", ocr_fn=_slow("good ocr", 0.05), vlm_fn=_slow("vlm", 5, vlm_cancelled), accept=_accept)
+    assert out["used"] == "ocr" and out["text"] == "good ocr"
+    assert out["ocr_ok"] and out["discarded_calls"] == 1 and out["extra_vlm_call"]
+    assert out["sec"] < 2
+    assert vlm_cancelled.wait(2)
+
+
+def test_vlm_wins_and_ocr_is_cancelled():
+    ocr_cancelled = threading.Event()
+    out = race_ocr_vlm(b"img", ocr_fn=_slow("good ocr", 5, ocr_cancelled), vlm_fn=_slow("vlm md", 0.05), accept=_accept)
+    assert out["used"] == "vlm" and out["text"] == "vlm md"
+    assert not out["ocr_done"] and out["discarded_calls"] == 1 and not out["extra_vlm_call"]
+    assert ocr_cancelled.wait(2)
+
+
+def test_rejected_ocr_waits_for_vlm():
+    out = race_ocr_vlm(b"img", ocr_fn=_slow("bad ocr", 0.01), vlm_fn=_slow("vlm md", 0.3), accept=_accept)
+    assert out["used"] == "vlm" and out["ocr_done"] and not out["ocr_ok"]
+    # OCR 已跑完才被丟掉
+    assert out["discarded_calls"] == 1
+
+
+def test_rejected_ocr_used_when_vlm_fails():
+    out = race_ocr_vlm(b"img", ocr_fn=_slow("bad ocr", 0.01), vlm_fn=_fail, accept=_accept)
+    assert out["used"] == "ocr" and out["text"] == "bad ocr"
+
+
+def test_both_failed_reports_no_winner():
+    out = race_ocr_vlm(b"img", ocr_fn=_fail, vlm_fn=_fail, accept=_accept)
+    assert out["used"] is None and out["text"] == ""
+    assert out["discarded_calls"] == 0 and not out["ocr_done"]
+
+
+def test_parent_cancel_aborts_both_branches():
+    parent = CancelToken("j")
+    cancelled = [threading.Event(), threading.Event()]
+    threading.Timer(0.1, parent.cancel).start()
+    t0 = time.time()
+    with bind_token(parent), pytest.raises(JobCancelled):
+        race_ocr_vlm(b"img", ocr_fn=_slow("ocr", 5, cancelled[0]), vlm_fn=_slow("vlm", 5, cancelled[1]), accept=_accept)
+    assert time.time() - t0 < 2
+    assert all(e.wait(2) for e in cancelled)
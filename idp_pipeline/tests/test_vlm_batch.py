@@ -0,0 +1,47 @@
+import requests
+
+from app.services import vlm
+
+
+class _Resp:
+    def __init__(self, content: str):
+        self._content = content
+
+    def json(self):
+        return {"choices": [{"message": {"content": self._content}}]}
+
+
+def test_split_pages_requires_every_marker_once():
+    text = "<<<PAGE 1>>>\n# A\n<<<PAGE 2>>>\n# B"
+    assert vlm.split_pages(text, 2) == ["# A", "# B"]
+    assert vlm.split_pages("<<<PAGE 1>>>\n# A", 2) is None
+    assert vlm.split_pages("<<<PAGE 2>>>\nB\n<<<PAGE 1>>>\nA", 2) is None
+
+
+def test_batch_timeout_falls_back_without_touching_single_page_breaker(monkeypatch):
+    calls = []
+
+    def fake_post(backend, url, *, timeout, timeout_is_failure=True, **kw):
+        calls.append((backend, timeout_is_failure))
+        if backend == "vlm_batch":
+            raise requests.ReadTimeout("batch too slow")
+        return _Resp("single page")
+
+    monkeypatch.setattr(vlm, "resilient_post", fake_post)
+    out = vlm.vlm_extract_markdown_batch([b"png1", b"png2", b"png3"], batch_size=3)
+    assert out == ["single page"] * 3
+    assert calls[0] == ("vlm_batch", False)
+    assert calls[1:] == [("vlm", True)] * 3
+
+
+def test_batching_is_off_by_default(monkeypatch):
+    calls = []
+
+    def fake_post(backend, url, *, timeout, timeout_is_failure=True, **kw):
+        calls.append(backend)
+        return _Resp("single page")
+
+    monkeypatch.setattr(vlm, "resilient_post", fake_post)
+    assert vlm.VLM_BATCH_SIZE == 1
+    assert vlm.vlm_extract_markdown_batch([b"png1", b"png2"]) == ["single page"] * 2
+    assert calls == ["vlm", "vlm"]